@@ -0,0 +1,193 @@
+"""
+Benchmark the output download write path against a local HTTP stand-in server.
+
+The server implements just enough of the data download API (`/api/v0/data/<id>/download/`
+redirecting to a blob URL) to run `OutputDownloader` against it over the loopback interface,
+so the measurements are dominated by the client's read/write path rather than the network.
+
+Both the current write path and the legacy one (fixed 128 KiB `iter_content` chunks, a progress
+update per chunk and no preallocation) are measured, and the speedup is reported.
+
+    python scripts/benchmark_downloads.py --size 1024 --files 2
+    python scripts/benchmark_downloads.py --output result.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Generator, Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, BinaryIO
+
+import requests
+
+from valohai_cli import __version__, output_downloader
+from valohai_cli.output_downloader import OutputDownloader
+from valohai_cli.settings import settings
+from valohai_cli.transfer import Transfer
+
+LEGACY_CHUNK_SIZE = 131072
+SERVER_WRITE_SIZE = 1024 * 1024
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandInServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, content_type: str, length: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        match = re.match(r"^/api/v0/data/([^/]+)/download/$", self.path)
+        if match:
+            body = json.dumps({"url": f"{self.server.base_url}/blobs/{match.group(1)}"}).encode()
+            self._send(200, "application/json", len(body))
+            self.wfile.write(body)
+            return
+        if self.path.startswith("/blobs/"):
+            size = self.server.file_size
+            self._send(200, "application/octet-stream", size)
+            payload = self.server.payload
+            remaining = size
+            while remaining > 0:
+                n = min(remaining, len(payload))
+                self.wfile.write(payload[:n])
+                remaining -= n
+            return
+        self._send(404, "text/plain", 0)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, file_size: int) -> None:
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.file_size = file_size
+        self.payload = memoryview(os.urandom(SERVER_WRITE_SIZE))
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+
+class LegacyOutputDownloader(OutputDownloader):
+    """
+    The write path as it was before preallocation, adaptive chunk sizes and batched progress updates.
+    """
+
+    def _write_response(
+        self,
+        resp: requests.Response,
+        outf: BinaryIO,
+        transfer: Transfer,
+        size: int | None,  # noqa: ARG002
+    ) -> Iterator[int]:
+        for chunk in resp.iter_content(chunk_size=LEGACY_CHUNK_SIZE):
+            outf.write(chunk)
+            transfer.update(len(chunk))
+            yield len(chunk)
+
+
+def _skip_preallocate(*args: Any) -> bool:  # noqa: ARG001
+    return False
+
+
+@contextlib.contextmanager
+def _no_preallocation() -> Generator[None, None, None]:
+    original = output_downloader.preallocate
+    output_downloader.preallocate = _skip_preallocate
+    try:
+        yield
+    finally:
+        output_downloader.preallocate = original
+
+
+def run_mode(mode: str, *, n_files: int, file_size: int, jobs: int, repeat: int) -> dict[str, Any]:
+    downloader_class = LegacyOutputDownloader if mode == "legacy" else OutputDownloader
+    outputs = [{"id": f"datum-{i}", "name": f"blob-{i}.bin", "size": file_size} for i in range(n_files)]
+    best_time = float("inf")
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="vh-bench-download-") as tmpdir:
+            downloader = downloader_class(tmpdir, jobs=jobs)
+            maybe_no_preallocation = _no_preallocation() if mode == "legacy" else contextlib.nullcontext()
+            # The progress bar goes to stderr, so stdout only has the results.
+            with maybe_no_preallocation, contextlib.redirect_stdout(sys.stderr):
+                start = time.perf_counter()
+                result = downloader.download(outputs)
+                best_time = min(best_time, time.perf_counter() - start)
+            if result.failed:
+                raise RuntimeError(f"Downloads failed: {result.failed}")
+    total_bytes = n_files * file_size
+    return {
+        "seconds": best_time,
+        "mb_per_second": total_bytes / best_time / 1_000_000,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=512, help="Size of each file, in MiB")
+    ap.add_argument("--files", type=int, default=2, help="Number of files")
+    ap.add_argument("--jobs", type=int, default=1, help="Number of parallel downloads")
+    ap.add_argument("--repeat", type=int, default=3, help="Number of repetitions; the best time is reported")
+    ap.add_argument("--output", "-o", help="Write the JSON result into this file instead of stdout")
+    args = ap.parse_args()
+
+    file_size = args.size * 1024 * 1024
+    server = StandInServer(file_size)
+    server_thread = threading.Thread(target=server.serve_forever, name="stand-in-server", daemon=True)
+    server_thread.start()
+    settings.overrides.update(host=server.base_url, token="benchmark")
+    result: dict[str, Any] = {
+        "valohai_cli_version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "files": args.files,
+        "file_size": file_size,
+        "jobs": args.jobs,
+        "modes": {},
+    }
+    try:
+        for mode in ("legacy", "current"):
+            print(f"Running {mode}...", file=sys.stderr)
+            result["modes"][mode] = run_mode(
+                mode,
+                n_files=args.files,
+                file_size=file_size,
+                jobs=args.jobs,
+                repeat=args.repeat,
+            )
+    finally:
+        server.shutdown()
+    result["speedup"] = result["modes"]["legacy"]["seconds"] / result["modes"]["current"]["seconds"]
+
+    if args.output:
+        with open(args.output, "w") as outf:
+            json.dump(result, outf, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    for mode, mode_result in result["modes"].items():
+        print(f"{mode:8} {mode_result['mb_per_second']:9.1f} MB/s", file=sys.stderr)
+    print(f"Speedup: {result['speedup']:.2f}x", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Benchmark the ad-hoc packaging pipeline on synthetic source trees.
+
+Each scenario generates a tree into a temporary directory, then measures
+`get_files_for_package`, `validate_package_size`, `package_files_into` and `get_fp_sha256` on it
+in a fresh process (so the peak RSS reported is that of the scenario alone).
+
+Results are written as JSON; a previous result file can be given with `--compare`
+to report (and fail on) regressions, e.g. between releases.
+
+    python scripts/benchmark_packager.py --output result.json
+    python scripts/benchmark_packager.py --compare result.json --max-slowdown 1.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore[assignment]
+
+from valohai_cli import __version__, packager
+from valohai_cli.packager import get_files_for_package, package_files_into, validate_package_size
+from valohai_cli.utils.hashing import get_fp_sha256
+
+WORDS = b"train model epoch batch loss accuracy tensor layer import def return class self data".split()
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    description: str
+    generate: Callable[[str, random.Random, float], None]
+
+
+def _make_content(rng: random.Random, size: int) -> bytes:
+    """
+    Generate `size` bytes of content that's roughly as compressible as source code with some binary data.
+    """
+    if rng.random() < 0.2:
+        return rng.randbytes(size)
+    words = rng.choices(WORDS, k=size // 5 + 1)
+    return b" ".join(words)[:size]
+
+
+def _write_file(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+def _write_large_file(path: str, rng: random.Random, size: int) -> None:
+    block = _make_content(rng, 1024 * 1024)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        remaining = size
+        while remaining > 0:
+            # Vary each block a little, so the file doesn't compress into nothing.
+            chunk = (rng.randbytes(64) + block[64:])[:remaining]
+            fp.write(chunk)
+            remaining -= len(chunk)
+
+
+def generate_many_small(root: str, rng: random.Random, scale: float) -> None:
+    for i in range(int(8000 * scale)):
+        path = os.path.join(root, f"pkg{i % 80}", f"module_{i}.py")
+        _write_file(path, _make_content(rng, rng.randint(200, 4000)))
+
+
+def generate_few_huge(root: str, rng: random.Random, scale: float) -> None:
+    for i in range(3):
+        _write_large_file(os.path.join(root, "data", f"blob_{i}.bin"), rng, int(96 * 1024 * 1024 * scale))
+    _write_file(os.path.join(root, "train.py"), _make_content(rng, 2000))
+
+
+def generate_deep_nesting(root: str, rng: random.Random, scale: float) -> None:
+    for i in range(int(3000 * scale)):
+        depth = rng.randint(5, 40)
+        parts = [f"d{rng.randint(0, 3)}" for _ in range(depth)]
+        _write_file(os.path.join(root, *parts, f"file_{i}.txt"), _make_content(rng, rng.randint(100, 2000)))
+
+
+def generate_heavy_vhignore(root: str, rng: random.Random, scale: float) -> None:
+    rules: list[str] = []
+    for i in range(100):
+        rules.extend((f"*.tmp{i}", f"build{i}/", f"/cache{i}", f"logs/**/run{i}.log", f"!keep{i}.tmp{i}"))
+    _write_file(os.path.join(root, ".vhignore"), "\n".join(rules).encode())
+    for i in range(int(9000 * scale)):
+        n = i % 100
+        name = rng.choice((f"file_{i}.py", f"file_{i}.tmp{n}", f"keep{n}.tmp{n}"))
+        directory = rng.choice((f"src{n % 10}", f"build{n}", f"cache{n}", f"logs/day{n % 7}"))
+        _write_file(os.path.join(root, directory, name), _make_content(rng, rng.randint(100, 1000)))
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("many_small", "thousands of small files", generate_many_small),
+        Scenario("few_huge", "a few very large files", generate_few_huge),
+        Scenario("deep_nesting", "files in deeply nested directories", generate_deep_nesting),
+        Scenario("heavy_vhignore", "hundreds of .vhignore rules", generate_heavy_vhignore),
+    )
+}
+
+
+def get_peak_rss() -> int | None:
+    if resource is None:  # pragma: no cover
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _get_step_result(seconds: float, n_files: int, n_bytes: int) -> dict[str, float]:
+    return {
+        "seconds": seconds,
+        "files_per_second": n_files / seconds if seconds else 0.0,
+        "mb_per_second": n_bytes / seconds / 1_000_000 if seconds else 0.0,
+    }
+
+
+def _measure(func: Callable[[], Any], repeat: int) -> tuple[float, Any]:
+    best_time = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best_time = min(best_time, time.perf_counter() - start)
+    return best_time, result
+
+
+def _lift_package_limits() -> None:
+    """
+    Lift the packager's hard limits on file count and package size, so `--scale` can make trees
+    as large as needed; the limits protect uploads, not the steps measured here.
+    """
+    packager.FILE_COUNT_HARD_THRESHOLD = sys.maxsize
+    packager.UNCOMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD = sys.maxsize
+
+
+def run_scenario(name: str, scale: float, repeat: int, seed: int) -> dict[str, Any]:
+    scenario = SCENARIOS[name]
+    _lift_package_limits()  # Runs in the scenario's own process
+    with tempfile.TemporaryDirectory(prefix=f"vh-bench-{name}-") as tmpdir:
+        source_dir = os.path.join(tmpdir, "src")
+        os.makedirs(source_dir)
+        scenario.generate(source_dir, random.Random(seed), scale)
+
+        list_time, file_stats = _measure(lambda: get_files_for_package(source_dir, allow_git=False), repeat)
+        n_files = len(file_stats)
+        n_bytes = sum(pfi.stat.st_size for pfi in file_stats.values())
+        steps = {"get_files_for_package": _get_step_result(list_time, n_files, n_bytes)}
+
+        validate_time, _ = _measure(lambda: validate_package_size(file_stats), repeat)
+        steps["validate_package_size"] = _get_step_result(validate_time, n_files, n_bytes)
+
+        package_path = os.path.join(tmpdir, "package.tgz")
+
+        def package() -> None:
+            with open(package_path, "wb") as fp:
+                package_files_into(fp, file_stats)
+
+        package_time, _ = _measure(package, repeat)
+        steps["package_files_into"] = _get_step_result(package_time, n_files, n_bytes)
+        output_size = os.stat(package_path).st_size
+
+        def checksum() -> str:
+            with open(package_path, "rb") as fp:
+                return get_fp_sha256(fp)
+
+        checksum_time, _ = _measure(checksum, repeat)
+        steps["get_fp_sha256"] = _get_step_result(checksum_time, 1, output_size)
+
+    return {
+        "description": scenario.description,
+        "files": n_files,
+        "input_bytes": n_bytes,
+        "output_bytes": output_size,
+        "peak_rss_bytes": get_peak_rss(),
+        "steps": steps,
+    }
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any], max_slowdown: float) -> list[str]:
+    """
+    Print a comparison of `result` against `baseline` and return descriptions of regressions.
+    """
+    regressions = []
+    for name, scenario_result in result["scenarios"].items():
+        baseline_steps = baseline.get("scenarios", {}).get(name, {}).get("steps", {})
+        for step, step_result in scenario_result["steps"].items():
+            baseline_step = baseline_steps.get(step)
+            if not baseline_step or not baseline_step["seconds"]:
+                continue
+            ratio = step_result["seconds"] / baseline_step["seconds"]
+            line = f"{name:16} {step:24} {baseline_step['seconds']:9.3f}s -> {step_result['seconds']:9.3f}s ({ratio:5.2f}x)"
+            print(line, file=sys.stderr)
+            if ratio > max_slowdown:
+                regressions.append(line)
+    return regressions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument(
+        "--scenario",
+        dest="scenarios",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run (may be repeated; default: all)",
+    )
+    ap.add_argument("--scale", type=float, default=1.0, help="Multiplier for the file counts and sizes")
+    ap.add_argument("--repeat", type=int, default=3, help="Number of repetitions; the best time is reported")
+    ap.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic trees")
+    ap.add_argument("--output", "-o", help="Write the JSON result into this file instead of stdout")
+    ap.add_argument("--compare", metavar="BASELINE", help="Compare the result to an earlier JSON result")
+    ap.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="With --compare, exit with an error if any step is this many times slower than the baseline",
+    )
+    args = ap.parse_args()
+
+    result: dict[str, Any] = {
+        "valohai_cli_version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "scenarios": {},
+    }
+    # Each scenario runs in a fresh process, so peak RSS measurements don't leak between them.
+    mp_context = multiprocessing.get_context("spawn")
+    for name in args.scenarios or SCENARIOS:
+        print(f"Running {name}...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+            future = executor.submit(run_scenario, name, args.scale, args.repeat, args.seed)
+            result["scenarios"][name] = future.result()
+
+    if args.output:
+        with open(args.output, "w") as outf:
+            json.dump(result, outf, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as inf:
+            baseline = json.load(inf)
+        regressions = compare(result, baseline, args.max_slowdown)
+        if regressions:
+            print(f"{len(regressions)} steps regressed by more than {args.max_slowdown}x", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
+import io
 import os
 import subprocess
+import tarfile
 
 import pytest
 import yaml
 
 from tests.commands.run_test_utils import ALTERNATIVE_YAML, RunTestSetup
 from tests.fixtures.config import CONFIG_YAML
+from valohai_cli import adhoc, resumable_upload
 from valohai_cli.commands.execution.run import run
 from valohai_cli.ctx import get_project
+from valohai_cli.transfer import get_transfer_scheduler
 
 adhoc_mark = pytest.mark.parametrize("adhoc", (False, True), ids=("regular", "adhoc"))
 
@@ -303,3 +307,104 @@ def test_implicit_priority(run_test_setup, has_flag):
         assert payload["priority"] == 1
     else:
         assert "priority" not in payload
+
+
+def test_adhoc_stream_upload(logged_in_and_linked, monkeypatch):
+    monkeypatch.setenv("VALOHAI_STREAM_ADHOC_UPLOAD", "1")
+    rts = RunTestSetup(monkeypatch=monkeypatch, adhoc=True)
+    output = rts.run()
+    assert "Packaging and uploading" in output
+    body = rts.run_api_mock.last_commit_upload_body
+    assert b'name="yaml_path"\r\n\r\nvalohai.yaml\r\n' in body
+    tarball_data = body.split(b"Content-Type: application/gzip\r\n\r\n", 1)[1].rsplit(b"\r\n--", 1)[0]
+    with tarfile.open(fileobj=io.BytesIO(tarball_data), mode="r:gz") as tarball:
+        assert "valohai.yaml" in tarball.getnames()
+    # The package went through the transfer scheduler, and its checksum matched the commit identifier
+    assert get_transfer_scheduler().completed[-1].bytes == len(tarball_data)
+    assert "does not match" not in output
+
+
+def test_adhoc_stream_upload_checksum_mismatch(logged_in_and_linked, monkeypatch):
+    monkeypatch.setenv("VALOHAI_STREAM_ADHOC_UPLOAD", "1")
+    rts = RunTestSetup(monkeypatch=monkeypatch, adhoc=True)
+    create_commit = rts.run_api_mock._create_commit
+    monkeypatch.setattr(rts.run_api_mock, "_create_commit", lambda sha256: create_commit("0" * 64))
+    output = rts.run()
+    assert "does not match the ad-hoc commit identifier" in output
+
+
+@pytest.mark.parametrize("server_supports_zstd", (False, True))
+def test_adhoc_zstd_negotiation(logged_in_and_linked, monkeypatch, server_supports_zstd):
+    zstandard = pytest.importorskip("zstandard")
+    monkeypatch.setenv("VALOHAI_STREAM_ADHOC_UPLOAD", "1")
+    monkeypatch.setenv("VALOHAI_PACKAGE_COMPRESSION", "zstd")
+    rts = RunTestSetup(monkeypatch=monkeypatch, adhoc=True)
+    rts.run_api_mock.options(
+        f"https://app.valohai.com/api/v0/projects/{rts.project_id}/import-package/",
+        json={"package_compressions": ["gzip", "zstd"] if server_supports_zstd else ["gzip"]},
+    )
+    rts.run()
+    body = rts.run_api_mock.last_commit_upload_body
+    if not server_supports_zstd:
+        assert b'filename="data.tgz"' in body
+        return
+    assert b'filename="data.tar.zst"' in body
+    tarball_data = body.split(b"Content-Type: application/zstd\r\n\r\n", 1)[1].rsplit(b"\r\n--", 1)[0]
+    tar_data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(tarball_data)).read()
+    with tarfile.open(fileobj=io.BytesIO(tar_data), mode="r:") as tarball:
+        assert "valohai.yaml" in tarball.getnames()
+
+
+def test_adhoc_resumable_upload(logged_in_and_linked, monkeypatch):
+    monkeypatch.setenv("VALOHAI_RESUMABLE_ADHOC_UPLOAD", "1")
+    monkeypatch.setattr(adhoc, "RESUMABLE_UPLOAD_SIZE_THRESHOLD", 0)
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_CHUNK_SIZE", 1024)
+    monkeypatch.setattr(resumable_upload, "CHUNK_RETRY_DELAY", 0)
+    with open(os.path.join(get_project().directory, "data.bin"), "wb") as fp:
+        fp.write(os.urandom(10_000))  # Incompressible, so the package spans several chunks
+    rts = RunTestSetup(monkeypatch=monkeypatch, adhoc=True)
+    api_mock = rts.run_api_mock
+
+    # The connection drops after two chunks, and stays down for all retries...
+    api_mock.interrupt_upload_after_chunks = 2
+    output = rts.run(catch_exceptions=True, verify_adhoc=False)
+    assert "run the command again to resume" in output
+    assert api_mock.last_commit_upload_body is None
+
+    # ... so the next run resumes the upload from the third chunk.
+    api_mock.interrupt_upload_after_chunks = None
+    output = rts.run()
+    assert "Resuming earlier upload" in output
+    body = api_mock.last_commit_upload_body
+    assert api_mock.upload_chunk_count == -(-len(body) // 1024)  # Each chunk was sent only once
+    assert len(api_mock.upload_sessions) == 1
+    with tarfile.open(fileobj=io.BytesIO(body), mode="r:gz") as tarball:
+        assert "data.bin" in tarball.getnames()
+    assert not os.listdir(resumable_upload.UploadJournal().directory)
+
+
+def test_adhoc_resumable_upload_retries_server_errors(logged_in_and_linked, monkeypatch):
+    monkeypatch.setenv("VALOHAI_RESUMABLE_ADHOC_UPLOAD", "1")
+    monkeypatch.setattr(adhoc, "RESUMABLE_UPLOAD_SIZE_THRESHOLD", 0)
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_CHUNK_SIZE", 1024)
+    monkeypatch.setattr(resumable_upload, "CHUNK_RETRY_DELAY", 0)
+    with open(os.path.join(get_project().directory, "data.bin"), "wb") as fp:
+        fp.write(os.urandom(10_000))
+    rts = RunTestSetup(monkeypatch=monkeypatch, adhoc=True)
+    api_mock = rts.run_api_mock
+    api_mock.upload_chunk_error_statuses = [502, 503]
+    rts.run()
+    body = api_mock.last_commit_upload_body
+    assert api_mock.upload_chunk_count == -(-len(body) // 1024)
+
+
+def test_adhoc_resumable_upload_stalled(logged_in_and_linked, monkeypatch):
+    monkeypatch.setenv("VALOHAI_RESUMABLE_ADHOC_UPLOAD", "1")
+    monkeypatch.setattr(adhoc, "RESUMABLE_UPLOAD_SIZE_THRESHOLD", 0)
+    monkeypatch.setattr(resumable_upload, "CHUNK_RETRY_DELAY", 0)
+    rts = RunTestSetup(monkeypatch=monkeypatch, adhoc=True)
+    api_mock = rts.run_api_mock
+    api_mock.drop_upload_chunks = True  # The server offset never advances
+    output = rts.run(catch_exceptions=True, verify_adhoc=False)
+    assert "The upload is not progressing" in output
+    assert api_mock.last_commit_upload_body is None
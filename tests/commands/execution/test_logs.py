@@ -1,6 +1,13 @@
-from tests.commands.execution.utils import get_execution_data_mock
-from tests.fixtures.data import EXECUTION_DETAIL_DATA
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+
+from tests.commands.execution.utils import API_PREFIX, get_execution_data_mock
+from tests.fixtures.data import EXECUTION_DETAIL_DATA, PROJECT_DATA
+from valohai_cli import log_manager
 from valohai_cli.commands.execution.logs import logs
+from valohai_cli.log_archive import LogArchive
+from valohai_cli.log_manager import LogManager
 
 
 def test_logs(runner, logged_in_and_linked):
@@ -11,3 +18,271 @@ def test_logs(runner, logged_in_and_linked):
         assert "temmie" in output and "oh no" in output
         output = runner.invoke(logs, ["--no-stderr", str(counter)], catch_exceptions=False).output
         assert "temmie" in output and "oh no" not in output
+        # Prefixed counters are single executions too, not ranges
+        for prefixed_counter in (f"={counter}", f"#{counter}"):
+            result = runner.invoke(logs, [prefixed_counter], catch_exceptions=False)
+            assert "temmie" in result.output and not result.output.startswith("#")
+
+
+def _event(second: int, message: str, stream: str = "stdout") -> dict:
+    return {"time": f"2024-01-01T00:00:{second:02d}.000000", "stream": stream, "message": message}
+
+
+def test_log_manager_dedupe(logged_in, monkeypatch):
+    monkeypatch.setattr(log_manager, "MAX_TIE_WINDOW", 3)
+    responses = [
+        [_event(1, "a"), _event(2, "b"), _event(2, "c")],
+        # Overlaps the previous response, with a new event tied with the latest seen time
+        [_event(2, "b"), _event(2, "c"), _event(2, "c", stream="stderr"), _event(3, "d")],
+        [_event(3, "d"), _event(4, "e")],
+        [_event(4, "e")],
+    ]
+    lm = LogManager(EXECUTION_DETAIL_DATA)
+    with get_execution_data_mock() as m:
+        m.get(
+            f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/",
+            [{"json": {"events": events}} for events in responses],
+        )
+        fetched = [[event["message"] for event in lm.fetch_events()["events"]] for _ in responses]
+    assert fetched == [["a", "b", "c"], ["c", "d"], ["e"], []]
+    # Only the events with the latest time are remembered
+    assert lm.last_event_time == _event(4, "e")["time"]
+    assert lm.last_time_events == {("stdout", "e")}
+
+
+def test_log_manager_offset_fetch_keeps_duplicate_looking_events(logged_in):
+    # Repeated lines with the same timestamp, and a line timestamped earlier than the last one
+    all_events = [_event(1, "tick"), _event(1, "tick")]
+    new_events = [_event(1, "tick"), _event(2, "tock"), _event(0, "late")]
+    lm = LogManager(EXECUTION_DETAIL_DATA)
+    with get_execution_data_mock() as m:
+        m.get(
+            f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/",
+            [
+                {"json": {"total": 2, "events": all_events}},
+                {"json": {"total": 5, "events": new_events}},
+            ],
+        )
+        assert lm.fetch_events()["events"] == all_events
+        assert lm.fetch_events()["events"] == new_events
+
+
+def test_log_manager_tie_window_is_bounded(monkeypatch):
+    monkeypatch.setattr(log_manager, "MAX_TIE_WINDOW", 3)
+    lm = LogManager(EXECUTION_DETAIL_DATA)
+    assert all(lm.is_new_event(_event(1, str(i))) for i in range(10))
+    assert len(lm.last_time_events) == 3
+
+
+def test_log_manager_incremental_fetch(logged_in, monkeypatch):
+    monkeypatch.setattr(log_manager, "EVENTS_PAGE_SIZE", 100)
+    all_events = [_event(i // 10, f"line {i}") for i in range(30)]
+    requested_params = []
+
+    def get_events(request, context):
+        params = parse_qs(urlparse(request.url).query)
+        requested_params.append(params)
+        limit = int(params.get("limit", ["100"])[0]) or len(all_events)
+        if "offset" in params:
+            offset = int(params["offset"][0])
+            events = all_events[offset : offset + limit]
+        else:  # The tail
+            events = all_events[-limit:]
+        return {"total": len(all_events), "truncated": len(events) < len(all_events), "events": events}
+
+    lm = LogManager(EXECUTION_DETAIL_DATA)
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/", json=get_events)
+        assert len(lm.fetch_events(limit=20)["events"]) == 20
+        assert lm.fetch_events()["events"] == []
+        # A burst of more events than fit in a page
+        all_events.extend(_event(10 + i // 10, f"burst {i}") for i in range(250))
+        assert lm.fetch_events()["events"] == all_events[30:]
+        assert lm.fetch_events()["events"] == []
+    assert [p.get("offset") for p in requested_params] == [None, ["30"], ["30"], ["130"], ["230"], ["280"]]
+
+
+def test_logs_multiple_executions(runner, logged_in_and_linked, monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    executions = {
+        counter: dict(
+            EXECUTION_DETAIL_DATA,
+            id=f"execution-{counter}",
+            counter=counter,
+            url=f"{API_PREFIX}executions/execution-{counter}/",
+        )
+        for counter in (3, 4, 5)
+    }
+    # Polls after which each execution is complete
+    finished_after = {3: 0, 4: 1, 5: 2}
+    events = {
+        3: [_event(1, "three a"), _event(4, "three b")],
+        4: [_event(2, "four a"), _event(3, "four b")],
+        5: [_event(5, "five a")],
+    }
+    polls = Counter()
+
+    def get_events(counter):
+        def callback(request, context):
+            offset = int(parse_qs(urlparse(request.url).query).get("offset", ["0"])[0])
+            return {"total": len(events[counter]), "events": events[counter][offset:]}
+
+        return callback
+
+    def get_execution(counter):
+        def callback(request, context):
+            polls[counter] += 1
+            # The first request is the lookup by counter; each later one is a poll
+            status = "complete" if polls[counter] > finished_after[counter] else "started"
+            return dict(executions[counter], status=status)
+
+        return callback
+
+    with get_execution_data_mock() as m:
+        project_id = PROJECT_DATA["id"]
+        m.get(f"{API_PREFIX}executions/{project_id}:6/", status_code=404, json={"detail": "Not found"})
+        for counter, execution in executions.items():
+            m.get(f"{API_PREFIX}executions/{project_id}:{counter}/", json=get_execution(counter))
+            m.get(execution["url"], json=get_execution(counter))
+            m.get(
+                f"{execution['url']}events/",
+                json=get_events(counter),
+            )
+        result = runner.invoke(logs, ["3-5", "6", "--stream"], catch_exceptions=False)
+        events_requests = Counter(
+            urlparse(r.url).path.split("/")[-3]
+            for r in m.request_history
+            if urlparse(r.url).path.endswith("/events/")
+        )
+    lines = [line for line in result.output.splitlines() if " 00:00:" in line]
+    assert lines == [
+        "#3 00:00:01.00 three a",
+        "#4 00:00:02.00 four a",
+        "#4 00:00:03.00 four b",
+        "#3 00:00:04.00 three b",
+        "#5 00:00:05.00 five a",
+    ]
+    assert "Executions not found: #6" in result.output
+    assert "All executions have finished" in result.output
+    # Finished executions are not polled any more
+    assert events_requests == {"execution-3": 1, "execution-4": 2, "execution-5": 3}
+
+
+def test_logs_archive(runner, logged_in_and_linked):
+    counter = EXECUTION_DETAIL_DATA["counter"]
+    all_events = [_event(i // 3, f"line {i}") for i in range(150)]
+    events_url = f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/"
+
+    with get_execution_data_mock() as m:
+        m.get(events_url, json={"total": len(all_events), "truncated": False, "events": all_events})
+        output = runner.invoke(logs, ["--all", str(counter)], catch_exceptions=False).output
+        assert "line 149" in output
+        # The execution is complete, so its log is now served from the archive
+        m.reset_mock()
+        output = runner.invoke(logs, [str(counter)], catch_exceptions=False).output
+        assert not [r for r in m.request_history if r.url.startswith(events_url)]
+    assert "line 49" not in output and "line 50" in output and "line 149" in output
+    assert "There are 150 events, but only the last 100 are shown" in output
+
+
+def test_log_manager_archive_running_execution(logged_in):
+    all_events = [_event(i, f"line {i}") for i in range(10)]
+    archive = LogArchive()
+    running_execution = dict(EXECUTION_DETAIL_DATA, status="started")
+
+    def get_events(request, context):
+        offset = int(parse_qs(urlparse(request.url).query).get("offset", ["0"])[0])
+        return {"total": len(all_events), "truncated": False, "events": all_events[offset:]}
+
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/", json=get_events)
+        LogManager(running_execution, archive=archive).fetch_events(limit=0)
+        assert not archive.read(EXECUTION_DETAIL_DATA["id"]).complete
+        all_events.extend(_event(10 + i, f"more {i}") for i in range(5))
+        # Only the events after the archived ones are fetched
+        events = LogManager(EXECUTION_DETAIL_DATA, archive=archive).fetch_events(limit=0)["events"]
+        assert parse_qs(urlparse(m.last_request.url).query)["offset"] == ["10"]
+    assert events == all_events
+    archived = archive.read(EXECUTION_DETAIL_DATA["id"])
+    assert archived.complete
+    assert archived.events == all_events
+
+
+def test_logs_grep(runner, logged_in_and_linked):
+    executions = [
+        dict(
+            EXECUTION_DETAIL_DATA,
+            id=f"execution-{counter}",
+            counter=counter,
+            url=f"{API_PREFIX}executions/execution-{counter}/",
+        )
+        for counter in (7, 8, 9)
+    ]
+    events = {
+        7: [_event(1, "epoch 1"), _event(2, "RuntimeError: CUDA out of memory", stream="stderr")],
+        8: [_event(1, "epoch 1"), _event(2, "done")],
+        9: [_event(1, "cuda OUT OF MEMORY?"), _event(2, "cuda out of memory", stream="stderr")],
+    }
+
+    with get_execution_data_mock() as m:
+        for execution in executions:
+            m.get(f"{API_PREFIX}executions/{PROJECT_DATA['id']}:{execution['counter']}/", json=execution)
+            m.get(f"{execution['url']}events/", json={"total": 2, "events": events[execution["counter"]]})
+        result = runner.invoke(logs, ["7-9", "--grep", "CUDA out of memory"], catch_exceptions=False)
+        assert result.output.splitlines() == [
+            "#7 00:00:02.00 RuntimeError: CUDA out of memory",
+            "1 matching messages in 1 of 3 executions.",
+        ]
+        # Searching again is served from the log archive
+        m.reset_mock()
+        result = runner.invoke(
+            logs,
+            ["7-9", "--no-stderr", "-i", "-F", "--grep", "out of memory?"],
+            catch_exceptions=False,
+        )
+        assert not [r for r in m.request_history if r.url.endswith("/events/")]
+        assert result.output.splitlines() == [
+            "#9 00:00:01.00 cuda OUT OF MEMORY?",
+            "1 matching messages in 1 of 3 executions.",
+        ]
+        result = runner.invoke(logs, ["7-9", "--grep", "(unclosed"])
+        assert "Invalid value for --grep: missing )" in result.output
+        result = runner.invoke(logs, ["7-9", "--grep", "oops", "--stream"])
+        assert "--grep can not be used with --stream" in result.output
+
+
+def test_log_manager_keeps_pages_fetched_before_an_error(logged_in, monkeypatch):
+    monkeypatch.setattr(log_manager, "EVENTS_PAGE_SIZE", 2)
+    all_events = [_event(i, f"line {i}") for i in range(5)]
+    lm = LogManager(EXECUTION_DETAIL_DATA)
+    lm.offset = 0
+    with get_execution_data_mock() as m:
+        m.get(
+            f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/",
+            [
+                {"json": {"total": 5, "events": all_events[:2]}},
+                {"status_code": 429, "json": {}},
+                {"json": {"total": 5, "events": all_events[2:4]}},
+                {"json": {"total": 5, "events": all_events[4:]}},
+            ],
+        )
+        assert lm.fetch_events()["events"] == all_events[:2]
+        assert lm.fetch_events()["events"] == all_events[2:]
+
+
+def test_logs_archive_errors_are_not_fatal(runner, logged_in_and_linked, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(LogArchive, "append", fail)
+    all_events = [_event(i, f"line {i}") for i in range(5)]
+    with get_execution_data_mock() as m:
+        m.get(
+            f"{API_PREFIX}executions/{EXECUTION_DETAIL_DATA['id']}/events/",
+            json={"total": len(all_events), "truncated": False, "events": all_events},
+        )
+        result = runner.invoke(logs, ["--all", str(EXECUTION_DETAIL_DATA["counter"])], catch_exceptions=False)
+    assert "line 4" in result.output
+    assert (
+        result.output.count("Could not use the local log archive ([Errno 28] No space left on device)") == 1
+    )
@@ -1,10 +1,19 @@
+import gzip
+import hashlib
+import json
 import os
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
 
 import pytest
 
-from tests.commands.execution.utils import get_execution_data_mock
-from tests.fixtures.data import EXECUTION_DETAIL_DATA, OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA
-from valohai_cli.commands.execution.outputs import outputs
+from tests.commands.execution.utils import API_PREFIX, get_execution_data_mock
+from tests.fixtures.data import EXECUTION_DETAIL_DATA, OUTPUT_DATUM_DATA, OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA
+from valohai_cli import output_downloader, output_index, polling
+from valohai_cli.commands.execution.outputs import get_execution_outputs, outputs
+from valohai_cli.output_index import get_datum_mtime
+from valohai_cli.output_store import OutputStore
 
 
 @pytest.mark.parametrize("download", (False, True))
@@ -12,7 +21,7 @@ def test_execution_outputs(runner, logged_in_and_linked, tmpdir, download):
     tmpdir = str(tmpdir)
 
     with get_execution_data_mock() as m:
-        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=b"0" * 100)
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=b"0" * OUTPUT_DATUM_DATA["size"])
         params = [str(EXECUTION_DETAIL_DATA["counter"])]
         if download:
             params.append(f"--download={tmpdir}")
@@ -22,3 +31,342 @@ def test_execution_outputs(runner, logged_in_and_linked, tmpdir, download):
             # See that things were downloaded
             for output in EXECUTION_DETAIL_DATA["outputs"]:
                 assert os.path.exists(os.path.join(tmpdir, output["name"]))
+
+
+def test_execution_outputs_parallel_download(runner, logged_in_and_linked, tmpdir, monkeypatch):
+    monkeypatch.setattr(output_downloader, "DOWNLOAD_RETRY_DELAY", 0)
+    exec_id = EXECUTION_DETAIL_DATA["id"]
+    data = [dict(OUTPUT_DATUM_DATA, id=f"datum-{i}", name=f"shard-{i}.bin", size=100) for i in range(8)]
+
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}data/?output_execution={exec_id}&limit=5000", json={"results": data})
+        for datum in data:
+            url = f"https://example.com/{datum['id']}"
+            m.get(f"{API_PREFIX}data/{datum['id']}/download/", json={"url": url})
+            m.get(url, content=datum["id"].encode().ljust(100))
+        # One file fails once (and is retried), another fails every time
+        m.get("https://example.com/datum-3", [{"status_code": 503}, {"content": b"datum-3".ljust(100)}])
+        m.get("https://example.com/datum-5", status_code=403)
+        args = [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}", "--jobs=3"]
+        result = runner.invoke(outputs, args)
+
+    assert result.exit_code == 1
+    assert "Failed to download shard-5.bin" in result.output
+    assert "1 of 8 outputs could not be downloaded" in result.output
+    for datum in data:
+        path = tmpdir.join(datum["name"])
+        if datum["id"] == "datum-5":
+            continue
+        assert path.read_binary().rstrip() == datum["id"].encode()
+
+
+def _serve_ranges(content: bytes):
+    def callback(request, context):
+        range_header = request.headers.get("Range")
+        if not range_header:
+            return content
+        start = int(range_header.removeprefix("bytes=").rstrip("-"))
+        if start >= len(content):
+            context.status_code = 416
+            return b""
+        context.status_code = 206
+        context.headers["Content-Range"] = f"bytes {start}-{len(content) - 1}/{len(content)}"
+        return content[start:]
+
+    return callback
+
+
+@pytest.mark.parametrize("partial_content", (b"", b"0123", b"0123456789" * 2, b"garbage" * 4))
+def test_execution_outputs_resume_partial_download(runner, logged_in_and_linked, tmpdir, partial_content):
+    content = b"0123456789" * 2
+    datum = dict(OUTPUT_DATUM_DATA, size=len(content))
+    exec_id = EXECUTION_DETAIL_DATA["id"]
+    if partial_content:
+        tmpdir.join(f"{datum['name']}.part").write_binary(partial_content)
+
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}data/?output_execution={exec_id}&limit=5000", json={"results": [datum]})
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=_serve_ranges(content))
+        args = [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}"]
+        runner.invoke(outputs, args, catch_exceptions=False)
+        download_requests = [
+            r for r in m.request_history if r.url == OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"]
+        ]
+    range_headers = [r.headers.get("Range") for r in download_requests]
+
+    assert tmpdir.join(datum["name"]).read_binary() == content
+    assert not tmpdir.join(f"{datum['name']}.part").exists()
+    if partial_content == b"0123":  # Resumed
+        assert range_headers == ["bytes=4-"]
+    elif len(partial_content) == len(content):  # Already complete, just needed to be renamed
+        assert range_headers == []
+    else:  # Started from scratch
+        assert range_headers == [None]
+
+
+def test_execution_outputs_empty_output(runner, logged_in_and_linked, tmpdir):
+    datum = dict(OUTPUT_DATUM_DATA, size=0)
+    exec_id = EXECUTION_DETAIL_DATA["id"]
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}data/?output_execution={exec_id}&limit=5000", json={"results": [datum]})
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=b"")
+        result = runner.invoke(outputs, [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}"])
+    assert result.exit_code == 0, result.output
+    assert "could not be downloaded" not in result.output
+    assert tmpdir.join(datum["name"]).read_binary() == b""
+    assert not tmpdir.join(f"{datum['name']}.part").exists()
+
+
+def test_execution_outputs_size_mismatch(runner, logged_in_and_linked, tmpdir, monkeypatch):
+    monkeypatch.setattr(output_downloader, "DOWNLOAD_RETRY_DELAY", 0)
+    with get_execution_data_mock() as m:
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=b"too short")
+        result = runner.invoke(outputs, [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}"])
+    assert result.exit_code == 1
+    assert "instead of the expected" in result.output
+    assert not tmpdir.join(OUTPUT_DATUM_DATA["name"]).exists()
+
+
+def _get_download_count(m) -> int:
+    return sum(r.url == OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"] for r in m.request_history)
+
+
+def test_execution_outputs_check_size(runner, logged_in_and_linked, tmpdir):
+    content = b"0" * OUTPUT_DATUM_DATA["size"]
+    args = [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}", "--check=size"]
+    path = tmpdir.join(OUTPUT_DATUM_DATA["name"])
+    with get_execution_data_mock() as m:
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=content)
+        runner.invoke(outputs, args, catch_exceptions=False)
+        assert _get_download_count(m) == 1
+        # The file gets the datum's modification time, so it's deemed unchanged...
+        assert path.mtime() == pytest.approx(get_datum_mtime(OUTPUT_DATUM_DATA))
+        runner.invoke(outputs, args, catch_exceptions=False)
+        assert _get_download_count(m) == 1
+        # ... until it's changed.
+        path.write_binary(b"1" * OUTPUT_DATUM_DATA["size"])
+        runner.invoke(outputs, args, catch_exceptions=False)
+        assert _get_download_count(m) == 2
+    assert path.read_binary() == content
+
+
+def test_execution_outputs_check_checksum(runner, logged_in_and_linked, tmpdir, monkeypatch):
+    content = b"0" * OUTPUT_DATUM_DATA["size"]
+    datum = dict(OUTPUT_DATUM_DATA, checksums={"sha256": hashlib.sha256(content).hexdigest()})
+    exec_id = EXECUTION_DETAIL_DATA["id"]
+    args = [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}", "--check=checksum"]
+    path = tmpdir.join(datum["name"])
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}data/?output_execution={exec_id}&limit=5000", json={"results": [datum]})
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=content)
+        runner.invoke(outputs, args, catch_exceptions=False)
+        assert _get_download_count(m) == 1
+        index = json.loads(tmpdir.join(".vh-outputs.json").read_text("utf-8"))
+        assert index["files"][datum["name"]]["checksums"] == datum["checksums"]
+
+        # The checksum verified while downloading is remembered, so the file isn't rehashed
+        with monkeypatch.context() as mp:
+            mp.setattr(output_index, "get_fp_hexdigest", pytest.fail)
+            runner.invoke(outputs, args, catch_exceptions=False)
+        assert _get_download_count(m) == 1
+
+        # A changed file is rehashed and downloaded again
+        path.write_binary(b"1" * datum["size"])
+        runner.invoke(outputs, args, catch_exceptions=False)
+        assert _get_download_count(m) == 2
+    assert path.read_binary() == content
+
+
+def test_execution_outputs_sync(runner, logged_in_and_linked, tmpdir, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    monkeypatch.setattr(polling, "POLL_JITTER", 0)
+    data = [
+        dict(
+            OUTPUT_DATUM_DATA,
+            id=f"datum-{i}",
+            name=f"checkpoint-{i}.bin",
+            size=10,
+            ctime=f"2024-01-01T00:0{i}:00Z",
+        )
+        for i in range(3)
+    ]
+    # What the execution has output by each poll
+    timeline = [data[:1], data[:1], data[:2], data, data]
+    statuses = iter(["started", "started", "started", "started", "complete"])
+    listing_params = []
+
+    def get_execution(request, context):
+        return dict(EXECUTION_DETAIL_DATA, status=next(statuses))
+
+    def list_data(request, context):
+        params = parse_qs(urlparse(request.url).query)
+        listing_params.append(params)
+        since = params.get("ctime__gte", [""])[0]
+        return {"results": [d for d in timeline[len(listing_params) - 1] if d["ctime"] >= since]}
+
+    with get_execution_data_mock() as m:
+        m.get(EXECUTION_DETAIL_DATA["url"], json=get_execution)
+        m.get(f"{API_PREFIX}data/", json=list_data)
+        for datum in data:
+            m.get(
+                f"{API_PREFIX}data/{datum['id']}/download/",
+                json={"url": f"https://example.com/{datum['id']}"},
+            )
+            m.get(f"https://example.com/{datum['id']}", content=b"0" * 10)
+        args = [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}", "--sync"]
+        output = runner.invoke(outputs, args, catch_exceptions=False).output
+        download_counts = Counter(
+            r.url for r in m.request_history if r.url.startswith("https://example.com/")
+        )
+
+    assert "Execution has finished" in output
+    assert download_counts == {f"https://example.com/{datum['id']}": 1 for datum in data}
+    assert len(listing_params) == 5
+    assert "ctime__gte" not in listing_params[0]
+    cursors = [p["ctime__gte"][0] for p in listing_params[1:]]
+    assert cursors == [data[0]["ctime"], data[0]["ctime"], data[1]["ctime"], data[2]["ctime"]]
+    # Backs off when there is nothing new
+    assert sleeps == [1, 2, 1, 1]
+
+
+@pytest.mark.parametrize("grow", (False, True))
+def test_get_execution_outputs_prefetch(logged_in_and_linked, grow):
+    data = [dict(OUTPUT_DATUM_DATA, id=f"datum-{i}", name=f"file-{i}.bin") for i in range(23)]
+    # If `grow` is set, more outputs appear after the first page was listed
+    count = 18 if grow else len(data)
+    offsets = []
+
+    def list_data(request, context):
+        params = parse_qs(urlparse(request.url).query)
+        offset = int(params.get("offset", ["0"])[0])
+        limit = int(params["limit"][0])
+        offsets.append(offset)
+        return {"count": count, "results": data[offset : offset + limit]}
+
+    with get_execution_data_mock() as m:
+        m.get(f"{API_PREFIX}data/", json=list_data)
+        results = list(get_execution_outputs(EXECUTION_DETAIL_DATA, page_size=5, prefetch_pages=2))
+
+    assert [d["id"] for d in results] == [d["id"] for d in data]
+    assert sorted(offsets) == [0, 5, 10, 15, 20]
+
+
+@pytest.mark.parametrize("link_mode", (None, "hardlink", "copy", "off"))
+def test_execution_outputs_reuse_earlier_download(
+    runner,
+    logged_in_and_linked,
+    tmpdir,
+    monkeypatch,
+    link_mode,
+):
+    if link_mode:
+        monkeypatch.setenv("VALOHAI_OUTPUT_LINK_MODE", link_mode)
+    content = b"0" * OUTPUT_DATUM_DATA["size"]
+    counter = str(EXECUTION_DETAIL_DATA["counter"])
+    first_path = tmpdir.join("first", OUTPUT_DATUM_DATA["name"])
+    second_path = tmpdir.join("second", OUTPUT_DATUM_DATA["name"])
+    with get_execution_data_mock() as m:
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=content)
+        runner.invoke(outputs, [counter, f"--download={tmpdir.join('first')}"], catch_exceptions=False)
+        output = runner.invoke(
+            outputs,
+            [counter, f"--download={tmpdir.join('second')}"],
+            catch_exceptions=False,
+        ).output
+        assert _get_download_count(m) == (2 if link_mode == "off" else 1)
+        assert second_path.read_binary() == content
+        assert os.path.samefile(first_path, second_path) == (link_mode == "hardlink")
+        if link_mode != "off":
+            assert "reused from earlier downloads" in output
+
+        # Modified copies aren't reused...
+        first_path.write_binary(b"1" * OUTPUT_DATUM_DATA["size"])
+        runner.invoke(outputs, [counter, f"--download={tmpdir.join('third')}"], catch_exceptions=False)
+        assert tmpdir.join("third", OUTPUT_DATUM_DATA["name"]).read_binary() == content
+        # ... (unless they're hardlinked to the modified one)
+        assert _get_download_count(m) == {None: 1, "hardlink": 2, "copy": 1, "off": 3}[link_mode]
+
+        # --force always downloads
+        runner.invoke(
+            outputs,
+            [counter, f"--download={tmpdir.join('fourth')}", "--force"],
+            catch_exceptions=False,
+        )
+        assert _get_download_count(m) == {None: 2, "hardlink": 3, "copy": 2, "off": 4}[link_mode]
+
+
+def test_output_store_by_checksum(tmpdir):
+    store = OutputStore(directory=str(tmpdir.mkdir("store")), link_mode="hardlink")
+    checksums = {"sha256": hashlib.sha256(b"hello").hexdigest()}
+    datum = dict(OUTPUT_DATUM_DATA, id="datum-1", size=5, checksums=checksums)
+    other_datum = dict(datum, id="datum-2")
+    source = tmpdir.join("a", "hello.txt")
+    source.write_binary(b"hello", ensure=True)
+    store.add(datum, str(source))
+    # Another datum with the same content can be linked from the first one
+    assert store.materialize(other_datum, str(tmpdir.join("b", "hello.txt"))) == "hardlink"
+    assert tmpdir.join("b", "hello.txt").read_binary() == b"hello"
+    # But a datum with other content can't
+    unrelated_datum = dict(datum, id="datum-3", checksums={"sha256": "0" * 64})
+    assert store.materialize(unrelated_datum, str(tmpdir.join("c", "hello.txt"))) is None
+    # By default, copies don't share their contents
+    default_store = OutputStore(directory=store.directory)
+    assert default_store.materialize(other_datum, str(tmpdir.join("d", "hello.txt"))) in ("reflink", "copy")
+    assert not os.path.samefile(str(source), str(tmpdir.join("d", "hello.txt")))
+
+
+def test_output_store_prune(tmpdir):
+    store = OutputStore(directory=str(tmpdir.mkdir("store")), max_records=2)
+    for i in range(3):
+        path = tmpdir.join(f"{i}.txt")
+        path.write_binary(b"x", ensure=True)
+        store.add(dict(OUTPUT_DATUM_DATA, id=f"datum-{i}", checksums={}), str(path))
+        os.utime(os.path.join(store.directory, f"datum-datum-{i}.json"), (i, i))
+    # Records of removed files go first...
+    tmpdir.join("1.txt").remove()
+    assert [entry.key for entry in store.prune()] == ["datum-datum-1"]
+    assert store.prune() == []
+    # ... then the least recently updated ones
+    store.max_records = 1
+    assert [entry.key for entry in store.prune()] == ["datum-datum-0"]
+    assert [entry.key for entry in store.get_entries()] == ["datum-datum-2"]
+
+
+def test_download_chunk_size():
+    assert output_downloader.get_download_chunk_size(None) == output_downloader.MIN_DOWNLOAD_CHUNK_SIZE
+    assert output_downloader.get_download_chunk_size(1000) == output_downloader.MIN_DOWNLOAD_CHUNK_SIZE
+    assert output_downloader.get_download_chunk_size(64 * 1024 * 1024) == 1024 * 1024
+    assert output_downloader.get_download_chunk_size(10**12) == output_downloader.MAX_DOWNLOAD_CHUNK_SIZE
+
+
+def test_execution_outputs_compressed_download(runner, logged_in_and_linked, tmpdir):
+    content = os.urandom(1000) * (OUTPUT_DATUM_DATA["size"] // 1000) + b"0" * (
+        OUTPUT_DATUM_DATA["size"] % 1000
+    )
+    with get_execution_data_mock() as m:
+        # Transfer-compressed responses can't be read into the buffer directly, but are decoded as usual
+        m.get(
+            OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"],
+            content=gzip.compress(content),
+            headers={"Content-Encoding": "gzip"},
+        )
+        runner.invoke(
+            outputs,
+            [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}"],
+            catch_exceptions=False,
+        )
+    assert tmpdir.join(OUTPUT_DATUM_DATA["name"]).read_binary() == content
+
+
+def test_execution_outputs_direct_read(runner, logged_in_and_linked, tmpdir, monkeypatch):
+    monkeypatch.setattr(output_downloader, "DIRECT_READ_THRESHOLD", 0)
+    content = os.urandom(OUTPUT_DATUM_DATA["size"])
+    with get_execution_data_mock() as m:
+        m.get(OUTPUT_DATUM_DOWNLOAD_RESPONSE_DATA["url"], content=content)
+        runner.invoke(
+            outputs,
+            [str(EXECUTION_DETAIL_DATA["counter"]), f"--download={tmpdir}"],
+            catch_exceptions=False,
+        )
+    assert tmpdir.join(OUTPUT_DATUM_DATA["name"]).read_binary() == content
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
 import json
 import re
 from functools import cached_property
+from types import GeneratorType
 from typing import Any
 
+import requests
 import requests_mock
 import yaml
 from click.testing import CliRunner
+from requests_toolbelt import MultipartDecoder
 
 from tests.fixtures.config import CONFIG_YAML, PIPELINE_YAML, YAML_WITH_EXTRACT_TRAIN_EVAL
 from tests.fixtures.data import (
@@ -48,6 +52,16 @@ class RunAPIMock(requests_mock.Mocker):
         self.expected_edge_count = expected_edge_count
         self.last_create_execution_payload = None
         self.last_create_pipeline_payload = None
+        self.last_commit_upload_body = None
+        # State for the resumable upload endpoints;
+        # set `interrupt_upload_after_chunks` to simulate a connection drop,
+        # `upload_chunk_error_statuses` to fail the next chunk requests with those statuses,
+        # and `drop_upload_chunks` to have the server accept chunks without storing them.
+        self.upload_sessions: dict[str, dict[str, Any]] = {}
+        self.upload_chunk_count = 0
+        self.interrupt_upload_after_chunks: int | None = None
+        self.upload_chunk_error_statuses: list[int] = []
+        self.drop_upload_chunks = False
         self.project_id = project_id
         self.commit_id = commit_id
         self.deployment_id = deployment_id
@@ -102,6 +116,15 @@ class RunAPIMock(requests_mock.Mocker):
             f"https://app.valohai.com/api/v0/projects/{project_id}/import-package/",
             json=self.handle_create_commit,
         )
+        upload_url = f"https://app.valohai.com/api/v0/projects/{project_id}/import-package/uploads/"
+        self.post(upload_url, json=self.handle_create_upload_session)
+        upload_session_re = re.compile(f"^{re.escape(upload_url)}(?P<id>[^/]+)/$")
+        self.get(upload_session_re, json=self.handle_upload_session_detail)
+        self.put(upload_session_re, json=self.handle_upload_chunk)
+        self.post(
+            re.compile(f"^{re.escape(upload_url)}(?P<id>[^/]+)/complete/$"),
+            json=self.handle_complete_upload,
+        )
 
     def handle_project(self, request, context):
         return {
@@ -183,7 +206,68 @@ class RunAPIMock(requests_mock.Mocker):
 
     def handle_create_commit(self, request, context):
         assert request.body
-        commit_id = f"~{get_random_string()}"
+        body = request.body
+        if isinstance(body, GeneratorType):  # A streamed (chunked) upload
+            body = b"".join(body)
+        elif hasattr(body, "read"):  # A multipart encoder
+            body = body.read()
+        self.last_commit_upload_body = body
+        # Like the server, derive the identifier from the checksum of the uploaded package
+        parts = MultipartDecoder(body, request.headers["Content-Type"]).parts
+        data = next(part.content for part in parts if b'name="data"' in part.headers[b"Content-Disposition"])
+        return self._create_commit(sha256=hashlib.sha256(data).hexdigest())
+
+    def handle_create_upload_session(self, request, context):
+        body_json = request.json()
+        assert body_json["size"] > 0
+        assert body_json["yaml_path"]
+        upload_id = get_random_string().lower()
+        self.upload_sessions[upload_id] = {**body_json, "data": bytearray()}
+        context.status_code = 201
+        return {"id": upload_id, "offset": 0}
+
+    def _get_upload_session(self, request):
+        upload_id = re.search(r"/import-package/uploads/([^/]+)/", request.path).group(1)
+        return self.upload_sessions.get(upload_id)
+
+    def handle_upload_session_detail(self, request, context):
+        session = self._get_upload_session(request)
+        if not session:
+            context.status_code = 404
+            return {"detail": "Not found"}
+        return {"offset": len(session["data"])}
+
+    def handle_upload_chunk(self, request, context):
+        if (
+            self.interrupt_upload_after_chunks is not None
+            and self.upload_chunk_count >= self.interrupt_upload_after_chunks
+        ):
+            raise requests.ConnectionError("Connection reset by peer")
+        if self.upload_chunk_error_statuses:
+            context.status_code = self.upload_chunk_error_statuses.pop(0)
+            return {"detail": "Server error"}
+        session = self._get_upload_session(request)
+        if self.drop_upload_chunks:
+            return {"offset": len(session["data"])}
+        self.upload_chunk_count += 1
+        content_range = re.match(r"bytes (\d+)-(\d+)/(\d+)", request.headers["Content-Range"])
+        start, end, total = map(int, content_range.groups())
+        assert total == session["size"]
+        assert start == len(session["data"])
+        assert end - start + 1 == len(request.body)
+        session["data"] += request.body
+        return {"offset": len(session["data"])}
+
+    def handle_complete_upload(self, request, context):
+        session = self._get_upload_session(request)
+        data = bytes(session["data"])
+        assert len(data) == session["size"]
+        assert hashlib.sha256(data).hexdigest() == session["sha256"]
+        self.last_commit_upload_body = data
+        return self._create_commit(sha256=session["sha256"])
+
+    def _create_commit(self, sha256: str):
+        commit_id = f"~{sha256}"
         self.commit_id = commit_id  # Only accept the new commit
         return {
             "repository": "8",
@@ -0,0 +1,30 @@
+import valohai_cli.packager as pkg
+from tests.test_packaging import write_temp_files
+from valohai_cli.commands.cache.clear import clear
+from valohai_cli.commands.cache.list import list
+from valohai_cli.output_store import OutputStore
+from valohai_cli.package_cache import PackageCache
+from valohai_cli.resumable_upload import UploadJournal
+
+
+def test_cache_list_and_clear(runner, tmpdir):
+    src_dir = tmpdir.mkdir("src")
+    assert "empty" in runner.invoke(list).output
+    write_temp_files(src_dir)
+    package = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=PackageCache())
+    assert f"~{package.sha256}" in runner.invoke(list).output
+    assert "Removed 1 cached packages" in runner.invoke(clear).output
+    assert not PackageCache().get_entries()
+
+
+def test_cache_clear_outputs_and_uploads(runner, tmpdir):
+    downloaded = tmpdir.join("output.txt")
+    downloaded.write_binary(b"hello")
+    OutputStore().add({"id": "datum-1", "size": 5}, str(downloaded))
+    UploadJournal().put("project-1", "0" * 64, {"upload_id": "upload-1"})
+    output = runner.invoke(clear).output
+    assert "Removed 1 records of downloaded outputs" in output
+    assert "Removed 1 interrupted upload sessions" in output
+    assert not OutputStore().get_entries()
+    assert UploadJournal().get("project-1", "0" * 64) is None
+    assert downloaded.read_binary() == b"hello"
@@ -53,7 +53,9 @@ def runner():
 def isolate_cli(tmpdir, monkeypatch):
     config_dir = str(tmpdir.mkdir("cfg"))
     project_dir = str(tmpdir.mkdir("proj"))
+    cache_dir = str(tmpdir.mkdir("cache"))
     monkeypatch.setenv("VALOHAI_CONFIG_DIR", config_dir)
+    monkeypatch.setenv("VALOHAI_CACHE_DIR", cache_dir)
     monkeypatch.setenv("VALOHAI_PROJECT_DIR", project_dir)
 
 
@@ -0,0 +1,101 @@
+import os
+
+from valohai_cli import log_archive
+from valohai_cli.log_archive import LogArchive
+from valohai_cli.log_index import INDEX_SIZE, get_trigrams
+
+
+def _events(start: int, stop: int) -> list:
+    return [
+        {"time": f"2024-01-01T00:00:{i:02d}.000000", "stream": "stdout", "message": f"line {i}"}
+        for i in range(start, stop)
+    ]
+
+
+def test_log_archive_append_and_read(monkeypatch):
+    monkeypatch.setattr(log_archive, "SEGMENT_MAX_SIZE", 100)
+    archive = LogArchive()
+    assert archive.read("x") is None
+    assert archive.append("x", 0, _events(0, 10))
+    # Appends must continue the archived events
+    assert not archive.append("x", 5, _events(5, 15))
+    assert archive.append("x", 10, _events(10, 20))
+    assert archive.append("x", 20, _events(20, 30), complete=True)
+    # Nothing can be appended to a complete log
+    assert not archive.append("x", 30, _events(30, 31))
+    archived = archive.read("x")
+    assert archived.complete
+    assert archived.events == _events(0, 30)
+    assert archive.get_count("x") == 30
+    assert sorted(os.listdir(os.path.join(archive.directory, "x"))) == [
+        "000000.jsonl.gz",
+        "000001.jsonl.gz",
+        "000002.jsonl.gz",
+        "index.bin",
+        "meta.json",
+    ]
+
+
+def test_log_archive_ignores_interrupted_appends():
+    archive = LogArchive()
+    archive.append("x", 0, _events(0, 10))
+    with open(os.path.join(archive.directory, "x", "000000.jsonl.gz"), "ab") as fp:
+        fp.write(b"garbage from an interrupted append")
+    assert archive.read("x").events == _events(0, 10)
+    archive.append("x", 10, _events(10, 20))
+    assert archive.read("x").events == _events(0, 20)
+
+    # Entries that can't be read are removed
+    with open(os.path.join(archive.directory, "x", "000000.jsonl.gz"), "wb") as fp:
+        fp.write(b"not gzip")
+    assert archive.read("x") is None
+    assert not archive.get_entries()
+
+
+def test_log_archive_lru_eviction():
+    archive = LogArchive(max_size=1)  # Everything but the log being written gets evicted
+    archive.append("x", 0, _events(0, 10), complete=True)
+    archive.append("y", 0, _events(0, 10))
+    assert [entry.execution_id for entry in archive.get_entries()] == ["y"]
+    assert len(archive.clear()) == 1
+    assert not archive.get_entries()
+
+
+def test_log_archive_disabled(monkeypatch):
+    monkeypatch.setenv("VALOHAI_LOG_ARCHIVE_MAX_SIZE", "0")
+    assert log_archive.get_log_archive() is None
+
+
+def test_log_archive_search_skips_segments(monkeypatch):
+    monkeypatch.setattr(log_archive, "SEGMENT_MAX_SIZE", 100)
+    archive = LogArchive()
+    archive.append("x", 0, _events(0, 10))
+    archive.append(
+        "x",
+        10,
+        [{"time": "2024-01-01T00:01:00.000000", "stream": "stderr", "message": "Out of memory"}],
+    )
+    read_segments = []
+    original_read_segment = archive._read_segment
+
+    def read_segment(execution_id, segment):
+        read_segments.append(segment["name"])
+        return original_read_segment(execution_id, segment)
+
+    monkeypatch.setattr(archive, "_read_segment", read_segment)
+    assert [event["message"] for event in archive.search("x", get_trigrams("memory"))] == ["Out of memory"]
+    assert read_segments == ["000001.jsonl.gz"]
+    assert archive.search("x", get_trigrams("segfault")) == []
+    assert read_segments == ["000001.jsonl.gz"]
+
+    # A missing index is rebuilt
+    os.unlink(os.path.join(archive.directory, "x", "index.bin"))
+    assert len(archive.search("x", set())) == 11
+    assert os.path.getsize(os.path.join(archive.directory, "x", "index.bin")) == 2 * INDEX_SIZE
+
+
+def test_log_archive_reports_errors_once(capsys):
+    archive = LogArchive()
+    archive.report_error(OSError("Read-only file system"))
+    archive.report_error(OSError("Read-only file system"))
+    assert capsys.readouterr().err.count("Could not use the local log archive") == 1
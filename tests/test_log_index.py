@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+from valohai_cli.log_index import (
+    INDEX_SIZE,
+    add_to_bitmap,
+    bitmap_contains,
+    get_query_trigrams,
+    get_required_literals,
+)
+
+
+@pytest.mark.parametrize(
+    ("pattern", "literals"),
+    [
+        ("CUDA out of memory", ["CUDA out of memory"]),
+        (r"loss: \d+\.\d+", ["loss: ", "."]),
+        ("colou?r [A-Z]+ value", ["colo", "r ", " value"]),
+        (r"step (\d+|final) done\.", ["step ", " done."]),
+        ("error|warning", []),
+        ("x{2,3}yz", ["yz"]),
+        ("(?x) spaced out", []),
+        (r"foo\x20bar", ["foo bar"]),
+        (r"caf\u00e9 time", ["café time"]),
+        (r"a\012bcd", ["a", "bcd"]),
+        (r"(ab)\1xyz", ["xyz"]),
+        (r"\N{BULLET} item", [" item"]),
+        (r"col\tvalue", ["col\tvalue"]),
+        ("CUDA{|oom", []),
+        ("a{1,2b}|c", []),
+        ("CUDA{oom", ["CUDA{oom"]),
+        ("x{,3}yz{}", ["yz{}"]),
+    ],
+)
+def test_required_literals(pattern, literals):
+    assert get_required_literals(pattern) == literals
+
+
+def test_bitmap():
+    bitmap = bytearray(INDEX_SIZE)
+    add_to_bitmap(bitmap, ["RuntimeError: CUDA out of memory", "epoch 1"])
+    assert bitmap_contains(bitmap, get_query_trigrams("cuda OUT of", fixed_strings=True))
+    assert bitmap_contains(bitmap, get_query_trigrams(r"epoch \d"))
+    assert not bitmap_contains(bitmap, get_query_trigrams("segmentation fault"))
+    # Patterns too short for trigrams can't be filtered
+    assert get_query_trigrams("ep") == set()
+
+
+@pytest.mark.parametrize(
+    ("pattern", "line"),
+    [
+        (r"foo\x20bar", "a foo bar b"),
+        (r"caf\u00e9 time", "Café time!"),
+        (r"line\012next", "line\nnext"),
+        (r"(ab)\1xyz", "ababxyz"),
+        (r"\N{BULLET} item", "\u2022 item"),
+        (r"\d+ items? in \w+", "12 item in stock"),
+        ("CUDA{|oom", "out of oom"),
+        ("oom}|CUDA{", "cuda{ error"),
+        ("value{x}", "value{x}"),
+    ],
+)
+def test_index_finds_regex_matches(pattern, line):
+    assert re.search(pattern, line, re.IGNORECASE)
+    bitmap = bytearray(INDEX_SIZE)
+    add_to_bitmap(bitmap, [line])
+    assert bitmap_contains(bitmap, get_query_trigrams(pattern))
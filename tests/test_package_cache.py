@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import valohai_cli.packager as pkg
+from tests.stub_git import StubGit
+from tests.test_packaging import get_tar_files, write_temp_files
+from valohai_cli.package_cache import PackageCache
+
+
+def test_package_cache_reuse(tmpdir):
+    src_dir = tmpdir.mkdir("src")
+    write_temp_files(src_dir)
+    cache = PackageCache()
+    package = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    assert not package.is_temporary
+    assert os.path.dirname(package.path) == cache.directory
+    assert get_tar_files(package.path) == {"kahvikuppi", "valohai.yaml"}
+
+    # Nothing changed, so we get the very same tarball
+    package_2 = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    assert package_2 == package
+
+    # Changing a file results in a new package
+    src_dir.join("kahvikuppi").write_text("mmmm, more coffee", "utf8")
+    package_3 = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    assert package_3.sha256 != package.sha256
+    assert len(cache.get_entries()) == 2
+
+
+def test_package_cache_lru_eviction(tmpdir):
+    src_dir = tmpdir.mkdir("src")
+    write_temp_files(src_dir)
+    cache = PackageCache(max_size=1)  # Everything but the latest package gets evicted
+    package = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    src_dir.join("kahvikuppi").write_text("mmmm, more coffee", "utf8")
+    package_2 = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    assert not os.path.exists(package.path)
+    assert [entry.sha256 for entry in cache.get_entries()] == [package_2.sha256]
+    assert len(cache.clear()) == 1
+    assert not os.listdir(cache.directory)
+
+
+def test_package_cache_git_fingerprint(tmpdir, monkeypatch):
+    src_dir = tmpdir.mkdir("src")
+    write_temp_files(src_dir)
+    git = StubGit(src_dir)
+    git.init()
+    git.add_all()
+    git.commit()
+    cache = PackageCache()
+    package = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    fingerprint = pkg.get_git_fingerprint(str(src_dir))
+    assert fingerprint
+
+    # With an unchanged working copy, files aren't even listed
+    with monkeypatch.context() as m:
+        m.setattr(pkg, "get_files_for_package", pytest.fail)
+        assert pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache) == package
+
+    # Ignored files don't matter...
+    src_dir.join("asbestos").write_text("even scarier", "utf8")
+    assert pkg.get_git_fingerprint(str(src_dir)) == fingerprint
+
+    # ... but modified and untracked ones do
+    src_dir.join("kahvikuppi").write_text("mmmm, more coffee", "utf8")
+    modified_fingerprint = pkg.get_git_fingerprint(str(src_dir))
+    assert modified_fingerprint != fingerprint
+    src_dir.join("pulla").write_text("yum", "utf8")
+    assert pkg.get_git_fingerprint(str(src_dir)) not in (fingerprint, modified_fingerprint)
+    package_2 = pkg.create_package(directory=str(src_dir), yaml_path="valohai.yaml", cache=cache)
+    assert package_2.sha256 != package.sha256
+    assert "pulla" in get_tar_files(package_2.path)
+
+
+def test_git_fingerprint_without_git(tmpdir):
+    write_temp_files(tmpdir)
+    assert pkg.get_git_fingerprint(str(tmpdir)) is None
@@ -1,4 +1,7 @@
+import gzip
+import io
 import os
+import tarfile
 from subprocess import check_output
 
 import pytest
@@ -8,6 +11,8 @@ import valohai_cli.packager as pkg
 from tests.stub_git import StubGit
 from valohai_cli.exceptions import ConfigurationError, NoCommit, PackageTooLarge
 from valohai_cli.git import describe_current_commit
+from valohai_cli.utils.hashing import get_fp_sha256
+from valohai_cli.utils.parallel_gzip import ParallelGzipWriter
 
 
 def write_temp_files(
@@ -143,3 +148,90 @@ def test_vhignore_entire_directory(tmp_path):
     (tmp_path / "valohai.yaml").write_text("")
     tarball = pkg.package_directory(directory=str(tmp_path), yaml_path="valohai.yaml")
     assert get_tar_files(tarball) == {"hello.py", "valohai.yaml"}
+
+
+def test_package_checksum_matches_file(tmpdir):
+    write_temp_files(tmpdir)
+    package = pkg.create_package(directory=str(tmpdir), yaml_path="valohai.yaml")
+    with open(package.path, "rb") as fp:
+        assert package.sha256 == get_fp_sha256(fp)
+    assert package.size == os.stat(package.path).st_size
+
+
+def test_parallel_compression(tmpdir):
+    write_temp_files(tmpdir, large_file_size=3 * 1024 * 1024)
+    file_stats = pkg.get_files_for_package(str(tmpdir))
+    outputs = {}
+    for parallel_compression in (False, True, True):
+        with io.BytesIO() as fp:
+            checksum = pkg.package_files_into(fp, file_stats, parallel_compression=parallel_compression)
+            outputs.setdefault(parallel_compression, set()).add((checksum, fp.getvalue()))
+    assert len(outputs[True]) == 1  # Deterministic output
+    ((_, serial_data),) = outputs[False]
+    ((_, parallel_data),) = outputs[True]
+    assert gzip.decompress(parallel_data) == gzip.decompress(serial_data)
+
+
+def test_zstd_compression(tmpdir):
+    zstandard = pytest.importorskip("zstandard")
+    write_temp_files(tmpdir)
+    packages = [
+        pkg.create_package(directory=str(tmpdir), yaml_path="valohai.yaml", compression="zstd")
+        for _ in range(2)
+    ]
+    assert packages[0].compression == "zstd"
+    assert packages[0].path.endswith(".tar.zst")
+    assert packages[0].sha256 == packages[1].sha256  # Deterministic output
+    with open(packages[0].path, "rb") as fp:
+        tar_data = zstandard.ZstdDecompressor().stream_reader(fp).read()
+    with tarfile.open(fileobj=io.BytesIO(tar_data), mode="r:") as tarball:
+        assert "valohai.yaml" in tarball.getnames()
+
+
+def test_parallel_gzip_writer_block_boundaries():
+    data = os.urandom(100_000) + b"spam and eggs " * 100_000
+    outputs = set()
+    for max_workers in (1, 3):
+        with io.BytesIO() as fp:
+            with ParallelGzipWriter(fp, block_size=65536, max_workers=max_workers) as gzf:
+                for offset in range(0, len(data), 7777):
+                    gzf.write(data[offset : offset + 7777])
+            outputs.add(fp.getvalue())
+    (output,) = outputs
+    assert gzip.decompress(output) == data
+
+
+@pytest.mark.parametrize("parallel_stat", (False, True))
+def test_walk_nested_files(tmp_path, monkeypatch, parallel_stat):
+    monkeypatch.setattr(pkg, "PARALLEL_STAT_FILE_COUNT_THRESHOLD", 0 if parallel_stat else 100000)
+    for i in range(5):
+        (tmp_path / f"dir{i}" / "sub").mkdir(parents=True)
+        (tmp_path / f"dir{i}" / "sub" / f"file{i}.py").write_text("x" * i)
+        (tmp_path / f"dir{i}" / ".hidden").write_text("nope")
+    (tmp_path / "linked").symlink_to(tmp_path / "dir0")  # symlinked directories are not followed
+    file_stats = pkg.get_files_for_package(str(tmp_path), allow_git=False)
+    assert sorted(file_stats) == [f"dir{i}/sub/file{i}.py" for i in range(5)]
+    for name, pfi in file_stats.items():
+        assert pfi.source_path == str(tmp_path / name)
+        assert pfi.stat.st_size == os.stat(pfi.source_path).st_size
+
+
+def test_ignored_directories_are_pruned(tmp_path, monkeypatch):
+    src_path = tmp_path / "src"
+    src_path.mkdir()
+    (src_path / ".vhignore").write_text("data/\n!data/keep.txt\n*.log\n")
+    (src_path / "data" / "deep").mkdir(parents=True)
+    (src_path / "data" / "keep.txt").write_text("can't re-include files in an ignored directory")
+    (src_path / "data" / "deep" / "file").write_text("ignored")
+    (src_path / "train.py").write_text("")
+    (src_path / "train.log").write_text("")
+    scanned_dirs = []
+    original_scandir = os.scandir
+
+    def scandir(path):
+        scanned_dirs.append(os.path.relpath(path, src_path))
+        return original_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    assert set(pkg.get_files_for_package(str(src_path), allow_git=False)) == {"train.py"}
+    assert scanned_dirs == ["."]
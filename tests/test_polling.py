@@ -0,0 +1,82 @@
+import datetime
+import time
+
+import pytest
+import requests_mock
+
+from valohai_cli.api import request
+from valohai_cli.exceptions import APIError
+from valohai_cli.polling import DEFAULT_POLL_INTERVALS, MAX_THROTTLED_RETRIES, Poller, parse_retry_after
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (None, None),
+        ("", None),
+        ("soon", None),
+        ("120", 120.0),
+        ("Wed, 01 Jan 2025 00:00:30 GMT", 30.0),
+        ("Tue, 31 Dec 2024 23:59:00 GMT", 0.0),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    now = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    assert parse_retry_after(value, now=now) == expected
+
+
+def test_poller_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    poller = Poller(1, 10, jitter=0)
+    for changed in (False, False, False, False, False, True, False):
+        poller.update(changed=changed)
+        poller.wait()
+    assert sleeps == [2, 4, 8, 10, 10, 1, 2]
+
+
+def test_poller_jitter():
+    poller = Poller(10, 10, jitter=0.1)
+    delays = {poller.get_delay() for _ in range(100)}
+    assert all(9 <= delay <= 11 for delay in delays)
+    assert len(delays) > 1
+
+
+def test_poller_intervals_from_settings(monkeypatch):
+    monkeypatch.setenv("VALOHAI_LOGS_POLL_MIN_INTERVAL", "5")
+    poller = Poller.for_command("logs")
+    assert poller.min_interval == 5
+    assert poller.max_interval == DEFAULT_POLL_INTERVALS["logs"][1]
+    # The maximum is never below the minimum
+    monkeypatch.setenv("VALOHAI_LOGS_POLL_MAX_INTERVAL", "2")
+    assert Poller.for_command("logs").max_interval == 5
+
+
+def test_poller_call_honors_retry_after(logged_in, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    poller = Poller(1, 60, jitter=0)
+    with requests_mock.mock() as m:
+        m.get(
+            "https://app.valohai.com/api/v0/thing/",
+            [
+                {"status_code": 429, "headers": {"Retry-After": "30"}, "json": {}},
+                {"status_code": 503, "json": {}},
+                {"json": {"ok": True}},
+            ],
+        )
+        assert poller.call(request, "get", "/api/v0/thing/").json() == {"ok": True}
+        # Throttling counts as nothing having changed
+        assert sleeps == [30, 4]
+
+        m.get("https://app.valohai.com/api/v0/thing/", status_code=429, json={})
+        with pytest.raises(APIError):
+            poller.call(request, "get", "/api/v0/thing/")
+        assert m.call_count == 3 + MAX_THROTTLED_RETRIES + 1
+
+        # Other errors aren't retried
+        m.get("https://app.valohai.com/api/v0/thing/", status_code=400, json={})
+        sleeps.clear()
+        with pytest.raises(APIError):
+            poller.call(request, "get", "/api/v0/thing/")
+        assert not sleeps
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from valohai_cli.settings import settings
+from valohai_cli.transfer import TokenBucket, TransferScheduler, get_transfer_scheduler, parse_bandwidth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (None, None),
+        ("", None),
+        ("0", None),
+        (1000, 1000),
+        ("1500", 1500),
+        ("500k", 500_000),
+        ("2M", 2_000_000),
+        ("1.5 MB/s", 1_500_000),
+        ("1g", 1_000_000_000),
+    ],
+)
+def test_parse_bandwidth(value, expected):
+    assert parse_bandwidth(value) == expected
+
+
+def test_parse_bandwidth_invalid():
+    with pytest.raises(ValueError):
+        parse_bandwidth("fast")
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(1000, clock=clock, sleep=clock.sleep)
+    # The initial burst is free...
+    assert bucket.consume(1000) == 0
+    # ... but after that, consumers wait for the tokens they've reserved
+    assert bucket.consume(500) == pytest.approx(0.5)
+    assert bucket.consume(2000) == pytest.approx(2.0)
+    clock.now += 10  # The bucket refills, but only up to its capacity
+    assert bucket.consume(1000) == 0
+    assert bucket.consume(100) == pytest.approx(0.1)
+
+
+def test_transfer_stats():
+    clock = FakeClock()
+    scheduler = TransferScheduler(max_bandwidth=1000, clock=clock, sleep=clock.sleep)
+    with scheduler.transfer("file.bin", total=3000) as transfer:
+        for _ in range(3):
+            transfer.update(1000)
+    assert transfer.bytes == 3000
+    assert transfer.throttled_time == pytest.approx(2.0)
+    assert transfer.elapsed == pytest.approx(2.0)
+    assert transfer.throughput == pytest.approx(1500)
+    assert list(scheduler.completed) == [transfer]
+
+
+def test_transfer_concurrency():
+    scheduler = TransferScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    active = []
+    max_active = 0
+
+    def work():
+        nonlocal max_active
+        with scheduler.transfer("x"):
+            with lock:
+                active.append(1)
+                max_active = max(max_active, len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_active == 2
+    assert len(scheduler.completed) == 6
+
+
+def test_transfer_scheduler_settings(monkeypatch):
+    monkeypatch.setenv("VALOHAI_TRANSFER_MAX_BANDWIDTH", "2M")
+    monkeypatch.setenv("VALOHAI_TRANSFER_MAX_CONCURRENCY", "3")
+    scheduler = get_transfer_scheduler()
+    assert scheduler.max_bandwidth == 2_000_000
+    assert scheduler.max_concurrency == 3
+    assert get_transfer_scheduler() is scheduler
+    monkeypatch.delenv("VALOHAI_TRANSFER_MAX_BANDWIDTH")
+    monkeypatch.setitem(settings.overrides, "transfer_max_concurrency", 0)
+    scheduler = get_transfer_scheduler()
+    assert not scheduler.bucket
+    assert scheduler.max_concurrency == 3  # The environment variable wins
+    monkeypatch.delenv("VALOHAI_TRANSFER_MAX_CONCURRENCY")
+    assert not get_transfer_scheduler().semaphore
@@ -0,0 +1,92 @@
+import re
+
+import click
+import pytest
+
+from valohai_cli.tui import Divider, Flex, FrameRenderer, Layout
+
+CONTROL_RE = re.compile(r"\x1b\[([0-9;]*)([A-Za-z])|\r\n|\n|[^\x1b\r\n]+")
+
+
+class FakeTerminal:
+    """
+    Just enough of a VT100 to apply the updates `FrameRenderer` writes.
+    """
+
+    def __init__(self, rows: int) -> None:
+        self.screen = [""] * rows
+        self.row = 0
+        self.region = (0, rows - 1)
+
+    def write(self, data: str) -> None:
+        for match in CONTROL_RE.finditer(data):
+            command = match.group(2)
+            args = [int(arg) for arg in (match.group(1) or "").split(";") if arg]
+            if command == "H":
+                self.row = (args or [1])[0] - 1
+            elif command == "J":
+                self.screen = [""] * len(self.screen)
+            elif command == "K":
+                self.screen[self.row] = ""
+            elif command == "r":
+                self.region = (args[0] - 1, args[1] - 1) if args else (0, len(self.screen) - 1)
+                self.row = 0
+            elif match.group(0) in ("\n", "\r\n"):
+                top, bottom = self.region
+                if self.row == bottom:
+                    self.screen[top : bottom + 1] = self.screen[top + 1 : bottom + 1] + [""]
+                else:
+                    self.row += 1
+            else:
+                self.screen[self.row] += match.group(0)
+
+    @property
+    def lines(self) -> list:
+        return list(self.screen)
+
+
+@pytest.mark.parametrize("scroll", (False, True))
+def test_frame_renderer(scroll):
+    size = (20, 12)
+    renderer = FrameRenderer(scroll=scroll)
+    terminal = FakeTerminal(rows=size[1])
+    log = [f"line {i}" for i in range(30)]
+
+    def frame(clock: int, n_lines: int) -> list:
+        return [f"header {clock}", "=" * 20, *log[max(0, n_lines - 8) : n_lines]]
+
+    update = renderer.get_update(frame(0, 3), size)
+    assert update.startswith("\x1b[H\x1b[2J")
+    terminal.write(update)
+    assert terminal.lines[:5] == frame(0, 3)
+    # Nothing changed, nothing is written
+    assert renderer.get_update(frame(0, 3), size) == ""
+
+    updates = []
+    for n_lines in range(4, 20):
+        update = renderer.get_update(frame(n_lines % 2, n_lines), size)
+        terminal.write(update)
+        assert terminal.lines[: len(frame(0, n_lines))] == frame(n_lines % 2, n_lines)
+        updates.append(update)
+    # Once the log scrolls, only the new line (and the header) are written
+    if scroll:
+        assert "line 18" in updates[-1] and "line 17" not in updates[-1]
+        assert updates[-1].count("\x1b[2K") == 2
+    else:
+        assert updates[-1].count("\x1b[2K") == 9
+
+    # Shorter frames clear the rows left behind
+    terminal.write(renderer.get_update(frame(0, 1), size))
+    assert terminal.lines == [*frame(0, 1), *[""] * 9]
+
+    # A resized terminal gets a full redraw
+    assert renderer.get_update(frame(0, 1), (30, 12)).startswith("\x1b[H\x1b[2J")
+
+
+def test_layout_render():
+    layout = Layout()
+    layout.width = 10
+    layout.add(Flex().add("a").add("b", align="right"))
+    layout.add(Divider("=-"))
+    layout.add(Flex())
+    assert [click.unstyle(line) for line in layout.render()] == ["a        b", "=-=-=-=-=-"]
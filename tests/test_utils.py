@@ -1,6 +1,8 @@
+import io
 import os
 import sys
 
+import gitignorant
 import pytest
 
 from valohai_cli.utils import (
@@ -11,7 +13,9 @@ from valohai_cli.utils import (
     sanitize_option_name,
     walk_directory_parents,
 )
+from valohai_cli.utils.ignore_matcher import IgnoreMatcher
 from valohai_cli.utils.matching import match_prefix
+from valohai_cli.utils.preallocate import preallocate
 
 
 def test_dir_parents():
@@ -51,3 +55,56 @@ def test_sanitize_option_name():
     assert sanitize_option_name("Name With  Space") == "Name-With-Space"
     assert sanitize_option_name("Name With Spaces. And Dots.") == "Name-With-Spaces-And-Dots"
     assert sanitize_option_name("äää") == "aaa"
+
+
+IGNORE_RULES = """
+*.pyc
+!keep.pyc
+__pycache__/
+/build/
+node_modules
+docs/*.md
+**/logs/**
+data?
+!/data1
+[ab]*.txt
+"""
+
+
+@pytest.mark.parametrize(
+    "path",
+    (
+        "x.pyc",
+        "a/b/keep.pyc",
+        "src/__pycache__/x.py",
+        "__pycache__",
+        "build/out.o",
+        "src/build/out.o",
+        "lib/node_modules/foo/index.js",
+        "node_modules",
+        "docs/readme.md",
+        "src/docs/readme.md",
+        "docs/sub/readme.md",
+        "a/logs/b/c.log",
+        "data1",
+        "data2",
+        "data1/x",
+        "a.txt",
+        "c.txt",
+        "src/b2.txt",
+        "train.py",
+    ),
+)
+def test_ignore_matcher_matches_gitignorant(path):
+    rules = list(gitignorant.parse_gitignore_file(io.StringIO(IGNORE_RULES)))
+    assert IgnoreMatcher(rules).check_path_match(path) == gitignorant.check_path_match(rules, path)
+
+
+def test_preallocate(tmpdir):
+    path = tmpdir.join("file.bin")
+    with open(path, "wb") as fp:
+        fp.write(b"hello")
+        reserved = preallocate(fp.fileno(), 5, 1024 * 1024)
+        assert reserved or not sys.platform.startswith("linux")
+    # The file's size is unchanged, whether or not the space could be reserved
+    assert path.size() == 5
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import os
+import threading
+import uuid
+from collections.abc import Iterator
 from typing import Any
 
 import click
@@ -9,11 +12,25 @@ from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from valohai_cli.api import request
 from valohai_cli.exceptions import APIError, NoCommit, NoGitRepo
 from valohai_cli.git import describe_current_commit
-from valohai_cli.messages import success, warn
+from valohai_cli.messages import info, success, warn
 from valohai_cli.models.project import Project
-from valohai_cli.packager import package_directory
+from valohai_cli.package_cache import get_package_cache
+from valohai_cli.packager import (
+    PACKAGE_FORMATS,
+    Package,
+    PackageFileInfo,
+    collect_package_files,
+    create_package,
+    is_zstd_available,
+    package_files_into,
+    validate_compressed_size,
+)
+from valohai_cli.resumable_upload import RESUMABLE_UPLOAD_SIZE_THRESHOLD, ResumableUpload
+from valohai_cli.settings import settings
+from valohai_cli.transfer import get_transfer_scheduler
 from valohai_cli.utils.file_size_format import filesizeformat
 from valohai_cli.utils.hashing import get_fp_sha256
+from valohai_cli.utils.pipe import ChunkPipe, PipeAborted
 
 
 def package_adhoc_commit(
@@ -29,7 +46,7 @@ def package_adhoc_commit(
     """
     project.refresh_details()
     directory = project.directory
-    tarball = None
+    package: Package | None = None
     try:
         description = ""
         try:
@@ -45,23 +62,44 @@ def package_adhoc_commit(
             click.echo(f"Packaging {directory}...")
 
         yaml_path = yaml_path or project.get_yaml_path()
-        tarball = package_directory(
+        compression = get_package_compression(project)
+        if settings.stream_adhoc_upload:
+            file_stats = collect_package_files(
+                directory=directory,
+                yaml_path=yaml_path,
+                validate=validate,
+                allow_git=allow_git,
+            )
+            return _stream_commit_code(
+                project=project,
+                file_stats=file_stats,
+                yaml_path=yaml_path,
+                description=description,
+                validate=validate,
+                compression=compression,
+            )
+        package = create_package(
             directory=directory,
             progress=True,
             validate=validate,
             yaml_path=yaml_path,
             allow_git=allow_git,
+            cache=get_package_cache(),
+            compression=compression,
+            compression_level=settings.package_compression_level,
         )
         return create_adhoc_commit_from_tarball(
             project=project,
-            tarball=tarball,
+            tarball=package.path,
             yaml_path=yaml_path,
             description=description,
+            tarball_sha256=package.sha256,
+            compression=package.compression,
         )
     finally:
-        if tarball:
+        if package and package.is_temporary:
             try:
-                os.unlink(tarball)
+                os.unlink(package.path)
             except OSError as err:  # pragma: no cover
                 warn(f"Unable to remove temporary file: {err}")
 
@@ -72,36 +110,80 @@ def create_adhoc_commit_from_tarball(
     tarball: str,
     yaml_path: str | None = None,
     description: str = "",
+    tarball_sha256: str | None = None,
+    compression: str = "gzip",
 ) -> dict[str, Any]:
     """
     Using a precreated ad-hoc tarball, create or retrieve an ad-hoc commit of it on the Valohai host.
 
     :param project: Project
-    :param tarball: Tgz tarball path, likely created by the packager
+    :param tarball: Compressed tarball path, likely created by the packager
     :param yaml_path: Optional custom yaml path attached to the command.
     :param description: Optional description for the commit
+    :param tarball_sha256: Optional precalculated SHA-256 checksum of the tarball;
+                           if not set, it is calculated by reading the tarball.
+    :param compression: Compression format of the tarball (see `PACKAGE_FORMATS`)
     :return: Commit response object from API
     """
     yaml_path = yaml_path or project.get_yaml_path()
-    commit_obj = _get_pre_existing_commit(tarball, project.id)
+    if not tarball_sha256:
+        with open(tarball, "rb") as tarball_fp:
+            tarball_sha256 = get_fp_sha256(tarball_fp)
+    commit_obj = _get_pre_existing_commit(project.id, tarball_sha256=tarball_sha256)
     if commit_obj:
         success(f"Ad-hoc code {commit_obj['identifier']} already uploaded")
+    elif settings.resumable_adhoc_upload and os.stat(tarball).st_size >= RESUMABLE_UPLOAD_SIZE_THRESHOLD:
+        commit_obj = _upload_commit_code_resumable(
+            project=project,
+            tarball=tarball,
+            tarball_sha256=tarball_sha256,
+            yaml_path=yaml_path,
+            description=description,
+            compression=compression,
+        )
     else:
         commit_obj = _upload_commit_code(
             project=project,
             tarball=tarball,
             yaml_path=yaml_path,
             description=description,
+            compression=compression,
         )
     return commit_obj
 
 
-def _get_pre_existing_commit(tarball: str, project_id: str) -> dict | None:
+def get_package_compression(project: Project) -> str:
+    """
+    Figure out the compression format to use for ad-hoc packages.
+
+    The user's preferred format (the `package_compression` setting) is only used
+    if it's available locally and the server advertises support for it; otherwise gzip is used.
+    """
+    compression = settings.package_compression
+    if compression == "gzip":
+        return compression
+    if compression not in PACKAGE_FORMATS:
+        warn(f"Unknown package compression {compression!r}; using gzip")
+        return "gzip"
+    if compression == "zstd" and not is_zstd_available():
+        warn("Zstandard package compression requires the `zstandard` package; using gzip")
+        return "gzip"
+    resp = request("options", f"/api/v0/projects/{project.id}/import-package/", handle_errors=False)
+    try:
+        supported_compressions = resp.json().get("package_compressions", ()) if resp.ok else ()
+    except ValueError:
+        supported_compressions = ()
+    if compression not in supported_compressions:
+        info(f"The server does not support {compression} compressed packages; using gzip")
+        return "gzip"
+    return compression
+
+
+def _get_pre_existing_commit(project_id: str, tarball_sha256: str) -> dict | None:
     try:
         # This is the same mechanism used by the server to
         # calculate the identifier for an ad-hoc tarball.
-        with open(tarball, "rb") as tarball_fp:
-            commit_identifier = f"~{get_fp_sha256(tarball_fp)}"
+        commit_identifier = f"~{tarball_sha256}"
 
         # See if we have a commit with that identifier
         commit_obj: dict[str, Any] = request(
@@ -115,21 +197,31 @@ def _get_pre_existing_commit(tarball: str, project_id: str) -> dict | None:
         return None
 
 
-def _upload_commit_code(*, project: Project, tarball: str, yaml_path: str, description: str = "") -> dict:
+def _upload_commit_code(
+    *,
+    project: Project,
+    tarball: str,
+    yaml_path: str,
+    description: str = "",
+    compression: str = "gzip",
+) -> dict:
     size = os.stat(tarball).st_size
     click.echo(f"Uploading {filesizeformat(size)}...")
+    filename, content_type = PACKAGE_FORMATS[compression]
     with open(tarball, "rb") as tarball_fp:
         upload = MultipartEncoder({
-            "data": ("data.tgz", tarball_fp, "application/gzip"),
+            "data": (filename, tarball_fp, content_type),
             "description": description,
             "yaml_path": yaml_path,
         })
         prog = click.progressbar(length=upload.len, width=0)  # type: ignore[var-annotated]
         # Don't bother with the bar if the upload is small
         prog.is_hidden = size < 524288
-        with prog:
+        with prog, get_transfer_scheduler().transfer(filename, total=upload.len) as transfer:
 
             def callback(upload: Any) -> None:
+                # Throttles the upload (if limited), since this is called as the request body is read
+                transfer.update(upload.bytes_read - transfer.bytes)
                 prog.pos = upload.bytes_read
                 prog.update(0)  # Step is 0 because we set pos above
 
@@ -141,5 +233,127 @@ def _upload_commit_code(*, project: Project, tarball: str, yaml_path: str, descr
                 headers={"Content-Type": monitor.content_type},
             ).json()
     config_detail = f" from configuration YAML at {yaml_path}" if yaml_path else ""
+    success(
+        f"Uploaded ad-hoc code {commit_obj['identifier']}{config_detail} "
+        f"({filesizeformat(transfer.throughput)}/s)",
+    )
+    return commit_obj
+
+
+def _upload_commit_code_resumable(
+    *,
+    project: Project,
+    tarball: str,
+    tarball_sha256: str,
+    yaml_path: str,
+    description: str = "",
+    compression: str = "gzip",
+) -> dict:
+    size = os.stat(tarball).st_size
+    click.echo(f"Uploading {filesizeformat(size)} in chunks...")
+    filename, content_type = PACKAGE_FORMATS[compression]
+    commit_obj = ResumableUpload(
+        project=project,
+        path=tarball,
+        sha256=tarball_sha256,
+        filename=filename,
+        content_type=content_type,
+        fields={"description": description, "yaml_path": yaml_path},
+    ).upload()
+    config_detail = f" from configuration YAML at {yaml_path}" if yaml_path else ""
     success(f"Uploaded ad-hoc code {commit_obj['identifier']}{config_detail}")
     return commit_obj
+
+
+class _CompressedSizeValidatingPipe(ChunkPipe):
+    def write(self, data: bytes) -> int:
+        written = super().write(data)
+        validate_compressed_size(self.bytes_written)
+        return written
+
+
+def _stream_commit_code(
+    *,
+    project: Project,
+    file_stats: dict[str, PackageFileInfo],
+    yaml_path: str,
+    description: str = "",
+    validate: bool = True,
+    compression: str = "gzip",
+) -> dict:
+    """
+    Package `file_stats` and upload the package at the same time, without a temporary file.
+
+    The package is written into a bounded in-memory pipe by a packaging thread,
+    and the pipe is streamed as the body of a chunked upload request.
+    Since the package's checksum is only known once it has been completely uploaded,
+    this can not skip uploading code that has already been uploaded;
+    the checksum is instead verified against the identifier the server derived from what it received.
+    """
+    pipe = _CompressedSizeValidatingPipe() if validate else ChunkPipe()
+    package_sha256: str | None = None
+
+    def package() -> None:
+        nonlocal package_sha256
+        error: Exception | None = None
+        try:
+            package_sha256 = package_files_into(
+                pipe,  # type: ignore[arg-type]
+                file_stats,
+                compression=compression,
+                compression_level=settings.package_compression_level,
+            )
+        except PipeAborted:
+            return
+        except Exception as exc:
+            error = exc
+        try:
+            pipe.close(error=error)
+        except PipeAborted:
+            pass
+
+    boundary = uuid.uuid4().hex
+    filename, content_type = PACKAGE_FORMATS[compression]
+
+    def generate_body() -> Iterator[bytes]:
+        for name, value in (("description", description), ("yaml_path", yaml_path)):
+            yield (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+            ).encode()
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="data"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        for chunk in pipe:
+            # Throttles the upload (if limited), since the request body is read chunk by chunk
+            transfer.update(len(chunk))
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    click.echo(f"Packaging and uploading {len(file_stats)} files...")
+    packaging_thread = threading.Thread(target=package, name="adhoc-packager", daemon=True)
+    packaging_thread.start()
+    try:
+        with get_transfer_scheduler().transfer(filename) as transfer:
+            commit_obj: dict = request(
+                "post",
+                f"/api/v0/projects/{project.id}/import-package/",
+                data=generate_body(),
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            ).json()
+    finally:
+        pipe.abort()
+        packaging_thread.join()
+    if package_sha256 and commit_obj["identifier"] != f"~{package_sha256}":
+        # The server derives ad-hoc commit identifiers from the checksum of the package it received
+        warn(
+            f"The uploaded package's checksum ({package_sha256}) does not match "
+            f"the ad-hoc commit identifier {commit_obj['identifier']}; the upload may have been corrupted.",
+        )
+    config_detail = f" from configuration YAML at {yaml_path}" if yaml_path else ""
+    success(
+        f"Uploaded ad-hoc code {commit_obj['identifier']} "
+        f"({filesizeformat(pipe.bytes_written)}, {filesizeformat(transfer.throughput)}/s){config_detail}",
+    )
+    return commit_obj
@@ -113,6 +113,15 @@ def _get_current_api_session() -> APISession:
     return session
 
 
+def get_api_session() -> APISession:
+    """
+    Get the API session `request()` would use.
+
+    This is useful for sharing the session with worker threads, which don't see the Click context it's cached in.
+    """
+    return _get_current_api_session()
+
+
 def get_host_and_token() -> tuple[str, str]:
     host = settings.host
     token = settings.token
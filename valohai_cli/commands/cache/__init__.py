@@ -0,0 +1,10 @@
+import click
+
+from valohai_cli.plugin_cli import PluginCLI
+
+
+@click.command(cls=PluginCLI, commands_module="valohai_cli.commands.cache")
+def cache() -> None:
+    """
+    Local cache-related commands.
+    """
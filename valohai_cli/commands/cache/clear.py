@@ -0,0 +1,29 @@
+import click
+
+from valohai_cli.log_archive import LogArchive
+from valohai_cli.messages import success
+from valohai_cli.output_store import OutputStore
+from valohai_cli.package_cache import PackageCache
+from valohai_cli.resumable_upload import UploadJournal
+from valohai_cli.utils.file_size_format import filesizeformat
+
+
+@click.command()
+def clear() -> None:
+    """
+    Remove all ad-hoc packages, archived execution logs, records of downloaded outputs
+    and interrupted upload sessions from the local cache.
+    """
+    entries = PackageCache().clear()
+    total_size = sum(entry.size for entry in entries)
+    success(f"Removed {len(entries)} cached packages ({filesizeformat(total_size)}).")
+    log_entries = LogArchive().clear()
+    if log_entries:
+        total_size = sum(entry.size for entry in log_entries)
+        success(f"Removed the archived logs of {len(log_entries)} executions ({filesizeformat(total_size)}).")
+    output_entries = OutputStore().clear()
+    if output_entries:
+        success(f"Removed {len(output_entries)} records of downloaded outputs.")
+    upload_sessions = UploadJournal().clear()
+    if upload_sessions:
+        success(f"Removed {len(upload_sessions)} interrupted upload sessions.")
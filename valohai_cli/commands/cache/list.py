@@ -0,0 +1,39 @@
+import datetime
+
+import click
+
+from valohai_cli.messages import info
+from valohai_cli.package_cache import PackageCache
+from valohai_cli.settings import settings
+from valohai_cli.table import print_table
+from valohai_cli.utils.file_size_format import filesizeformat
+
+
+@click.command()
+def list() -> None:
+    """
+    Show the ad-hoc packages in the local cache.
+    """
+    cache = PackageCache()
+    entries = cache.get_entries()
+    if not entries:
+        info(f"The package cache ({cache.directory}) is empty.")
+        return
+    total_size = sum(entry.size for entry in entries)
+    print_table(
+        [
+            {
+                "identifier": f"~{entry.sha256}",
+                "size": entry.size,
+                "last_used": datetime.datetime.fromtimestamp(entry.last_used).isoformat(timespec="seconds"),
+            }
+            for entry in reversed(entries)
+        ],
+        columns=["identifier", "size", "last_used"],
+        headers=["Identifier", "Size", "Last Used"],
+    )
+    if settings.is_human_output:
+        info(
+            f"{len(entries)} packages, {filesizeformat(total_size)} "
+            f"(maximum {filesizeformat(cache.max_size)}) in {cache.directory}",
+        )
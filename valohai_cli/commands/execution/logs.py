@@ -1,29 +1,59 @@
-import time
+import re
+from collections.abc import Sequence
 
 import click
 
 from valohai_cli.consts import complete_execution_statuses, stream_styles
 from valohai_cli.ctx import get_project
+from valohai_cli.log_archive import get_log_archive
 from valohai_cli.log_manager import LogManager
+from valohai_cli.log_multiplexer import LogMultiplexer, get_executions_by_counters
+from valohai_cli.log_search import compile_search_pattern, search_logs
 from valohai_cli.messages import warn
+from valohai_cli.models.project import Project, resolve_counter
+from valohai_cli.polling import Poller
+from valohai_cli.range import IntegerRange
 from valohai_cli.utils import clean_log_line
-from valohai_cli.utils.cli_utils import counter_argument
+from valohai_cli.utils.cli_utils import HelpfulArgument
+
+COUNTERS_HELP = 'Execution # (or "latest"), or several of them, e.g. `10-20 !15`'
 
 
 @click.command()
-@counter_argument
+@click.argument("counters", required=True, nargs=-1, help=COUNTERS_HELP, cls=HelpfulArgument)
 @click.option("--status/--no-status", default=True, help="Show status messages")
 @click.option("--stderr/--no-stderr", default=True, help="Show stderr messages")
 @click.option("--stdout/--no-stdout", default=True, help="Show stdout messages")
 @click.option("--stream/--no-stream", default=False, help="Watch and wait for new messages?")
 @click.option("--all/--no-all", default=False, help="Get all messages? This may take a while.")
-def logs(counter: str, status: bool, stderr: bool, stdout: bool, stream: bool, all: bool) -> None:
+@click.option(
+    "--grep",
+    "pattern",
+    metavar="PATTERN",
+    help="Search the whole logs for messages matching this regular expression.",
+)
+@click.option("--fixed-strings", "-F", is_flag=True, help="Search for the --grep pattern as a plain string.")
+@click.option("--ignore-case", "-i", is_flag=True, help="Search for the --grep pattern case-insensitively.")
+def logs(
+    counters: Sequence[str],
+    status: bool,
+    stderr: bool,
+    stdout: bool,
+    stream: bool,
+    all: bool,
+    pattern: str | None,
+    fixed_strings: bool,
+    ignore_case: bool,
+) -> None:
     """
-    Show or stream execution event log.
+    Show, stream or search execution event log.
+
+    With several executions, their events are shown interleaved, prefixed with the execution counter.
+    With --grep, only the matching messages are shown, execution by execution.
+    Logs are archived locally, so searching them again is fast.
     """
     project = get_project(require=True)
     assert project
-    execution = project.get_execution_from_counter(counter=counter)
     accepted_streams = {
         v
         for v in [
@@ -33,10 +63,72 @@ def logs(counter: str, status: bool, stderr: bool, stdout: bool, stream: bool, a
         ]
         if v
     }
-    lm = LogManager(execution)
+    is_single = len(counters) == 1 and is_single_counter(counters[0])
+    if pattern is not None:
+        if stream:
+            raise click.UsageError("--grep can not be used with --stream.")
+        try:
+            compile_search_pattern(pattern, fixed_strings=fixed_strings, ignore_case=ignore_case)
+        except re.error as re_error:
+            raise click.BadParameter(str(re_error), param_hint="--grep") from re_error
+    if is_single and pattern is None:
+        show_execution_logs(project, counters[0], accepted_streams, stream=stream, all=all)
+        return
+    if is_single:
+        executions = [project.get_execution_from_counter(counter=counters[0])]
+    else:
+        try:
+            counter_set = IntegerRange.parse(counters).as_set()
+        except ValueError as ve:
+            raise click.BadParameter(str(ve), param_hint="counters") from ve
+        executions = get_executions_by_counters(project, counter_set)
+    if not executions:
+        return
+    if pattern is not None:
+        show_log_search_results(
+            executions,
+            pattern,
+            accepted_streams,
+            fixed_strings=fixed_strings,
+            ignore_case=ignore_case,
+        )
+    else:
+        show_multiple_execution_logs(project, executions, accepted_streams, stream=stream, all=all)
+
+
+def is_single_counter(counter: str) -> bool:
+    """
+    Check whether `counter` refers to a single execution (e.g. `5`, `#5` or `latest`), rather than a range.
+    """
+    try:
+        resolve_counter(counter)
+    except click.BadParameter:
+        return False
+    return True
+
+
+def format_event(event: dict, prefix: str = "") -> str:
+    short_time = event["time"].split("T")[1][:-4]
+    cleaned_text = clean_log_line(event["message"])
+    message = f"{prefix}{short_time} {cleaned_text}"
+    style = stream_styles.get(event["stream"], {})
+    return click.style(message, **style)  # type: ignore[arg-type]
+
+
+def show_execution_logs(
+    project: Project,
+    counter: str,
+    accepted_streams: set[str],
+    *,
+    stream: bool,
+    all: bool,
+) -> None:
+    execution = project.get_execution_from_counter(counter=counter)
+    lm = LogManager(execution, archive=get_log_archive())
+    poller = Poller.for_command("logs")
     limit = 0 if all else None
     while True:
-        events_response = lm.fetch_events(limit=limit)
+        events_response = poller.call(lm.fetch_events, limit=limit)
         events = events_response["events"]
         if not stream and events_response.get("truncated"):
             total = events_response["total"]
@@ -47,21 +139,78 @@ def logs(counter: str, status: bool, stderr: bool, stdout: bool, stream: bool, a
         for event in events:
             if event["stream"] not in accepted_streams:
                 continue
-            short_time = event["time"].split("T")[1][:-4]
-            cleaned_text = clean_log_line(event["message"])
-            message = f"{short_time} {cleaned_text}"
-            style = stream_styles.get(event["stream"], {})
-            click.echo(click.style(message, **style))  # type: ignore[arg-type]
+            click.echo(format_event(event))
         if stream:
-            lm.update_execution()
+            poller.call(lm.update_execution)
             if lm.execution["status"] in complete_execution_statuses:
                 click.echo(
                     f'The execution has finished (status {execution["status"]}); stopping stream.',
                     err=True,
                 )
                 break
-            # Fetch less on subsequent queries
-            limit = 100
-            time.sleep(1)
+            poller.update(changed=bool(events))
+            poller.wait()
         else:
             break
+
+
+def show_multiple_execution_logs(
+    project: Project,
+    executions: list[dict],
+    accepted_streams: set[str],
+    *,
+    stream: bool,
+    all: bool,
+) -> None:
+    multiplexer = LogMultiplexer(project, executions)
+    poller = Poller.for_command("logs")
+    counter_width = max(len(str(execution["counter"])) for execution in executions)
+    limit = 0 if all else None
+    while True:
+        live_before = set(multiplexer.live_ids)
+        results = poller.call(multiplexer.poll, limit=limit)
+        for execution, event in results:
+            if event["stream"] not in accepted_streams:
+                continue
+            click.echo(format_event(event, prefix=f"#{execution['counter']:<{counter_width}} "))
+        if not stream:
+            if multiplexer.truncated:
+                counters = ", ".join(f"#{counter}" for counter in sorted(multiplexer.truncated))
+                warn(f"Only the last events of {counters} are shown. Use `--all` to fetch everything.")
+            break
+        for execution_id in live_before - multiplexer.live_ids:
+            execution = multiplexer.managers[execution_id].execution
+            click.echo(
+                f'Execution #{execution["counter"]} has finished (status {execution["status"]}).',
+                err=True,
+            )
+        if not multiplexer.is_live:
+            click.echo("All executions have finished; stopping stream.", err=True)
+            break
+        poller.update(changed=bool(results))
+        poller.wait()
+
+
+def show_log_search_results(
+    executions: list[dict],
+    pattern: str,
+    accepted_streams: set[str],
+    *,
+    fixed_strings: bool,
+    ignore_case: bool,
+) -> None:
+    results = search_logs(
+        executions,
+        pattern,
+        accepted_streams,
+        fixed_strings=fixed_strings,
+        ignore_case=ignore_case,
+    )
+    counter_width = max(len(str(execution["counter"])) for execution in executions)
+    for execution, event in results:
+        click.echo(format_event(event, prefix=f"#{execution['counter']:<{counter_width}} "))
+    n_matching_executions = len({execution["id"] for (execution, _) in results})
+    click.echo(
+        f"{len(results)} matching messages in {n_matching_executions} of {len(executions)} executions.",
+        err=True,
+    )
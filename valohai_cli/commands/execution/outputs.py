@@ -1,19 +1,27 @@
 from __future__ import annotations
 
-import os
 import time
+from collections import deque
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from fnmatch import fnmatch
+from itertools import islice
+from typing import Any
 
 import click
-import requests
 
-from valohai_cli.api import get_user_agent, request
+from valohai_cli.api import get_api_session, request
 from valohai_cli.consts import complete_execution_statuses
 from valohai_cli.ctx import get_project
+from valohai_cli.exceptions import CLIException
 from valohai_cli.messages import info, success, warn
+from valohai_cli.output_downloader import DEFAULT_DOWNLOAD_JOBS, OutputDownloader
+from valohai_cli.output_index import CHECK_MODES, OutputIndex, is_output_up_to_date
+from valohai_cli.output_store import OutputStore, get_output_store
+from valohai_cli.polling import Poller
 from valohai_cli.table import print_table
 from valohai_cli.utils.cli_utils import counter_argument
+from valohai_cli.utils.file_size_format import filesizeformat
 
 DOWNLOAD_HELP = (
     "Download files to this directory (by default, don't download). "
@@ -21,6 +29,14 @@ DOWNLOAD_HELP = (
     "counter number."
 )
 
+CHECK_HELP = (
+    "How to decide whether an already downloaded file is up to date: "
+    "`exists` only checks that the file exists, "
+    "`size` compares its size and modification time to the output's, and "
+    "`checksum` compares its size and checksum to the output's "
+    "(remembering verified checksums in a `.vh-outputs.json` file in the download directory)."
+)
+
 GLOB_HELP = (
     "Download only files matching this glob.\n"
     "Be sure to wrap the value in single quotes (or however appropriate for your shell) "
@@ -28,28 +44,60 @@ GLOB_HELP = (
 )
 
 
-def get_execution_outputs(execution: dict, page_size: int = 5000) -> Iterable[dict]:
-    offset = 0
+OUTPUT_PREFETCH_PAGES = 4
 
-    while True:
-        params = {
-            "output_execution": execution["id"],
-            "limit": page_size,
-        }
-        if offset:
-            params["offset"] = offset
-        response = request(
-            method="get",
-            url="/api/v0/data/",
-            params=params,
-        ).json()
-
-        results = response.get("results", [])
-        yield from results
-        if len(results) < page_size:
-            break
 
+def get_execution_outputs(
+    execution: dict,
+    page_size: int = 5000,
+    since: str | None = None,
+    prefetch_pages: int = OUTPUT_PREFETCH_PAGES,
+) -> Iterable[dict]:
+    """
+    Get the outputs (datum records) of `execution`.
+
+    Once the first page reveals the total number of outputs, up to `prefetch_pages` of the following pages
+    are fetched concurrently; the outputs are still yielded in order.
+
+    :param since: If set, only get outputs created at or after this (ISO 8601) time, in creation order.
+    """
+    base_params: dict[str, Any] = {
+        "output_execution": execution["id"],
+        "limit": page_size,
+    }
+    if since:
+        base_params["ctime__gte"] = since
+        base_params["ordering"] = "ctime"
+    session = get_api_session()
+
+    def fetch_page(offset: int) -> dict:
+        params = dict(base_params, offset=offset) if offset else base_params
+        response: dict = session.request("get", "/api/v0/data/", params=params).json()
+        return response
+
+    response = fetch_page(0)
+    results = response.get("results", [])
+    yield from results
+    offset = 0
+    count = response.get("count")
+    if len(results) == page_size and isinstance(count, int) and prefetch_pages > 1:
+        offsets = iter(range(page_size, count, page_size))
+        with ThreadPoolExecutor(max_workers=prefetch_pages) as executor:
+            pending = deque(executor.submit(fetch_page, offset) for offset in islice(offsets, prefetch_pages))
+            try:
+                while pending:
+                    results = pending.popleft().result().get("results", [])
+                    pending.extend(executor.submit(fetch_page, offset) for offset in islice(offsets, 1))
+                    offset += page_size
+                    yield from results
+            finally:
+                for future in pending:
+                    future.cancel()
+    # Fetch any remaining pages one by one (e.g. if there was no count, or more outputs appeared meanwhile)
+    while len(results) == page_size:
         offset += page_size
+        results = fetch_page(offset).get("results", [])
+        yield from results
 
 
 @click.command()
@@ -71,7 +119,7 @@ def get_execution_outputs(execution: dict, page_size: int = 5000) -> Iterable[di
 @click.option(
     "--force",
     is_flag=True,
-    help="Download all files even if they already exist.",
+    help="Download all files even if they already exist (or have been downloaded elsewhere).",
 )
 @click.option(
     "--sync",
@@ -79,12 +127,29 @@ def get_execution_outputs(execution: dict, page_size: int = 5000) -> Iterable[di
     is_flag=True,
     help="Keep watching for new output files to download.",
 )
+@click.option(
+    "--check",
+    type=click.Choice(CHECK_MODES),
+    default="exists",
+    show_default=True,
+    help=CHECK_HELP,
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=DEFAULT_DOWNLOAD_JOBS,
+    show_default=True,
+    help="Number of files to download in parallel.",
+)
 def outputs(
     counter: str,
     download_directory: str | None,
     filter_download: str | None,
     force: bool,
     sync: bool,
+    check: str,
+    jobs: int,
 ) -> None:
     """
     List and download execution outputs.
@@ -93,7 +158,7 @@ def outputs(
         download_directory = download_directory.replace("{counter}", str(counter))
 
     if sync:
-        watch(counter, force, filter_download, download_directory)
+        watch(counter, force, filter_download, download_directory, check=check, jobs=jobs)
         return
 
     project = get_project(require=True)
@@ -110,15 +175,25 @@ def outputs(
         output["datum_url"] = f"datum://{output['id']}"
     print_table(outputs, ("name", "datum_url", "size"))
     if download_directory:
+        index = OutputIndex(download_directory) if check == "checksum" else None
         outputs = list(
             filter_outputs(
                 outputs,
                 download_directory=download_directory,
                 filter_download=filter_download,
                 force=force,
+                check=check,
+                index=index,
             ),
         )
-        download_outputs(outputs, download_directory, show_success_message=True)
+        download_outputs(
+            outputs,
+            download_directory,
+            show_success_message=True,
+            jobs=jobs,
+            index=index,
+            store=(None if force else get_output_store()),
+        )
 
 
 def watch(
@@ -126,6 +201,8 @@ def watch(
     force: bool,
     filter_download: str | None,
     download_directory: str | None,
+    check: str = "exists",
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
 ) -> None:
     if download_directory:
         info(f"Downloading to: {download_directory}\nWaiting for new outputs...")
@@ -138,21 +215,52 @@ def watch(
         counter=counter,
         params={"exclude": "outputs"},
     )
+    index = OutputIndex(download_directory) if check == "checksum" else None
+    store = None if force else get_output_store()
+    seen_output_ids: set[str] = set()
+    cursor: str | None = None
+    poller = Poller.for_command("outputs")
+
+    def list_outputs(execution: dict, since: str | None) -> list[dict]:
+        # Listed in full in a single call, so throttled listings are retried from the start
+        return list(get_execution_outputs(execution, since=since))
+
     while True:
+        # Refresh the status before listing outputs, so outputs created
+        # before the execution finished are never missed.
+        execution = poller.call(request, "get", execution["url"], params={"exclude": "outputs"}).json()
+        new_outputs = []
+        for output in poller.call(list_outputs, execution, since=cursor):
+            if output["id"] in seen_output_ids:
+                continue
+            seen_output_ids.add(output["id"])
+            new_outputs.append(output)
+            if output.get("ctime") and (cursor is None or output["ctime"] > cursor):
+                cursor = output["ctime"]
         outputs = list(
             filter_outputs(
-                get_execution_outputs(execution),
+                new_outputs,
                 download_directory=download_directory,
                 filter_download=filter_download,
                 force=force,
+                check=check,
+                index=index,
             ),
         )
         if outputs:
-            download_outputs(outputs, download_directory, show_success_message=False)
+            download_outputs(
+                outputs,
+                download_directory,
+                show_success_message=False,
+                jobs=jobs,
+                index=index,
+                store=store,
+            )
         if execution["status"] in complete_execution_statuses:
             info("Execution has finished.")
             return
-        time.sleep(1)
+        poller.update(changed=bool(new_outputs))
+        poller.wait()
 
 
 def filter_outputs(
@@ -161,64 +269,41 @@ def filter_outputs(
     download_directory: str,
     filter_download: str | None,
     force: bool,
+    check: str = "exists",
+    index: OutputIndex | None = None,
 ) -> Iterable[dict]:
-    for output in outputs:
-        if filter_download and not fnmatch(output["name"], filter_download):
-            continue
-        if not force and os.path.isfile(os.path.join(download_directory, output["name"])):
-            continue
-        yield output
+    try:
+        for output in outputs:
+            if filter_download and not fnmatch(output["name"], filter_download):
+                continue
+            if not force and is_output_up_to_date(output, download_directory, check=check, index=index):
+                continue
+            yield output
+    finally:
+        if index:
+            index.save()
 
 
-def download_outputs(outputs: list[dict], output_path: str, show_success_message: bool = True) -> None:
+def download_outputs(
+    outputs: list[dict],
+    output_path: str,
+    show_success_message: bool = True,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    index: OutputIndex | None = None,
+    store: OutputStore | None = None,
+) -> None:
     if not outputs:
         info("No outputs to download.")
         return
-    total_size = sum(o["size"] for o in outputs)
-    num_width = len(str(len(outputs)))  # How many digits required to print the number of outputs
     start_time = time.time()
-    is_responding_with_content = False
-    with (
-        click.progressbar(
-            length=total_size,
-            show_pos=True,
-            item_show_func=str,
-        ) as prog,
-        requests.Session() as dl_sess,
-    ):
-        dl_sess.headers["User-Agent"] = f"{get_user_agent()} (downloader)"
-        for i, output in enumerate(outputs, 1):
-            name = output["name"]
-            prog.current_item = f"({str(i).rjust(num_width)}/{str(len(outputs)).ljust(num_width)}) {name}"
-            # Force visible bar for the smallest of files:
-            prog.short_limit = 0  # type: ignore[attr-defined]
-            download_api_resp = request(
-                method="get",
-                url=f"/api/v0/data/{output['id']}/download/",
-                stream=is_responding_with_content,
-            )
-            download_api_resp.raise_for_status()
-            if download_api_resp.headers.get("Content-Disposition", "").startswith("attachment"):
-                # The remote server is not giving us an URL, but the actual stream!
-                # We'll assume this is the case for any future downloads too, so let's turn
-                # streaming automatically on for future requests.
-                is_responding_with_content = True
-                resp = download_api_resp
-            else:
-                # Otherwise, let's get the URL and download it.
-                url = download_api_resp.json()["url"]
-                resp = dl_sess.get(url, stream=True)
-                resp.raise_for_status()
-            out_path = os.path.join(output_path, name)
-            out_dir = os.path.dirname(out_path)
-            if not os.path.isdir(out_dir):
-                os.makedirs(out_dir)
-
-            with open(out_path, "wb") as outf:
-                for chunk in resp.iter_content(chunk_size=131072):
-                    prog.update(len(chunk))
-                    outf.write(chunk)
-
+    result = OutputDownloader(output_path, jobs=jobs, index=index, store=store).download(outputs)
     duration = time.time() - start_time
+    if result.failed:
+        raise CLIException(f"{len(result.failed)} of {len(outputs)} outputs could not be downloaded")
     if show_success_message:
-        success(f"Downloaded {len(outputs)} outputs ({total_size} bytes) in {round(duration, 2)} seconds")
+        total_size = sum(o["size"] for o in outputs)
+        transferred = sum(transfer.bytes for transfer in result.transfers)
+        speed = f", {filesizeformat(transferred / duration)}/s" if duration > 0 else ""
+        success(
+            f"Downloaded {len(outputs)} outputs ({total_size} bytes) in {round(duration, 2)} seconds{speed}",
+        )
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import datetime
-import time
 
 import click
 from click import get_current_context
@@ -11,7 +10,8 @@ from valohai_cli.consts import stream_styles
 from valohai_cli.ctx import get_project
 from valohai_cli.exceptions import APIError
 from valohai_cli.log_manager import LogManager
-from valohai_cli.tui import Divider, Flex, Layout
+from valohai_cli.polling import Poller
+from valohai_cli.tui import Divider, Flex, FrameRenderer, Layout
 from valohai_cli.utils import clean_log_line
 from valohai_cli.utils.cli_utils import counter_argument
 
@@ -30,15 +30,22 @@ class WatchTUI:
         self.events: list[dict] = []
         self.n_events = 0
         self.status_text: str | None = None
+        self.poller = Poller.for_command("watch")
+        self.renderer = FrameRenderer()
 
     def refresh(self) -> None:
         try:
-            self.log_manager.update_execution()
-            event_response = self.log_manager.fetch_events(limit=100)
+            status = self.log_manager.execution["status"]
+            self.poller.call(self.log_manager.update_execution)
+            event_response = self.poller.call(self.log_manager.fetch_events, limit=100)
         except (RequestException, APIError) as err:
             self.status_text = f"Failed fetch: {err}"
+            self.poller.update(changed=False)
         else:
             self.status_text = None
+            self.poller.update(
+                changed=bool(event_response["events"]) or self.log_manager.execution["status"] != status,
+            )
             self.n_events = event_response["total"]
             self.events.extend(event_response["events"])
             self.events = self.events[-500:]  # Only keep the last 500 events
@@ -59,8 +66,7 @@ class WatchTUI:
                     .add(event["time"].split("T")[1][:-4] + "  ", flex=0)
                     .add(clean_log_line(event["message"]), flex=4),
                 )
-        click.clear()
-        l.draw()
+        self.renderer.draw(l)
 
     def get_stat_flex(self, execution: dict) -> Flex:
         stat_flex = Flex()
@@ -102,6 +108,6 @@ def watch(counter: str) -> None:
     try:
         while True:
             tui.refresh()
-            time.sleep(1)
+            tui.poller.wait()
     except KeyboardInterrupt:
         get_current_context().exit()
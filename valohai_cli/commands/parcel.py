@@ -13,6 +13,7 @@ from valohai_cli.ctx import get_project
 from valohai_cli.git import expand_commit_id
 from valohai_cli.messages import success
 from valohai_cli.models.project import Project
+from valohai_cli.transfer import get_transfer_scheduler
 from valohai_cli.tui import get_spinner_character
 from valohai_cli.utils import ensure_makedirs, sanitize_filename
 from valohai_cli.utils.file_size_format import filesizeformat
@@ -223,7 +224,8 @@ def export_docker_image(image: str, output_path: str, print_progress: bool = Tru
     print_progress = print_progress and sys.stdout.isatty()
     # Don't bother with acquiring the image size if we're not going to print it anyway
     image_size = get_docker_image_size(image) if print_progress else None
-    with open(output_path, "wb") as outfp:
+    transfer_ctx = get_transfer_scheduler().transfer(image, total=image_size)
+    with open(output_path, "wb") as outfp, transfer_ctx as transfer:
         if print_progress:
             click.echo("Initializing export...\r", nl=False, err=True)
         while proc.poll() is None:
@@ -231,6 +233,7 @@ def export_docker_image(image: str, output_path: str, print_progress: bool = Tru
             if not chunk:
                 break
             outfp.write(chunk)
+            transfer.update(len(chunk))
             if print_progress:
                 width = shutil.get_terminal_size()[0]
                 size_fmt = filesizeformat(image_size) if image_size else "unknown size"
@@ -239,4 +242,5 @@ def export_docker_image(image: str, output_path: str, print_progress: bool = Tru
                 click.echo(status_text.ljust(width - 1), nl=False, err=True)
     if proc.returncode:
         raise subprocess.CalledProcessError(proc.returncode, "docker save " + image)
-    success(f"{image} exported: {filesizeformat(os.stat(output_path).st_size)}")
+    size_fmt = filesizeformat(os.stat(output_path).st_size)
+    success(f"{image} exported: {size_fmt} ({filesizeformat(transfer.throughput)}/s)")
@@ -27,5 +27,8 @@ execution_statuses = incomplete_execution_statuses | complete_execution_statuses
 default_app_host = "https://app.valohai.com/"
 json_help_envvar = "VH_CLI_JSON_HELP"
 
+default_package_cache_max_size = 2 * 1024 * 1024 * 1024
+default_log_archive_max_size = 256 * 1024 * 1024
+
 # Default environment API slug
 API_DEFAULT_ENVIRONMENT_SLUG = "PROJECT_DEFAULT"
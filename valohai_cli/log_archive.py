@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import contextlib
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from typing import Any
+
+from valohai_cli.log_index import INDEX_SIZE, add_to_bitmap, bitmap_contains
+from valohai_cli.messages import warn
+from valohai_cli.settings import settings
+from valohai_cli.settings.paths import get_cache_dir_name
+
+ARCHIVE_VERSION = 1
+META_FILENAME = "meta.json"
+INDEX_FILENAME = "index.bin"
+
+# A new segment is started once the current one is at least this large (compressed)
+SEGMENT_MAX_SIZE = 1024 * 1024
+
+ArchivedLog = namedtuple("ArchivedLog", ("events", "complete"))
+LogArchiveEntry = namedtuple("LogArchiveEntry", ("execution_id", "path", "size", "last_used"))
+
+
+class LogArchive:
+    """
+    A local archive of execution event logs.
+
+    Each execution's events are stored in `<execution_id>/` as gzip-compressed JSON lines segments
+    (`000000.jsonl.gz`, ...), which are only ever appended to (each append adds a gzip member),
+    and a `meta.json` file recording the size and number of events of each segment,
+    and whether the log is complete (i.e. the execution had finished).
+    Data past the recorded size of a segment (e.g. left behind by an interrupted append) is ignored.
+    `index.bin` holds a trigram bitmap of the messages in each segment (see `log_index`),
+    so searches only need to decompress the segments that may contain matches.
+
+    The archived events are always a prefix of the execution's log.
+    `meta.json`'s modification time is bumped whenever the log is used,
+    and the least recently used logs are evicted when the archive grows larger than `max_size`.
+    """
+
+    def __init__(self, directory: str | None = None, max_size: int | None = None) -> None:
+        self.directory = directory or get_cache_dir_name("logs")
+        self.max_size = settings.log_archive_max_size if max_size is None else max_size
+        self.lock = threading.Lock()
+        self.error_reported = False
+
+    def report_error(self, error: OSError) -> None:
+        """
+        Warn about an error using the archive (only about the first one, as the rest are likely the same).
+        """
+        with self.lock:
+            if self.error_reported:
+                return
+            self.error_reported = True
+        warn(f"Could not use the local log archive ({error}); continuing without it.")
+
+    def _get_path(self, execution_id: str, filename: str = "") -> str:
+        return os.path.join(self.directory, str(execution_id), filename)
+
+    def _read_meta(self, execution_id: str) -> dict[str, Any] | None:
+        try:
+            with open(self._get_path(execution_id, META_FILENAME)) as fp:
+                meta = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(meta, dict) or meta.get("version") != ARCHIVE_VERSION:
+            return None
+        return meta
+
+    def _write_meta(self, execution_id: str, meta: dict[str, Any]) -> None:
+        directory = self._get_path(execution_id)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as fp:
+            json.dump(meta, fp)
+        os.replace(fp.name, os.path.join(directory, META_FILENAME))
+
+    def _read_segment(self, execution_id: str, segment: dict[str, Any]) -> list[dict]:
+        with open(self._get_path(execution_id, segment["name"]), "rb") as fp:
+            data = gzip.decompress(fp.read(segment["size"]))
+        events = [json.loads(line) for line in data.splitlines() if line]
+        if len(events) != segment["count"]:
+            raise ValueError("Segment event count mismatch")
+        return events
+
+    def _read_index(self, execution_id: str, n_segments: int) -> bytearray | None:
+        try:
+            with open(self._get_path(execution_id, INDEX_FILENAME), "rb") as fp:
+                index = bytearray(fp.read())
+        except FileNotFoundError:
+            index = bytearray()
+        except OSError:
+            return None
+        return index if len(index) == n_segments * INDEX_SIZE else None
+
+    def _write_index(self, execution_id: str, index: bytes | bytearray) -> None:
+        directory = self._get_path(execution_id)
+        with tempfile.NamedTemporaryFile("wb", dir=directory, suffix=".tmp", delete=False) as fp:
+            fp.write(index)
+        os.replace(fp.name, os.path.join(directory, INDEX_FILENAME))
+
+    def _touch(self, execution_id: str) -> None:
+        with contextlib.suppress(OSError):
+            os.utime(self._get_path(execution_id, META_FILENAME))
+
+    def read(self, execution_id: str) -> ArchivedLog | None:
+        """
+        Read the archived events of an execution, if there are any.
+        """
+        meta = self._read_meta(execution_id)
+        if not meta:
+            return None
+        events: list[dict] = []
+        try:
+            for segment in meta["segments"]:
+                events.extend(self._read_segment(execution_id, segment))
+        except (OSError, ValueError, EOFError, KeyError, TypeError):
+            self.remove(execution_id)
+            return None
+        self._touch(execution_id)
+        return ArchivedLog(events=events, complete=bool(meta.get("complete")))
+
+    def search(self, execution_id: str, trigrams: set[str]) -> list[dict] | None:
+        """
+        Read the archived events of an execution that may contain all of `trigrams`,
+        skipping the segments whose index shows they can't.
+
+        The events returned still need to be matched; the index may have false positives.
+
+        :return: The candidate events, or None if the execution isn't archived.
+        """
+        meta = self._read_meta(execution_id)
+        if not meta:
+            return None
+        segments = meta["segments"]
+        index = self._read_index(execution_id, len(segments))
+        events: list[dict] = []
+        try:
+            if index is None:  # Rebuild a missing or stale index
+                index = bytearray()
+                for segment in segments:
+                    segment_events = self._read_segment(execution_id, segment)
+                    bitmap = bytearray(INDEX_SIZE)
+                    add_to_bitmap(bitmap, (event["message"] for event in segment_events))
+                    index += bitmap
+                    if bitmap_contains(bitmap, trigrams):
+                        events.extend(segment_events)
+                self._write_index(execution_id, index)
+            else:
+                for i, segment in enumerate(segments):
+                    if bitmap_contains(index[i * INDEX_SIZE : (i + 1) * INDEX_SIZE], trigrams):
+                        events.extend(self._read_segment(execution_id, segment))
+        except (OSError, ValueError, EOFError, KeyError, TypeError):
+            self.remove(execution_id)
+            return None
+        self._touch(execution_id)
+        return events
+
+    def is_complete(self, execution_id: str) -> bool:
+        """
+        Check whether the whole log of an execution is archived.
+        """
+        meta = self._read_meta(execution_id)
+        return bool(meta and meta.get("complete"))
+
+    def get_count(self, execution_id: str) -> int:
+        """
+        Get the number of archived events of an execution.
+        """
+        meta = self._read_meta(execution_id)
+        return sum(segment["count"] for segment in meta["segments"]) if meta else 0
+
+    def append(self, execution_id: str, offset: int, events: list[dict], complete: bool = False) -> bool:
+        """
+        Append `events`, starting at index `offset` of the execution's log, to the archive.
+
+        :param complete: Whether these are the last events of the log.
+        :return: Whether the events were archived; they aren't if they don't continue the archived events.
+        """
+        meta = self._read_meta(execution_id) or {
+            "version": ARCHIVE_VERSION,
+            "complete": False,
+            "segments": [],
+        }
+        segments = meta["segments"]
+        if offset != sum(segment["count"] for segment in segments) or meta["complete"]:
+            return False
+        if not events and not complete:
+            return True
+        os.makedirs(self._get_path(execution_id), exist_ok=True)
+        is_new_segment = not segments or segments[-1]["size"] >= SEGMENT_MAX_SIZE
+        if is_new_segment:
+            segments.append({"name": f"{len(segments):06d}.jsonl.gz", "size": 0, "count": 0})
+        segment = segments[-1]
+        if events:
+            data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode()
+            with open(self._get_path(execution_id, segment["name"]), "ab") as fp:
+                fp.truncate(segment["size"])
+                fp.write(gzip.compress(data))
+                segment["size"] = fp.tell()
+            segment["count"] += len(events)
+        # The index is updated first, so it never lacks the trigrams of archived events
+        index = self._read_index(execution_id, len(segments) - is_new_segment)
+        if index is None:
+            with contextlib.suppress(OSError):
+                os.unlink(self._get_path(execution_id, INDEX_FILENAME))
+        else:
+            if is_new_segment:
+                index += bytearray(INDEX_SIZE)
+            bitmap = index[-INDEX_SIZE:]
+            add_to_bitmap(bitmap, (event["message"] for event in events))
+            index[-INDEX_SIZE:] = bitmap
+            self._write_index(execution_id, index)
+        meta["complete"] = complete
+        self._write_meta(execution_id, meta)
+        if is_new_segment:
+            self.evict(keep=execution_id)
+        return True
+
+    def get_entries(self) -> list[LogArchiveEntry]:
+        """
+        Get the archived logs, least recently used first.
+        """
+        entries = []
+        with contextlib.suppress(FileNotFoundError):
+            for execution_id in os.listdir(self.directory):
+                path = self._get_path(execution_id)
+                try:
+                    last_used = os.stat(os.path.join(path, META_FILENAME)).st_mtime
+                    size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                except OSError:
+                    continue
+                entries.append(
+                    LogArchiveEntry(execution_id=execution_id, path=path, size=size, last_used=last_used),
+                )
+        entries.sort(key=lambda entry: entry.last_used)
+        return entries
+
+    def remove(self, execution_id: str) -> None:
+        shutil.rmtree(self._get_path(execution_id), ignore_errors=True)
+
+    def evict(self, keep: str | None = None) -> list[LogArchiveEntry]:
+        """
+        Remove least recently used logs until the archive fits in `max_size`.
+
+        :param keep: Execution ID of a log that must not be evicted (e.g. one being written).
+        :return: The evicted entries.
+        """
+        with self.lock:
+            entries = self.get_entries()
+            total_size = sum(entry.size for entry in entries)
+            evicted = []
+            for entry in entries:
+                if total_size <= self.max_size:
+                    break
+                if entry.execution_id == keep:
+                    continue
+                self.remove(entry.execution_id)
+                total_size -= entry.size
+                evicted.append(entry)
+            return evicted
+
+    def clear(self) -> list[LogArchiveEntry]:
+        entries = self.get_entries()
+        for entry in entries:
+            self.remove(entry.execution_id)
+        return entries
+
+
+def get_log_archive() -> LogArchive | None:
+    """
+    Get the user's log archive, or None if it has been disabled (by setting its maximum size to 0).
+    """
+    if settings.log_archive_max_size <= 0:
+        return None
+    return LogArchive()
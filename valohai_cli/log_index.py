@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import re
+import zlib
+from collections.abc import Iterable
+
+# Size of the trigram bitmap of each log archive segment, in bits (16 KiB)
+INDEX_BITS = 1 << 17
+INDEX_SIZE = INDEX_BITS // 8
+
+
+def get_trigrams(text: str) -> set[str]:
+    """
+    Get the (lowercased) trigrams of `text`.
+    """
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _get_bit(trigram: str) -> int:
+    # CRC32 rather than `hash()`, which is randomized per process
+    return zlib.crc32(trigram.encode("utf-8", "surrogatepass")) % INDEX_BITS
+
+
+def add_to_bitmap(bitmap: bytearray, texts: Iterable[str]) -> None:
+    """
+    Set the bits of the trigrams of `texts` in `bitmap`.
+    """
+    for text in texts:
+        for trigram in get_trigrams(text):
+            bit = _get_bit(trigram)
+            bitmap[bit >> 3] |= 1 << (bit & 7)
+
+
+def bitmap_contains(bitmap: bytes | bytearray, trigrams: Iterable[str]) -> bool:
+    """
+    Check whether `bitmap` may contain all of `trigrams`.
+
+    Several trigrams may map to the same bit, so this may return false positives, but never false negatives.
+    """
+    for trigram in trigrams:
+        bit = _get_bit(trigram)
+        if not bitmap[bit >> 3] & (1 << (bit & 7)):
+            return False
+    return True
+
+
+# Escapes that stand for a single character
+CHARACTER_ESCAPES = {"a": "\a", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+
+# A repetition quantifier (`{m}`, `{m,}`, `{,n}` or `{m,n}`); any other `{` is a literal character
+QUANTIFIER_RE = re.compile(r"\{(?:\d+|\d*,\d*)\}")
+
+# Lengths of the hexadecimal arguments of escapes like `\x20`
+HEX_ESCAPE_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+def _parse_escape(pattern: str, i: int) -> tuple[str | None, int]:
+    """
+    Parse the escape sequence starting at `pattern[i]` (after the backslash).
+
+    :return: The character the escape matches, or None if it isn't a single known character;
+             and the index after the escape sequence, including any arguments.
+    """
+    escaped = pattern[i : i + 1]
+    i += 1
+    if not escaped.isalnum():  # Escaped punctuation is literal
+        return (escaped or None), i
+    if escaped in CHARACTER_ESCAPES:
+        return CHARACTER_ESCAPES[escaped], i
+    if escaped in HEX_ESCAPE_LENGTHS:
+        end = i + HEX_ESCAPE_LENGTHS[escaped]
+        return chr(int(pattern[i:end], 16)), end
+    if escaped == "N":  # A named character, `\N{...}`
+        return None, pattern.index("}", i) + 1
+    if escaped.isdigit():  # An octal escape or a backreference
+        while i < len(pattern) and pattern[i].isdigit():
+            i += 1
+        return None, i
+    return None, i  # A character class (`\d`) or an assertion (`\b`)
+
+
+def get_required_literals(pattern: str) -> list[str]:  # noqa: C901
+    """
+    Get substrings that every match of the regular expression `pattern` must contain.
+
+    This is conservative: the contents of groups and character classes are ignored,
+    and top-level alternation means no substring is required at all.
+    """
+    if re.compile(pattern).flags & re.VERBOSE:  # Whitespace and comments aren't literal
+        return []
+    literals: list[str] = []
+    current: list[str] = []
+    depth = 0
+
+    def flush() -> None:
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == "\\":
+            escaped, i = _parse_escape(pattern, i)
+            if depth == 0 and escaped is not None:
+                current.append(escaped)
+            else:  # A character class (`\d`), an assertion (`\b`), a backreference...
+                flush()
+        elif char == "[":
+            flush()
+            # Skip the character class; a `]` right after `[` or `[^` is part of it
+            if pattern[i : i + 1] == "^":
+                i += 1
+            if pattern[i : i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth += 1
+            flush()
+        elif char == ")":
+            depth = max(0, depth - 1)
+            flush()
+        elif char == "|":
+            if depth == 0:
+                return []
+            flush()
+        elif char in "*?" or (char == "{" and QUANTIFIER_RE.match(pattern, i - 1)):
+            if current:  # The preceding character is optional
+                current.pop()
+            flush()
+            if char == "{":
+                i = pattern.index("}", i) + 1
+        elif char in "+.^$":
+            flush()
+        elif depth == 0:
+            current.append(char)
+    flush()
+    return literals
+
+
+def get_query_trigrams(pattern: str, fixed_strings: bool = False) -> set[str]:
+    """
+    Get the trigrams every line matching `pattern` must contain (in any case).
+    """
+    literals = [pattern] if fixed_strings else get_required_literals(pattern)
+    return set().union(*(get_trigrams(literal) for literal in literals))
@@ -1,38 +1,207 @@
 from __future__ import annotations
 
-import hashlib
+from typing import Any
 
-from valohai_cli.api import request
-from valohai_cli.utils import force_bytes
+from requests import Response
+
+from valohai_cli.api import APISession, request
+from valohai_cli.consts import complete_execution_statuses
+from valohai_cli.exceptions import APIConnectionError, APIError
+from valohai_cli.log_archive import ArchivedLog, LogArchive
+
+# Maximum number of events sharing the latest timestamp that are remembered for deduplication
+MAX_TIE_WINDOW = 1000
+
+# Number of events fetched per request when catching up with new events
+EVENTS_PAGE_SIZE = 500
+
+# Number of events shown by default when they are served from the log archive (as the API does)
+DEFAULT_EVENT_LIMIT = 100
 
 
 class LogManager:
-    def __init__(self, execution: dict) -> None:
+    """
+    Fetches the events of an execution, returning each event only once across fetches.
+
+    After the first fetch, only events after the ones already fetched are requested (by offset),
+    so they are all new, even if they look like earlier ones.
+
+    Only if the server doesn't report the total number of events (and thus the offset is unknown),
+    the latest events are fetched again each time, and the ones already returned are filtered out.
+    Events are assumed to arrive in chronological order, so it is enough to remember the latest
+    event time seen (the high-water mark), and which events had exactly that time (for ties),
+    no matter how many events have been fetched in total.
+
+    With a log archive, the events of an execution are fetched from the API only once:
+    the events of completed executions are served from the archive, and for executions
+    archived while they were running, only the events after the archived ones are fetched.
+    """
+
+    def __init__(
+        self,
+        execution: dict,
+        session: APISession | None = None,
+        archive: LogArchive | None = None,
+    ) -> None:
+        """
+        :param session: API session to use (e.g. one shared between threads); by default, `request()` is used.
+        :param archive: Log archive to read events from and write fetched events into, if any.
+        """
         self.execution: dict = execution
+        self.session = session
         self.execution_url: str = execution["url"]
         self.events_url: str = f"{self.execution_url}events/"
-        self.seen_events: set[str] = set()
+        self.last_event_time: str | None = None
+        self.last_time_events: set[tuple[str, str]] = set()
+        self.offset: int | None = None  # Index of the next event to fetch, once known
+        self.archive = archive
+        self.archiving = False  # Whether fetched events continue the archived ones, and are archived
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> Response:
+        if self.session:
+            return self.session.request(method, url, **kwargs)
+        return request(method, url, **kwargs)
 
     def update_execution(self) -> dict:
-        self.execution = request("get", self.execution_url).json()
+        self.execution = self._request("get", self.execution_url).json()
         return self.execution
 
+    @property
+    def is_complete(self) -> bool:
+        return self.execution["status"] in complete_execution_statuses
+
+    def is_new_event(self, event: dict) -> bool:
+        """
+        Check whether `event` has not been seen yet, and mark it seen.
+        """
+        event_time = event["time"]
+        key = (event["stream"], event["message"])
+        if self.last_event_time is not None:
+            if event_time < self.last_event_time:
+                return False
+            if event_time == self.last_event_time:
+                if key in self.last_time_events:
+                    return False
+                if len(self.last_time_events) < MAX_TIE_WINDOW:
+                    self.last_time_events.add(key)
+                return True
+        self.last_event_time = event_time
+        self.last_time_events = {key}
+        return True
+
+    def _read_archive(self) -> ArchivedLog | None:
+        if not self.archive:
+            return None
+        try:
+            return self.archive.read(self.execution["id"])
+        except OSError as ose:
+            self._disable_archive(ose)
+            return None
+
+    def _append_to_archive(self, offset: int, events: list[dict], complete: bool) -> None:
+        assert self.archive
+        try:
+            self.archiving = self.archive.append(self.execution["id"], offset, events, complete=complete)
+        except OSError as ose:
+            self._disable_archive(ose)
+
+    def _disable_archive(self, error: OSError) -> None:
+        # The archive is just a cache; failing to use it must not fail fetching the events.
+        assert self.archive
+        self.archive.report_error(error)
+        self.archive = None
+        self.archiving = False
+
     def fetch_events(self, limit: int | None = None) -> dict:
+        """
+        Fetch events not returned by earlier calls.
+
+        The first call fetches the last `limit` events (or the server's default number of events;
+        0 fetches all of them). Subsequent calls fetch only the events after those, page by page,
+        until caught up, so no events are skipped however many there are between calls.
+        """
+        if self.offset is not None:
+            return self._fetch_new_events()
+        archived = self._read_archive()
+        if archived:
+            return self._fetch_archived_events(archived, limit)
         params = {}
         if limit is not None:
             params["limit"] = limit
-        events_response = request("get", self.events_url, params=params).json()
-        filtered_events = []
-        for event in events_response.get("events", ()):
-            event_id = hashlib.md5(
-                force_bytes("+".join((event["stream"], event["time"], event["message"]))),
-            ).hexdigest()
-            if event_id in self.seen_events:
-                continue
-            self.seen_events.add(event_id)
-            filtered_events.append(event)
+        is_complete = self.is_complete
+        events_response = self._request("get", self.events_url, params=params).json()
+        events = events_response.get("events", [])
+        total = events_response.get("total")
+        if isinstance(total, int):
+            self.offset = total
+            if self.archive and len(events) == total:
+                self._append_to_archive(0, events, complete=is_complete)
+        else:  # The same events will be fetched again
+            events = [event for event in events if self.is_new_event(event)]
         return {
             "truncated": events_response.get("truncated", False),
-            "total": events_response.get("total"),
-            "events": filtered_events,
+            "total": total,
+            "events": events,
+        }
+
+    def _fetch_archived_events(self, archived: ArchivedLog, limit: int | None) -> dict:
+        events = archived.events
+        self.offset = len(events)
+        if not archived.complete:
+            self.archiving = True
+            try:
+                events += self._fetch_pages()[0]
+            except (APIError, APIConnectionError):
+                # Start over from the archive (which may have grown meanwhile) next time
+                self.offset = None
+                raise
+        limit = DEFAULT_EVENT_LIMIT if limit is None else limit
+        truncated = 0 < limit < len(events)
+        return {
+            "truncated": truncated,
+            "total": len(events),
+            "events": events[-limit:] if truncated else events,
         }
+
+    def _fetch_new_events(self) -> dict:
+        events, total = self._fetch_pages()
+        return {
+            "truncated": False,
+            "total": total,
+            "events": events,
+        }
+
+    def _fetch_pages(self) -> tuple[list[dict], int | None]:
+        """
+        Fetch all events after `offset`, archiving them if they continue the archived events.
+
+        If a request fails after some pages have been fetched, those pages are returned;
+        the next call continues from where this one left off.
+
+        :return: The events (not deduplicated), and the total number of events, if known.
+        """
+        assert self.offset is not None
+        is_complete = self.is_complete  # Only events fetched after the execution had finished are final
+        events: list[dict] = []
+        total = None
+        while True:
+            try:
+                events_response = self._request(
+                    "get",
+                    self.events_url,
+                    params={"offset": self.offset, "limit": EVENTS_PAGE_SIZE},
+                ).json()
+            except (APIError, APIConnectionError):
+                if not events:
+                    raise
+                break
+            page = events_response.get("events", [])
+            total = events_response.get("total", total)
+            is_last_page = len(page) < EVENTS_PAGE_SIZE
+            if self.archive and self.archiving:
+                self._append_to_archive(self.offset, page, complete=is_complete and is_last_page)
+            self.offset += len(page)
+            events.extend(page)
+            if is_last_page:
+                break
+        return events, total
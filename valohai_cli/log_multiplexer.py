@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from valohai_cli.api import get_api_session
+from valohai_cli.consts import complete_execution_statuses
+from valohai_cli.exceptions import NoExecution
+from valohai_cli.log_archive import get_log_archive
+from valohai_cli.log_manager import LogManager
+from valohai_cli.messages import warn
+from valohai_cli.models.project import Project
+
+DEFAULT_LOG_JOBS = 8
+
+
+def get_executions_by_counters(
+    project: Project,
+    counters: Iterable[int],
+    jobs: int = DEFAULT_LOG_JOBS,
+) -> list[dict]:
+    """
+    Get the executions of `project` with the given counters, in counter order.
+    The executions are looked up concurrently, one by one; counters with no execution are warned about.
+    """
+    counters = sorted(set(counters))
+    if not counters:
+        return []
+
+    def get_execution(counter: int) -> dict | None:
+        try:
+            return project.get_execution_from_counter(counter=counter)
+        except NoExecution:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="vh-logs") as executor:
+        results = list(executor.map(get_execution, counters))
+    missing = [counter for (counter, execution) in zip(counters, results) if execution is None]
+    if missing:
+        warn(f"Executions not found: {', '.join(f'#{counter}' for counter in missing)}")
+    return [execution for execution in results if execution is not None]
+
+
+class LogMultiplexer:
+    """
+    Follows the event logs of several executions at once.
+
+    Each `poll()` refreshes the statuses of all live executions and fetches their new events,
+    both concurrently, and returns them merged by time.
+    Executions that have finished are dropped from the poll set after their last events have been fetched,
+    so the cost of polling scales with the number of executions still running.
+    """
+
+    def __init__(self, project: Project, executions: list[dict], jobs: int = DEFAULT_LOG_JOBS) -> None:
+        self.project = project
+        self.session = get_api_session()
+        self.jobs = max(1, jobs)
+        archive = get_log_archive()
+        self.managers: dict[str, LogManager] = {
+            execution["id"]: LogManager(execution, session=self.session, archive=archive)
+            for execution in executions
+        }
+        self.live_ids: set[str] = set(self.managers)
+        self.fetched_once = False
+        self.truncated: dict[int, int | None] = {}  # Counter -> total number of events, for truncated logs
+        self.pending: list[tuple[str, int, dict, dict]] = []  # Events fetched by a failed poll
+
+    @property
+    def is_live(self) -> bool:
+        return bool(self.live_ids)
+
+    def refresh_statuses(self) -> None:
+        managers = [self.managers[execution_id] for execution_id in self.live_ids]
+        if not managers:
+            return
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="vh-logs") as executor:
+            for future in [executor.submit(manager.update_execution) for manager in managers]:
+                future.result()
+
+    def poll(self, limit: int | None = None) -> list[tuple[dict, dict]]:
+        """
+        Fetch the new events of the live executions (or, on the first call, the last `limit` events
+        of all executions; see `LogManager.fetch_events()`).
+
+        If fetching the events of some execution fails, the error is raised once the others are done,
+        and their events are returned by the next call instead, so none are lost.
+
+        :return: (execution, event) tuples, ordered by event time.
+                 The executions whose events were truncated are recorded in `truncated`.
+        """
+        if self.fetched_once:
+            self.refresh_statuses()
+        managers = [self.managers[execution_id] for execution_id in self.live_ids]
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="vh-logs") as executor:
+            futures = [executor.submit(manager.fetch_events, limit=limit) for manager in managers]
+        self.fetched_once = True
+        merged, self.pending = self.pending, []
+        error: Exception | None = None
+        for manager, future in zip(managers, futures):
+            try:
+                response = future.result()
+            except Exception as exc:
+                error = error or exc
+                continue
+            for event in response["events"]:
+                merged.append((event["time"], manager.execution["counter"], manager.execution, event))
+            if response.get("truncated"):
+                self.truncated[manager.execution["counter"]] = response.get("total")
+            if manager.execution["status"] in complete_execution_statuses:
+                self.live_ids.discard(manager.execution["id"])
+        if error:
+            self.pending = merged
+            raise error
+        # Events of each execution are already in order; a stable sort keeps them that way.
+        merged.sort(key=lambda item: (item[0], item[1]))
+        return [(execution, event) for (_, _, execution, event) in merged]
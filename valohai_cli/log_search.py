@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from valohai_cli.api import get_api_session
+from valohai_cli.log_archive import get_log_archive
+from valohai_cli.log_index import get_query_trigrams
+from valohai_cli.log_manager import LogManager
+from valohai_cli.log_multiplexer import DEFAULT_LOG_JOBS
+
+
+def compile_search_pattern(
+    pattern: str,
+    *,
+    fixed_strings: bool = False,
+    ignore_case: bool = False,
+) -> re.Pattern:
+    return re.compile(re.escape(pattern) if fixed_strings else pattern, re.IGNORECASE if ignore_case else 0)
+
+
+def search_logs(
+    executions: list[dict],
+    pattern: str,
+    accepted_streams: set[str],
+    *,
+    fixed_strings: bool = False,
+    ignore_case: bool = False,
+    jobs: int = DEFAULT_LOG_JOBS,
+) -> list[tuple[dict, dict]]:
+    """
+    Search the whole event logs of `executions` for events matching `pattern` (a regular expression,
+    or a plain string with `fixed_strings`).
+
+    Logs are fetched concurrently into the log archive, whose trigram index then lets repeated searches
+    skip the archived logs (or segments of them) that can't contain a match without decompressing them.
+
+    :return: (execution, event) tuples, in execution order.
+    """
+    regex = compile_search_pattern(pattern, fixed_strings=fixed_strings, ignore_case=ignore_case)
+    trigrams = get_query_trigrams(pattern, fixed_strings=fixed_strings)
+    archive = get_log_archive()
+    session = get_api_session()
+
+    def search_one(execution: dict) -> list[dict]:
+        events = None
+        if archive and archive.is_complete(execution["id"]):
+            events = archive.search(execution["id"], trigrams)
+        if events is None:
+            events = LogManager(execution, session=session, archive=archive).fetch_events(limit=0)["events"]
+        return [
+            event
+            for event in events
+            # The stream filter is cheaper than the pattern, so it goes first
+            if event["stream"] in accepted_streams and regex.search(event["message"])
+        ]
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="vh-logs") as executor:
+        results = list(executor.map(search_one, executions))
+    return [(execution, event) for (execution, events) in zip(executions, results) for event in events]
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import namedtuple
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO
+from urllib.parse import urlparse
+
+import click
+import requests
+from requests.adapters import HTTPAdapter
+
+from valohai_cli.api import APISession, get_api_session, get_user_agent
+from valohai_cli.exceptions import APIConnectionError, APIError
+from valohai_cli.messages import info, warn
+from valohai_cli.output_index import OutputIndex, get_datum_checksum, get_datum_mtime
+from valohai_cli.output_store import OutputStore
+from valohai_cli.transfer import Transfer, get_transfer_scheduler
+from valohai_cli.utils.hashing import get_fp_hexdigest
+from valohai_cli.utils.preallocate import preallocate
+
+DEFAULT_DOWNLOAD_JOBS = 4
+MAX_DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_RETRY_DELAY = 1.0
+MIN_DOWNLOAD_CHUNK_SIZE = 128 * 1024
+MAX_DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+PROGRESS_UPDATE_INTERVAL = 0.1
+# Downloads at least this large are read directly into a reusable buffer (see `_write_response`)
+DIRECT_READ_THRESHOLD = 16 * 1024 * 1024
+PART_SUFFIX = ".part"
+
+DownloadResult = namedtuple("DownloadResult", ("downloaded", "failed", "transfers"))
+
+
+def get_download_chunk_size(size: int | None) -> int:
+    """
+    Get the read/write chunk size for downloading a file of `size` bytes:
+    roughly 1/64 of the file, rounded to a power of two between the minimum and maximum chunk sizes.
+    """
+    chunk_size = MIN_DOWNLOAD_CHUNK_SIZE
+    while size and chunk_size < MAX_DOWNLOAD_CHUNK_SIZE and chunk_size * 64 < size:
+        chunk_size *= 2
+    return chunk_size
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+class OutputDownloader:
+    """
+    Downloads execution outputs (datum records) into a directory, using a pool of `jobs` worker threads.
+
+    HTTP sessions (and their connection pools) are shared between the workers, one per host.
+    The transfers are subject to the bandwidth and concurrency limits of the transfer scheduler.
+    Failed downloads are retried, and files that still fail are reported without aborting the rest.
+
+    Files are downloaded into `.part` files, which are renamed into place once their size has been
+    verified. Partial files left behind by earlier interrupted downloads are resumed with `Range` requests.
+    Downloaded files get the modification time of the datum's file.
+
+    If an `index` is given, downloaded files are verified against the datums' checksums (if any),
+    and recorded in the index.
+
+    If a `store` is given, outputs that have already been downloaded elsewhere are linked
+    (or copied) from there instead, and downloaded files are added to the store.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        *,
+        jobs: int = DEFAULT_DOWNLOAD_JOBS,
+        max_attempts: int = MAX_DOWNLOAD_ATTEMPTS,
+        index: OutputIndex | None = None,
+        store: OutputStore | None = None,
+    ) -> None:
+        self.output_path = output_path
+        self.index = index
+        self.store = store
+        self.materialized = 0
+        self.jobs = max(1, jobs)
+        self.max_attempts = max(1, max_attempts)
+        self.api_session: APISession = get_api_session()
+        self.sessions: dict[str, requests.Session] = {}
+        self.sessions_lock = threading.Lock()
+        self.progress_lock = threading.Lock()
+        self.buffers = threading.local()
+        self.prog: Any = None
+        self.scheduler = get_transfer_scheduler()
+        self.transfers: list[Transfer] = []
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        Get the shared download session for the host of `url`.
+        """
+        host = urlparse(url).netloc
+        with self.sessions_lock:
+            session = self.sessions.get(host)
+            if not session:
+                session = requests.Session()
+                session.headers["User-Agent"] = f"{get_user_agent()} (downloader)"
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.jobs)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+    def _open_download(self, output: dict, offset: int = 0) -> requests.Response:
+        """
+        Start downloading `output`, from `offset` onwards if possible.
+
+        The caller must check whether the response is partial (206) or not.
+        """
+        download_api_resp = self.api_session.request(
+            "get",
+            f"/api/v0/data/{output['id']}/download/",
+            stream=True,
+        )
+        if download_api_resp.headers.get("Content-Disposition", "").startswith("attachment"):
+            # The remote server is not giving us an URL, but the actual stream!
+            return download_api_resp
+        # Otherwise, let's get the URL and download it.
+        url = download_api_resp.json()["url"]
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        resp = self.get_session(url).get(url, stream=True, headers=headers)
+        if offset and resp.status_code == 416:  # The partial file is no good (e.g. the file has changed)
+            resp.close()
+            resp = self.get_session(url).get(url, stream=True)
+        resp.raise_for_status()
+        return resp
+
+    def _update_progress(self, n_bytes: int) -> None:
+        if self.prog is not None:
+            with self.progress_lock:
+                self.prog.update(n_bytes)
+
+    def download_one(self, output: dict) -> None:
+        out_path = os.path.join(self.output_path, output["name"])
+        part_path = out_path + PART_SUFFIX
+        expected_size = output.get("size")
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        try:
+            offset = os.path.getsize(part_path)
+            has_part = True
+        except FileNotFoundError:
+            offset = 0
+            has_part = False
+        if expected_size is not None and offset > expected_size:
+            offset = 0
+        if not offset and self.store and self.store.materialize(output, out_path):
+            self._update_progress(os.path.getsize(out_path))
+            self.materialized += 1
+            if self.index:
+                self.index.record(output["name"], datum_id=output["id"], stat=os.stat(out_path))
+            return
+        counted = 0  # Bytes of this attempt reported to the progress bar
+        try:
+            # Only a `.part` file that is already complete needs no downloading (an empty output needs one too)
+            if not has_part or expected_size is None or offset < expected_size:
+                with self.scheduler.transfer(output["name"], total=expected_size) as transfer:
+                    self.transfers.append(transfer)
+                    offset = self._download_part(output, part_path, offset, transfer)
+                counted += offset + transfer.bytes
+            else:
+                self._update_progress(offset)
+                counted += offset
+            self._finish_part(output, part_path, out_path)
+        except BaseException:
+            # Don't count the bytes of a failed attempt twice in the progress bar.
+            self._update_progress(-counted)
+            raise
+
+    def _download_part(self, output: dict, part_path: str, offset: int, transfer: Transfer) -> int:
+        """
+        Download `output` into `part_path`, continuing from `offset` if the server allows it.
+
+        :return: The offset the download actually continued from
+        """
+        resp = self._open_download(output, offset)
+        if resp.status_code != 206:  # The server is sending the whole file
+            offset = 0
+        elif not resp.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            resp.close()
+            raise IncompleteDownload(
+                f"Unexpected Content-Range {resp.headers.get('Content-Range')!r}",
+            )
+        self._update_progress(offset)
+        reported = offset  # Bytes of this attempt reported to the progress bar
+        try:
+            with open(part_path, ("ab" if offset else "wb")) as outf:
+                outf.truncate(offset)
+                expected_size = output.get("size")
+                if expected_size:
+                    preallocate(outf.fileno(), offset, expected_size - offset)
+                for n_bytes in self._write_response(resp, outf, transfer, expected_size):
+                    self._update_progress(n_bytes)
+                    reported += n_bytes
+        except BaseException:
+            self._update_progress(-reported)
+            raise
+        finally:
+            resp.close()
+        return offset
+
+    def _write_response(
+        self,
+        resp: requests.Response,
+        outf: BinaryIO,
+        transfer: Transfer,
+        size: int | None,
+    ) -> Iterator[int]:
+        """
+        Write the body of `resp` (expected to be `size` bytes) into `outf`,
+        in chunks sized by `get_download_chunk_size()`.
+
+        Large uncompressed bodies are read straight from the underlying `http.client` response
+        into a reusable per-thread buffer, skipping the copies urllib3 and requests would make of each chunk.
+        (The connection is not reused after that, which doesn't matter for large files.)
+
+        :return: Iterator of byte counts written since the previous one, for progress reporting
+                 (at most every `PROGRESS_UPDATE_INTERVAL` seconds, and once at the end)
+        """
+        chunk_size = get_download_chunk_size(size)
+        fp: Any = getattr(resp.raw, "_fp", None)  # The underlying http.client.HTTPResponse
+        if (
+            size
+            and size >= DIRECT_READ_THRESHOLD
+            and hasattr(fp, "readinto")
+            and not resp.headers.get("Content-Encoding")
+        ):
+            view = memoryview(self._get_buffer(chunk_size))
+            chunks: Iterator[memoryview | bytes] = iter(lambda: view[: fp.readinto(view)], b"")
+        else:
+            chunks = resp.iter_content(chunk_size=chunk_size)
+        unreported = 0
+        last_report = time.monotonic()
+        for chunk in chunks:
+            outf.write(chunk)
+            transfer.update(len(chunk))
+            unreported += len(chunk)
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_UPDATE_INTERVAL:
+                yield unreported
+                unreported = 0
+                last_report = now
+        if unreported:
+            yield unreported
+
+    def _get_buffer(self, size: int) -> bytearray:
+        buffer: bytearray | None = getattr(self.buffers, "buffer", None)
+        if buffer is None or len(buffer) != size:
+            buffer = self.buffers.buffer = bytearray(size)
+        return buffer
+
+    def _finish_part(self, output: dict, part_path: str, out_path: str) -> None:
+        size = os.path.getsize(part_path)
+        expected_size = output.get("size")
+        if expected_size is not None and size != expected_size:
+            if size > expected_size:  # Can't be resumed
+                os.unlink(part_path)
+            raise IncompleteDownload(f"Got {size} bytes instead of the expected {expected_size} bytes")
+        checksums = {}
+        datum_checksum = get_datum_checksum(output) if self.index else None
+        if datum_checksum:
+            algorithm, expected_checksum = datum_checksum
+            with open(part_path, "rb") as fp:
+                checksum = get_fp_hexdigest(fp, algorithm)
+            if checksum != expected_checksum:
+                os.unlink(part_path)
+                raise IncompleteDownload(f"The {algorithm} checksum of the downloaded file does not match")
+            checksums[algorithm] = checksum
+        datum_mtime = get_datum_mtime(output)
+        if datum_mtime is not None:
+            os.utime(part_path, (time.time(), datum_mtime))
+        os.replace(part_path, out_path)
+        if self.index:
+            self.index.record(
+                output["name"],
+                datum_id=output["id"],
+                stat=os.stat(out_path),
+                checksums=checksums,
+            )
+        if self.store:
+            self.store.add(output, out_path)
+
+    def _download_with_retries(self, output: dict) -> Exception | None:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.download_one(output)
+                return None
+            except (
+                requests.RequestException,
+                APIError,
+                APIConnectionError,
+                IncompleteDownload,
+                OSError,
+            ) as exc:
+                is_client_error = isinstance(exc, APIError) and exc.response.status_code < 500
+                if is_client_error or attempt >= self.max_attempts:
+                    return exc
+                time.sleep(DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+        return None  # pragma: no cover
+
+    def download(self, outputs: list[dict]) -> DownloadResult:
+        """
+        Download `outputs`, showing an aggregate progress bar.
+
+        :return: DownloadResult of the downloaded outputs, (output, exception) tuples of the failed ones,
+                 and the `Transfer`s (with throughput statistics) of all download attempts
+        """
+        downloaded = []
+        failed = []
+        total_size = sum(o["size"] for o in outputs)
+        with click.progressbar(length=total_size, show_pos=True, item_show_func=str) as prog:
+            self.prog = prog
+            # Force visible bar for the smallest of files:
+            prog.short_limit = 0  # type: ignore[attr-defined]
+            try:
+                with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="vh-download") as executor:
+                    results = executor.map(self._download_with_retries, outputs)
+                    for i, (output, error) in enumerate(zip(outputs, results), 1):
+                        with self.progress_lock:
+                            prog.current_item = f"({i}/{len(outputs)}) {output['name']}"
+                        if error:
+                            failed.append((output, error))
+                        else:
+                            downloaded.append(output)
+            finally:
+                self.prog = None
+                self.close()
+                if self.index:
+                    self.index.save()
+        if self.materialized:
+            info(f"{self.materialized} outputs were reused from earlier downloads")
+        for output, error in failed:
+            warn(f"Failed to download {output['name']}: {error}")
+        return DownloadResult(downloaded=downloaded, failed=failed, transfers=self.transfers)
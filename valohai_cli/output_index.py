@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import tempfile
+import threading
+from typing import Any
+
+from valohai_cli.utils.hashing import get_fp_hexdigest
+
+INDEX_FILENAME = ".vh-outputs.json"
+INDEX_VERSION = 1
+
+# In order of preference
+CHECKSUM_ALGORITHMS = ("sha256", "sha1", "md5")
+
+# Some file systems only store modification times with a 2-second resolution
+MTIME_TOLERANCE = 2.0
+
+CHECK_MODES = ("exists", "size", "checksum")
+
+
+def get_datum_mtime(output: dict) -> float | None:
+    """
+    Get the modification time of the file of the datum record `output` as a timestamp, if known.
+    """
+    value = output.get("file_mtime")
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def get_datum_checksum(output: dict) -> tuple[str, str] | None:
+    """
+    Get the preferred (algorithm, hex checksum) pair of the datum record `output`, if it has any checksums.
+    """
+    checksums = output.get("checksums") or {}
+    for algorithm in CHECKSUM_ALGORITHMS:
+        if checksums.get(algorithm):
+            return (algorithm, str(checksums[algorithm]).lower())
+    return None
+
+
+class OutputIndex:
+    """
+    A sidecar index file (`.vh-outputs.json`) in an output download directory,
+    recording which datum each downloaded file came from and the checksums verified for it.
+
+    Checksums are only trusted as long as the file's size and modification time are unchanged,
+    so repeated syncs don't need to rehash files.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self.files: dict[str, dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+            if data.get("version") == INDEX_VERSION:
+                self.files = dict(data.get("files", {}))
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def record(
+        self,
+        name: str,
+        *,
+        datum_id: str,
+        stat: os.stat_result,
+        checksums: dict | None = None,
+    ) -> None:
+        with self.lock:
+            self.files[name] = {
+                "datum_id": datum_id,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "checksums": dict(checksums or {}),
+            }
+            self.dirty = True
+
+    def get_checksum(self, name: str, path: str, algorithm: str) -> str:
+        """
+        Get the `algorithm` checksum of the file `path` (`name` in the index),
+        hashing it only if there is no checksum recorded for the file's current size and modification time.
+        """
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.files.get(name)
+        if entry and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            checksum = entry.get("checksums", {}).get(algorithm)
+            if checksum:
+                return str(checksum)
+        else:
+            entry = None
+        with open(path, "rb") as fp:
+            checksum = get_fp_hexdigest(fp, algorithm)
+        checksums = dict(entry["checksums"]) if entry else {}
+        checksums[algorithm] = checksum
+        self.record(name, datum_id=(entry["datum_id"] if entry else ""), stat=stat, checksums=checksums)
+        return checksum
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as fp:
+                json.dump({"version": INDEX_VERSION, "files": self.files}, fp)
+            os.replace(fp.name, self.path)
+            self.dirty = False
+
+
+def is_output_up_to_date(
+    output: dict,
+    directory: str,
+    *,
+    check: str = "exists",
+    index: OutputIndex | None = None,
+) -> bool:
+    """
+    Check whether the datum record `output` has already been downloaded into `directory`.
+
+    :param check: `exists` only checks that the file exists;
+                  `size` compares the file's size and modification time to the datum's;
+                  `checksum` compares the size and the datum's checksum (if it has one, otherwise like `size`).
+    :param index: Index to look up (and remember) checksums in, for the `checksum` check.
+    """
+    path = os.path.join(directory, output["name"])
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if check == "exists":
+        return True
+    if stat.st_size != output.get("size"):
+        return False
+    datum_checksum = get_datum_checksum(output) if check == "checksum" else None
+    if datum_checksum:
+        algorithm, checksum = datum_checksum
+        try:
+            if index:
+                return index.get_checksum(output["name"], path, algorithm) == checksum
+            with open(path, "rb") as fp:
+                return get_fp_hexdigest(fp, algorithm) == checksum
+        except OSError:
+            return False
+    datum_mtime = get_datum_mtime(output)
+    return datum_mtime is None or abs(stat.st_mtime - datum_mtime) <= MTIME_TOLERANCE
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import contextlib
+import errno
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from typing import Any
+
+from valohai_cli.output_index import get_datum_checksum
+from valohai_cli.settings import settings
+from valohai_cli.settings.paths import get_cache_dir_name
+
+# Link modes, in order of decreasing sharing; each mode falls back to the ones after it.
+LINK_MODES = ("hardlink", "reflink", "copy")
+
+# Number of known copies remembered per datum or checksum
+MAX_LOCATIONS = 8
+
+# Number of datum and checksum records kept; beyond this, records are pruned
+MAX_RECORDS = 20000
+
+OutputStoreEntry = namedtuple("OutputStoreEntry", ("key", "path", "size", "last_used"))
+
+# See linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(src: str, dst: str) -> None:
+    """
+    Create `dst` as a copy-on-write clone of `src`, if the file system supports it (e.g. Btrfs or XFS).
+
+    :raises OSError: if cloning is not supported.
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+    import fcntl
+
+    with open(src, "rb") as src_fp, open(dst, "wb") as dst_fp:
+        fcntl.ioctl(dst_fp.fileno(), FICLONE, src_fp.fileno())
+
+
+class OutputStore:
+    """
+    A local content store of downloaded outputs, remembering where each datum (by id and by checksum)
+    has already been downloaded to, so it can be materialised into other directories
+    with a hardlink, reflink or local copy instead of being downloaded again.
+
+    The store does not keep copies of its own; a remembered file is only reused as long as
+    its size and modification time are what they were when it was downloaded.
+
+    Locations are stored as `datum-<id>.json` and `<algorithm>-<checksum>.json` files.
+    Once there are more than `max_records` of them, the records of files that no longer exist
+    and then the least recently updated ones are pruned.
+
+    :param link_mode: The most sharing way to materialise files (see `LINK_MODES`).
+                      Hardlinks must be opted into, as they make the copies share their contents:
+                      modifying one in place modifies all of them.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        link_mode: str = "reflink",
+        max_records: int = MAX_RECORDS,
+    ) -> None:
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode {link_mode!r}")
+        self.directory = directory or get_cache_dir_name("outputs")
+        self.link_mode = link_mode
+        self.max_records = max_records
+        self.lock = threading.Lock()
+
+    def _get_keys(self, output: dict) -> list[str]:
+        keys = [f"datum-{output['id']}"]
+        datum_checksum = get_datum_checksum(output)
+        if datum_checksum:
+            keys.append("-".join(datum_checksum))
+        return keys
+
+    def _read_locations(self, key: str) -> list[dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, f"{key}.json")) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return []
+        return (
+            [loc for loc in data.get("locations", ()) if isinstance(loc, dict)]
+            if isinstance(data, dict)
+            else []
+        )
+
+    def _write_locations(self, key: str, locations: list[dict[str, Any]]) -> None:
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as fp:
+            json.dump({"locations": locations[:MAX_LOCATIONS]}, fp)
+        os.replace(fp.name, os.path.join(self.directory, f"{key}.json"))
+
+    def find(self, output: dict, exclude: str | None = None) -> str | None:
+        """
+        Find an unmodified, earlier downloaded copy of `output` (other than `exclude`).
+        """
+        exclude = os.path.abspath(exclude) if exclude else None
+        for key in self._get_keys(output):
+            for location in self._read_locations(key):
+                path = location.get("path")
+                if not path or path == exclude:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) == (location.get("size"), location.get("mtime_ns")) and (
+                    output.get("size") in (None, stat.st_size)
+                ):
+                    return str(path)
+        return None
+
+    def add(self, output: dict, path: str) -> None:
+        """
+        Remember that `output` has been downloaded (or materialised) into `path`.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        location = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        with self.lock:
+            for key in self._get_keys(output):
+                locations = [
+                    loc
+                    for loc in self._read_locations(key)
+                    if loc.get("path") != path and os.path.exists(str(loc.get("path")))
+                ]
+                with contextlib.suppress(OSError):
+                    self._write_locations(key, [location, *locations])
+
+    def materialize(self, output: dict, path: str) -> str | None:
+        """
+        Create `path` from an earlier downloaded copy of `output`, if there is one.
+
+        :return: The link mode used, or None if there was no usable copy.
+        """
+        source = self.find(output, exclude=path)
+        if not source or (os.path.exists(path) and os.path.samefile(source, path)):
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.vh-link-{os.getpid()}-{threading.get_ident()}"
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        for mode in LINK_MODES[LINK_MODES.index(self.link_mode) :]:
+            try:
+                if mode == "hardlink":
+                    os.link(source, tmp_path)
+                elif mode == "reflink":
+                    reflink(source, tmp_path)
+                    shutil.copystat(source, tmp_path)
+                else:
+                    shutil.copy2(source, tmp_path)
+            except OSError:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp_path)
+                continue
+            os.replace(tmp_path, path)
+            self.add(output, path)
+            return mode
+        return None
+
+    def get_entries(self) -> list[OutputStoreEntry]:
+        """
+        Get the datum and checksum records, least recently updated first.
+        """
+        entries = []
+        with contextlib.suppress(FileNotFoundError):
+            for dir_entry in os.scandir(self.directory):
+                if not dir_entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                entries.append(
+                    OutputStoreEntry(
+                        key=dir_entry.name[: -len(".json")],
+                        path=dir_entry.path,
+                        size=stat.st_size,
+                        last_used=stat.st_mtime,
+                    ),
+                )
+        entries.sort(key=lambda entry: entry.last_used)
+        return entries
+
+    def remove(self, key: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(os.path.join(self.directory, f"{key}.json"))
+
+    def prune(self) -> list[OutputStoreEntry]:
+        """
+        If there are more than `max_records` records, remove the ones none of whose files exist any more,
+        then the least recently updated ones until `max_records` remain.
+
+        :return: The removed entries.
+        """
+        with self.lock:
+            entries = self.get_entries()
+            if len(entries) <= self.max_records:
+                return []
+            pruned = [
+                entry
+                for entry in entries
+                if not any(os.path.exists(str(loc.get("path"))) for loc in self._read_locations(entry.key))
+            ]
+            pruned_keys = {entry.key for entry in pruned}
+            remaining = [entry for entry in entries if entry.key not in pruned_keys]
+            pruned.extend(remaining[: max(0, len(remaining) - self.max_records)])
+            for entry in pruned:
+                self.remove(entry.key)
+            return pruned
+
+    def clear(self) -> list[OutputStoreEntry]:
+        entries = self.get_entries()
+        for entry in entries:
+            self.remove(entry.key)
+        return entries
+
+
+def get_output_store() -> OutputStore | None:
+    """
+    Get the user's output store, or None if it has been disabled (by setting `output_link_mode` to `off`).
+    """
+    link_mode = settings.output_link_mode
+    if link_mode not in LINK_MODES:
+        return None
+    store = OutputStore(link_mode=link_mode)
+    store.prune()
+    return store
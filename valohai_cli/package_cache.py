@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+from valohai_cli.packager import Package, PackageFileInfo
+from valohai_cli.settings import settings
+from valohai_cli.settings.paths import get_cache_dir_name
+
+# Bump this whenever the packaging output format changes,
+# so packages created by older versions are not reused.
+MANIFEST_VERSION = 2
+
+PackageCacheEntry = namedtuple("PackageCacheEntry", ("key", "path", "size", "sha256", "last_used"))
+
+
+def get_manifest_key(file_stats: dict[str, PackageFileInfo], variant: str = "") -> str:
+    """
+    Get a key identifying the contents of a package about to be created from `file_stats`
+    (in the format described by `variant`, e.g. compression settings).
+
+    The key is derived from the file names and their stat results (size, mtime, inode, mode and ownership),
+    so any change to the files that would be visible in the tarball results in a different key.
+    File contents are not read.
+    """
+    hasher = hashlib.sha256(f"v{MANIFEST_VERSION}\n{variant}\n".encode())
+    for name, pfi in sorted(file_stats.items()):
+        stat = pfi.stat
+        hasher.update(
+            "\0".join(
+                str(bit)
+                for bit in (
+                    name,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    stat.st_ino,
+                    stat.st_mode,
+                    stat.st_uid,
+                    stat.st_gid,
+                )
+            ).encode("utf-8", "surrogateescape"),
+        )
+        hasher.update(b"\n")
+    return hasher.hexdigest()
+
+
+class PackageCache:
+    """
+    A local cache of ad-hoc package tarballs, keyed by the manifest of the packaged files
+    (see `get_manifest_key`).
+
+    Each entry is stored as a `<key>.pkg` tarball and a `<key>.json` metadata file.
+    Entries may also be looked up by other fingerprints (see `set_fingerprint`),
+    which are stored as `<fingerprint>.ref` files containing the key they refer to.
+    The tarball's mtime is bumped whenever it is used, and the least recently used entries
+    are evicted when the total size of the cache exceeds `max_size`.
+    """
+
+    def __init__(self, directory: str | None = None, max_size: int | None = None) -> None:
+        self.directory = directory or get_cache_dir_name("packages")
+        self.max_size = settings.package_cache_max_size if max_size is None else max_size
+
+    def _get_paths(self, key: str) -> tuple[str, str]:
+        return (
+            os.path.join(self.directory, f"{key}.pkg"),
+            os.path.join(self.directory, f"{key}.json"),
+        )
+
+    def get_key(self, file_stats: dict[str, PackageFileInfo], variant: str = "") -> str:
+        return get_manifest_key(file_stats, variant=variant)
+
+    def get(self, key: str) -> Package | None:
+        tarball_path, meta_path = self._get_paths(key)
+        try:
+            with open(meta_path) as meta_fp:
+                meta = json.load(meta_fp)
+            size = os.stat(tarball_path).st_size
+        except (OSError, ValueError):
+            return None
+        if size != meta.get("size") or not meta.get("sha256"):
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(tarball_path)
+        return Package(
+            path=tarball_path,
+            size=size,
+            sha256=meta["sha256"],
+            is_temporary=False,
+            compression=meta.get("compression", "gzip"),
+        )
+
+    def get_by_fingerprint(self, fingerprint: str) -> Package | None:
+        ref_path = os.path.join(self.directory, f"{fingerprint}.ref")
+        try:
+            with open(ref_path) as ref_fp:
+                key = ref_fp.read().strip()
+        except OSError:
+            return None
+        package = self.get(key)
+        if not package:  # The entry has been evicted
+            with contextlib.suppress(OSError):
+                os.unlink(ref_path)
+        return package
+
+    def set_fingerprint(self, fingerprint: str, key: str) -> None:
+        """
+        Make the entry `key` also retrievable with `get_by_fingerprint(fingerprint)`.
+        """
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as ref_fp:
+            ref_fp.write(key)
+        os.replace(ref_fp.name, os.path.join(self.directory, f"{fingerprint}.ref"))
+
+    def put(self, key: str, package: Package) -> Package:
+        """
+        Move the temporary tarball of `package` into the cache.
+
+        :return: A Package pointing to the cached tarball.
+        """
+        tarball_path, meta_path = self._get_paths(key)
+        os.replace(package.path, tarball_path)
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as meta_fp:
+            json.dump(
+                {"sha256": package.sha256, "size": package.size, "compression": package.compression},
+                meta_fp,
+            )
+        os.replace(meta_fp.name, meta_path)
+        self.evict(keep=key)
+        return package._replace(path=tarball_path, is_temporary=False)
+
+    def get_entries(self) -> list[PackageCacheEntry]:
+        """
+        Get the entries in the cache, least recently used first.
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            key = filename[:-5]
+            tarball_path, meta_path = self._get_paths(key)
+            try:
+                with open(meta_path) as meta_fp:
+                    meta = json.load(meta_fp)
+                stat = os.stat(tarball_path)
+            except (OSError, ValueError):
+                continue
+            entries.append(
+                PackageCacheEntry(
+                    key=key,
+                    path=tarball_path,
+                    size=stat.st_size,
+                    sha256=meta.get("sha256"),
+                    last_used=stat.st_mtime,
+                ),
+            )
+        entries.sort(key=lambda entry: entry.last_used)
+        return entries
+
+    def remove(self, key: str) -> None:
+        for path in self._get_paths(key):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+    def evict(self, keep: str | None = None) -> list[PackageCacheEntry]:
+        """
+        Remove least recently used entries until the cache fits in `max_size`.
+
+        :param keep: Key of an entry that must not be evicted (e.g. one that is about to be used).
+        :return: The evicted entries.
+        """
+        entries = self.get_entries()
+        total_size = sum(entry.size for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total_size <= self.max_size:
+                break
+            if entry.key == keep:
+                continue
+            self.remove(entry.key)
+            total_size -= entry.size
+            evicted.append(entry)
+        return evicted
+
+    def clear(self) -> list[PackageCacheEntry]:
+        entries = self.get_entries()
+        for entry in entries:
+            self.remove(entry.key)
+        # Also clean up any stray files, e.g. temporary files left behind by interrupted packaging
+        # or entries created by older versions
+        for filename in os.listdir(self.directory):
+            with contextlib.suppress(OSError):
+                os.unlink(os.path.join(self.directory, filename))
+        return entries
+
+
+def get_package_cache() -> PackageCache | None:
+    """
+    Get the user's package cache, or None if it has been disabled (by setting its maximum size to 0).
+    """
+    if settings.package_cache_max_size <= 0:
+        return None
+    return PackageCache()
@@ -1,27 +1,49 @@
+from __future__ import annotations
+
 import fnmatch
 import gzip
+import hashlib
 import os
 import subprocess
 import tarfile
 import tempfile
 from collections import namedtuple
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from subprocess import check_output
-from typing import IO
+from typing import IO, TYPE_CHECKING, Any
 
 import click
 import gitignorant
 
-from valohai_cli.exceptions import ConfigurationError, PackageTooLarge
+from valohai_cli.exceptions import ConfigurationError, NoGitRepo, PackageTooLarge
+from valohai_cli.git import check_git_output
 from valohai_cli.messages import info, warn
 from valohai_cli.utils.file_size_format import filesizeformat
+from valohai_cli.utils.hashing import HashingWriter
+from valohai_cli.utils.ignore_matcher import IgnoreMatcher
+from valohai_cli.utils.parallel_gzip import ParallelGzipWriter
+
+if TYPE_CHECKING:
+    from valohai_cli.package_cache import PackageCache
 
 FILE_SIZE_WARN_THRESHOLD = 50 * 1024 * 1024
 FILE_COUNT_HARD_THRESHOLD = 10000
 UNCOMPRESSED_PACKAGE_SIZE_SOFT_THRESHOLD = 150 * 1024 * 1024
 COMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD = 1000 * 1024 * 1024
 
+# Packages larger than this (uncompressed) are compressed using multiple threads.
+# This only depends on the package contents, so identical trees always result in identical tarballs.
+PARALLEL_COMPRESSION_SIZE_THRESHOLD = 32 * 1024 * 1024
+
+# Package compression formats, and the file names and content types used when uploading them.
+PACKAGE_FORMATS = {
+    "gzip": ("data.tgz", "application/gzip"),
+    "zstd": ("data.tar.zst", "application/zstd"),
+}
+DEFAULT_ZSTD_LEVEL = 10
+
 # We guess that Gzip may help halve the package size -
 # if the package is actually all source code, it will probably help more.
 UNCOMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD = COMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD / 0.5
@@ -40,8 +62,21 @@ their patterns to your `.gitignore` file.
 You can disable this validation with the `--no-validate-adhoc` option.
 """
 
+# Files are stat()ed concurrently when there are more than this many of them,
+# since on network file systems the latency of each stat() call adds up.
+PARALLEL_STAT_FILE_COUNT_THRESHOLD = 64
+PARALLEL_STAT_MAX_WORKERS = 16
+
 PackageFileInfo = namedtuple("PackageFileInfo", ("source_path", "stat"))
 
+# (path within package, source path, directory entry if the file was found by walking the file system)
+FileTuple = tuple[str, str, "os.DirEntry[str] | None"]
+Package = namedtuple(
+    "Package",
+    ("path", "size", "sha256", "is_temporary", "compression"),
+    defaults=(True, "gzip"),
+)
+
 
 class GitUsage(Enum):
     NONE = 0
@@ -62,6 +97,128 @@ def package_directory(
     validate: bool = True,
     allow_git: bool = True,
 ) -> str:
+    return create_package(
+        directory=directory,
+        yaml_path=yaml_path,
+        progress=progress,
+        validate=validate,
+        allow_git=allow_git,
+    ).path
+
+
+def create_package(
+    *,
+    directory: str,
+    yaml_path: str,
+    progress: bool = False,
+    validate: bool = True,
+    allow_git: bool = True,
+    cache: PackageCache | None = None,
+    compression: str = "gzip",
+    compression_level: int | None = None,
+) -> Package:
+    """
+    Package `directory` into a temporary compressed tarball.
+
+    If a `cache` is given, a previously created tarball of an unchanged set of files is reused
+    (in which case the returned package is not temporary and must not be deleted), and newly
+    created tarballs are stored in the cache.
+
+    For Git working copies, the cache is first looked up by a fingerprint of the working copy
+    (see `get_git_fingerprint`); on a hit, files are neither listed, validated nor read.
+
+    :return: Package tuple of the tarball's path, its size, its SHA-256 checksum and compression format
+    """
+    variant = f"{compression}:{compression_level}"
+    git_fingerprint = None
+    if cache and allow_git:
+        git_fingerprint = get_git_fingerprint(directory, variant=f"{variant}:{yaml_path}:{validate}")
+        if git_fingerprint:
+            cached_package = cache.get_by_fingerprint(git_fingerprint)
+            if cached_package:
+                info(f"Reusing cached package {cached_package.sha256[:12]} of unchanged Git working copy")
+                return cached_package
+
+    file_stats = collect_package_files(
+        directory=directory,
+        yaml_path=yaml_path,
+        validate=validate,
+        allow_git=allow_git,
+    )
+
+    cache_key = None
+    if cache:
+        cache_key = cache.get_key(file_stats, variant=variant)
+        cached_package = cache.get(cache_key)
+        if cached_package:
+            info(f"Reusing cached package {cached_package.sha256[:12]} of unchanged files")
+            if validate:
+                validate_compressed_size(cached_package.size)
+            if git_fingerprint:
+                cache.set_fingerprint(git_fingerprint, cache_key)
+            return cached_package
+
+    # When caching, create the tarball in the cache directory so it can be moved into place without copying
+    package = _create_package_file(
+        file_stats,
+        directory=(cache.directory if cache else None),
+        progress=progress,
+        validate=validate,
+        compression=compression,
+        compression_level=compression_level,
+    )
+    if cache and cache_key:
+        package = cache.put(cache_key, package)
+        if git_fingerprint:
+            cache.set_fingerprint(git_fingerprint, cache_key)
+    return package
+
+
+def _create_package_file(
+    file_stats: dict[str, PackageFileInfo],
+    *,
+    directory: str | None,
+    progress: bool,
+    validate: bool,
+    compression: str,
+    compression_level: int | None,
+) -> Package:
+    with tempfile.NamedTemporaryFile(
+        delete=False,
+        suffix=(".tar.zst" if compression == "zstd" else ".tgz"),
+        prefix="valohai-cli-",
+        dir=directory,
+    ) as fp:
+        sha256 = package_files_into(
+            fp,
+            file_stats,
+            progress=progress,
+            compression=compression,
+            compression_level=compression_level,
+        )
+        total_compressed_size = fp.tell()
+
+    package = Package(path=fp.name, size=total_compressed_size, sha256=sha256, compression=compression)
+    if validate:
+        try:
+            validate_compressed_size(total_compressed_size)
+        except PackageTooLarge:
+            os.unlink(package.path)
+            raise
+    return package
+
+
+def collect_package_files(
+    *,
+    directory: str,
+    yaml_path: str,
+    validate: bool = True,
+    allow_git: bool = True,
+) -> dict[str, PackageFileInfo]:
+    """
+    Find the files to package from `directory`, and (if `validate` is set) validate them,
+    interactively asking whether to continue if there are suspiciously large files.
+    """
     file_stats = get_files_for_package(directory, allow_git=allow_git)
 
     if validate and yaml_path not in file_stats:
@@ -74,26 +231,27 @@ def package_directory(
                 click.secho(f"* {warning}", err=True)
             click.secho(PACKAGE_SIZE_HELP, err=True)
             click.confirm("Continue packaging anyway?", default=True, abort=True, prompt_suffix="", err=True)
+    return file_stats
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".tgz", prefix="valohai-cli-") as fp:
-        package_files_into(fp, file_stats, progress=progress)
-        total_compressed_size = fp.tell()
 
-    if validate and total_compressed_size >= COMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD:
+def validate_compressed_size(total_compressed_size: int) -> None:
+    if total_compressed_size >= COMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD:
         raise PackageTooLarge(
             f"The total compressed size of the package is {filesizeformat(total_compressed_size)}, "
             f"which exceeds the threshold {filesizeformat(COMPRESSED_PACKAGE_SIZE_HARD_THRESHOLD)}",
         )
-    return fp.name
 
 
 def package_files_into(
     dest_fp: IO[bytes],
     file_stats: dict[str, PackageFileInfo],
     progress: bool = False,
-) -> None:
+    parallel_compression: bool | None = None,
+    compression: str = "gzip",
+    compression_level: int | None = None,
+) -> str:
     """
-    Package (gzipped tarball) files from `file_stats` (which is a dict mapping names within the package
+    Package (compressed tarball) files from `file_stats` (which is a dict mapping names within the package
     to their PackageFileInfo tuples) into the open writable binary file `dest_fp`.
 
     The dict could look like this:
@@ -107,14 +265,45 @@ def package_files_into(
     :param dest_fp: Target file descriptor
     :param file_stats: Dict of files to infos
     :param progress: Whether to show progress
-    :return:
+    :param parallel_compression: Whether to compress using multiple threads (for gzip).
+                                 If None, this is decided by the total size of the files.
+    :param compression: Compression format; one of the keys of `PACKAGE_FORMATS`.
+    :param compression_level: Compression level; if None, the format's default.
+    :return: SHA-256 checksum (hex string) of the data written into `dest_fp`
     """
 
     files = sorted(file_stats.keys())
+    # Hash the compressed data as it's written, so callers don't need to re-read the file for the checksum.
+    hashing_fp = HashingWriter(dest_fp)
+
+    if compression == "zstd":
+        compressed_fp = _get_zstd_writer(hashing_fp, level=compression_level)
+    elif compression == "gzip":
+        if parallel_compression is None:
+            total_size = sum(pfi.stat.st_size for pfi in file_stats.values())
+            parallel_compression = total_size >= PARALLEL_COMPRESSION_SIZE_THRESHOLD
+        compresslevel = 9 if compression_level is None else compression_level
+        # Manually creating the gzipfile to force mtime to 0.
+        if parallel_compression:
+            compressed_fp = ParallelGzipWriter(
+                hashing_fp,
+                filename="data.tar",
+                mtime=0,
+                compresslevel=compresslevel,
+            )
+        else:
+            compressed_fp = gzip.GzipFile(
+                "data.tar",
+                mode="w",
+                fileobj=hashing_fp,
+                mtime=0,
+                compresslevel=compresslevel,
+            )
+    else:
+        raise ValueError(f"Unknown package compression {compression!r}")
 
-    # Manually creating the gzipfile to force mtime to 0.
-    with gzip.GzipFile("data.tar", mode="w", fileobj=dest_fp, mtime=0) as gzf:  # noqa: SIM117
-        with tarfile.open(name="data.tar", mode="w", fileobj=gzf) as tarball:  # type: ignore[arg-type]
+    with compressed_fp:  # noqa: SIM117
+        with tarfile.open(name="data.tar", mode="w", fileobj=compressed_fp) as tarball:
             progress_bar = click.progressbar(
                 files,
                 show_pos=True,
@@ -130,9 +319,31 @@ def package_files_into(
                     if os.path.isfile(pfi.source_path):
                         tarball.add(name=pfi.source_path, arcname=file)
     dest_fp.flush()
+    return hashing_fp.hexdigest()
+
+
+def is_zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
 
 
-def _get_files_with_git(dir: str) -> Iterable[tuple[str, str]]:
+def _get_zstd_writer(dest_fp: HashingWriter, *, level: int | None) -> Any:
+    import zstandard
+
+    # Multithreaded zstd compression output does not depend on the number of threads,
+    # so identical trees always result in identical packages.
+    compressor = zstandard.ZstdCompressor(
+        level=(DEFAULT_ZSTD_LEVEL if level is None else level),
+        threads=-1,
+        write_checksum=True,
+    )
+    return compressor.stream_writer(dest_fp, closefd=False)  # type: ignore[arg-type]
+
+
+def _get_files_with_git(dir: str) -> Iterable[FileTuple]:
     paths_seen = set()
     commands = [
         "git ls-files --exclude-standard -ocz",
@@ -153,68 +364,132 @@ def _get_files_with_git(dir: str) -> Iterable[tuple[str, str]]:
             path = os.path.join(dir, file)
             if path not in paths_seen:
                 paths_seen.add(path)
-                yield (file, path)
+                yield (file, path, None)
 
 
-def _get_files_walk(dir: str) -> Iterable[tuple[str, str]]:
-    for dirpath, dirnames, filenames in os.walk(dir):
-        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
-        for filename in filenames:
-            if filename.startswith("."):
-                continue
-            filename = os.path.join(dirpath, filename)
-            file_abs_path = os.path.join(dir, filename)
-            file_rel_path = filename[len(dir) :].lstrip(os.sep)
-            yield (file_rel_path, file_abs_path)
+def get_git_fingerprint(dir: str, variant: str = "") -> str | None:
+    """
+    Get a fingerprint of the files `git ls-files` would find for packaging in the Git working copy `dir`,
+    without reading any file contents: the blob hashes of tracked files are taken from Git's index,
+    and for files that are modified or untracked (according to `git status`), their stat results are used.
 
+    If the fingerprint is unchanged, so are the files that would be packaged (give or take their mtimes).
 
-def _get_files_inner(dir: str, allow_git: bool = True) -> tuple[GitUsage, Iterable[tuple[str, str]]]:
-    # Inner, pre-vhignore-supporting generator function...
-    gitignore_path = os.path.join(dir, ".gitignore")
+    :param variant: Additional data to mix into the fingerprint (e.g. packaging settings).
+    :return: Fingerprint hex string, or None if `dir` is not a Git working copy
+             (or uses submodules, which aren't considered here).
+    """
+    if not os.path.exists(os.path.join(dir, ".git")) or os.path.exists(os.path.join(dir, ".gitmodules")):
+        return None
+    try:
+        index = check_git_output(["git", "ls-files", "--stage", "-z"], dir)
+        status = check_git_output(
+            ["git", "status", "--porcelain=v1", "-z", "--untracked-files=all", "--no-renames"],
+            dir,
+        )
+    except (subprocess.CalledProcessError, NoGitRepo, OSError):
+        return None
+
+    hasher = hashlib.sha256(f"{variant}\n".encode())
+    hasher.update(index)
+    # .vhignore may well be ignored by Git, so always check it separately.
+    changed_paths = [b".vhignore"]
+    changed_paths.extend(entry[3:] for entry in status.split(b"\0") if entry)
+    for path in changed_paths:
+        try:
+            stat = os.lstat(os.path.join(os.fsencode(dir), path))
+            stat_bit = f"{stat.st_size}:{stat.st_mtime_ns}:{stat.st_mode}"
+        except OSError:
+            stat_bit = "-"
+        hasher.update(b"\0%s\0%s" % (path, stat_bit.encode()))
+    return hasher.hexdigest()
+
+
+def _get_files_walk(dir: str, ignore_matchers: Sequence[IgnoreMatcher] = ()) -> Iterable[FileTuple]:
+    yield from _scandir_walk(dir, "", ignore_matchers)
+
+
+def _scandir_walk(dir: str, rel_dir: str, ignore_matchers: Sequence[IgnoreMatcher]) -> Iterator[FileTuple]:
+    # Like `os.walk()` (not following symlinked directories and ignoring errors),
+    # but yielding the `DirEntry`s so their (possibly cached) stat results can be reused.
+    # Ignored directories are pruned before descending into them.
+    try:
+        with os.scandir(os.path.join(dir, rel_dir)) as scandir_it:
+            entries = list(scandir_it)
+    except OSError:
+        return
+    subdirs = []
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+        if is_dir:
+            if not entry.is_symlink() and not any(m.is_ignored_dir(rel_path) for m in ignore_matchers):
+                subdirs.append(rel_path)
+            continue
+        if any(m.is_ignored_file(rel_path) for m in ignore_matchers):
+            continue
+        yield (rel_path, entry.path, entry)
+    for subdir in subdirs:
+        yield from _scandir_walk(dir, subdir, ignore_matchers)
 
+
+def _read_ignore_file(path: str) -> IgnoreMatcher | None:
+    if not os.path.isfile(path):
+        return None
+    with open(path) as ignore_file:
+        rules = list(gitignorant.parse_gitignore_file(ignore_file))
+    return IgnoreMatcher(rules) if rules else None
+
+
+def _get_files_inner(
+    dir: str,
+    allow_git: bool = True,
+    ignore_matchers: Sequence[IgnoreMatcher] = (),
+) -> tuple[GitUsage, Iterable[FileTuple]]:
+    # Inner, pre-vhignore-supporting generator function...
     if allow_git:
         if os.path.exists(os.path.join(dir, ".git")):
             # We have .git, so we can try to use Git to figure out a file list of nonignored files
             try:
-                return (GitUsage.GIT_LS_FILES, _get_files_with_git(dir))  # return the generator
-            except subprocess.CalledProcessError as cpe:
-                warn(
-                    f".git exists, but we could not use git ls-files (error {cpe.returncode}), falling back to non-git",
-                )
-
-        # Limited support of .gitignore even without git
-        if os.path.exists(gitignore_path):
-            with open(gitignore_path) as gitignore_file:
-                gitignore_rules = list(gitignorant.parse_gitignore_file(gitignore_file))
-            if gitignore_rules:
                 return (
-                    GitUsage.GITIGNORE_WITHOUT_GIT,
+                    GitUsage.GIT_LS_FILES,
                     (
                         p
-                        for p in _get_files_walk(dir)
-                        if not gitignorant.check_path_match(gitignore_rules, p[0])
+                        for p in _get_files_with_git(dir)
+                        if not any(m.check_path_match(p[0]) for m in ignore_matchers)
                     ),
                 )
+            except subprocess.CalledProcessError as cpe:
+                warn(
+                    f".git exists, but we could not use git ls-files (error {cpe.returncode}), falling back to non-git",
+                )
 
-    return (GitUsage.NONE, _get_files_walk(dir))  # return the generator
+        # Limited support of .gitignore even without git
+        gitignore_matcher = _read_ignore_file(os.path.join(dir, ".gitignore"))
+        if gitignore_matcher:
+            return (
+                GitUsage.GITIGNORE_WITHOUT_GIT,
+                _get_files_walk(dir, (gitignore_matcher, *ignore_matchers)),
+            )
 
+    return (GitUsage.NONE, _get_files_walk(dir, ignore_matchers))  # return the generator
 
-def _get_files(dir: str, allow_git: bool = True) -> tuple[GitUsage, VhIgnoreUsage, Iterable[tuple[str, str]]]:
-    git_usage, ftup_gen = _get_files_inner(dir, allow_git=allow_git)
-    vhignore_path = os.path.join(dir, ".vhignore")
 
-    if os.path.isfile(vhignore_path):
-        with open(vhignore_path) as vhignore_file:
-            vhignore_rules = list(gitignorant.parse_gitignore_file(vhignore_file))
-        if vhignore_rules:
-            return (
-                git_usage,
-                VhIgnoreUsage.VHIGNORE,
-                (p for p in ftup_gen if not gitignorant.check_path_match(vhignore_rules, p[0])),
-            )
+def _get_files(dir: str, allow_git: bool = True) -> tuple[GitUsage, VhIgnoreUsage, Iterable[FileTuple]]:
+    vhignore_matcher = _read_ignore_file(os.path.join(dir, ".vhignore"))
+    git_usage, ftup_gen = _get_files_inner(
+        dir,
+        allow_git=allow_git,
+        ignore_matchers=((vhignore_matcher,) if vhignore_matcher else ()),
+    )
     return (
         git_usage,
-        VhIgnoreUsage.NONE,
+        (VhIgnoreUsage.VHIGNORE if vhignore_matcher else VhIgnoreUsage.NONE),
         ftup_gen,
     )
 
@@ -250,16 +525,29 @@ def get_files_for_package(
 
     info(_get_packaging_info_message(len(files_and_paths), git_usage, vhignore_usage))
 
+    if len(files_and_paths) > PARALLEL_STAT_FILE_COUNT_THRESHOLD:
+        with ThreadPoolExecutor(max_workers=PARALLEL_STAT_MAX_WORKERS) as executor:
+            stats = list(executor.map(_stat_file, files_and_paths))
+    else:
+        stats = [_stat_file(ftup) for ftup in files_and_paths]
+
     output_stats = {}
-    for file, file_path in files_and_paths:
-        try:
-            output_stats[file] = PackageFileInfo(source_path=file_path, stat=os.stat(file_path))
-        except FileNotFoundError:
+    for (file, file_path, _entry), stat in zip(files_and_paths, stats):
+        if stat is None:
             # A file was reported by git-ls but not found on disk - don't try to package it.
-            pass
+            continue
+        output_stats[file] = PackageFileInfo(source_path=file_path, stat=stat)
     return output_stats
 
 
+def _stat_file(ftup: FileTuple) -> os.stat_result | None:
+    _file, file_path, entry = ftup
+    try:
+        return entry.stat() if entry is not None else os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+
 def _get_packaging_info_message(count: int, git_usage: GitUsage, vhignore_usage: VhIgnoreUsage) -> str:
     and_vhignore_bit = " (with .vhignore)" if vhignore_usage == VhIgnoreUsage.VHIGNORE else ""
     if git_usage == GitUsage.GIT_LS_FILES:
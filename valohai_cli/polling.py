@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import datetime
+import email.utils
+import random
+import time
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from requests import Response
+
+from valohai_cli.exceptions import APIError
+from valohai_cli.settings import settings
+
+T = TypeVar("T")
+
+# Default (minimum, maximum) intervals between polls of each command, in seconds
+DEFAULT_POLL_INTERVALS: dict[str, tuple[float, float]] = {
+    "logs": (1.0, 10.0),
+    "watch": (1.0, 10.0),
+    "outputs": (1.0, 15.0),
+}
+
+# Factor by which the interval grows after each poll where nothing changed
+POLL_BACKOFF = 2.0
+
+# Waits are randomized by up to this fraction, so clients started together don't poll in lockstep
+POLL_JITTER = 0.1
+
+# Response statuses with which the server asks us to slow down
+THROTTLED_STATUS_CODES = {429, 503}
+
+MAX_THROTTLED_RETRIES = 10
+
+
+def parse_retry_after(value: str | None, now: datetime.datetime | None = None) -> float | None:
+    """
+    Parse a `Retry-After` header value (a number of seconds or an HTTP date) into a delay in seconds.
+
+    :return: The delay, or None if the value is missing or invalid.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+class Poller:
+    """
+    Paces a polling loop.
+
+    The interval between polls starts at `min_interval`. It grows `backoff` times after every poll
+    where nothing changed, up to `max_interval`, and goes back to `min_interval` when something does.
+    Requests the server throttles are retried, no sooner than its `Retry-After` header asks for.
+    All waits are jittered.
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        *,
+        backoff: float = POLL_BACKOFF,
+        jitter: float | None = None,
+    ) -> None:
+        self.min_interval = max(0.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff = backoff
+        self.jitter = POLL_JITTER if jitter is None else jitter
+        self.interval = self.min_interval
+        self.retry_after: float | None = None  # Delay before the next poll requested by the server
+
+    @classmethod
+    def for_command(cls, command: str) -> Poller:
+        """
+        Get a poller with the interval settings of `command` (see `Settings.get_poll_intervals()`).
+        """
+        return cls(*settings.get_poll_intervals(command, default=DEFAULT_POLL_INTERVALS[command]))
+
+    def update(self, changed: bool) -> None:
+        """
+        Record the outcome of a poll: whether anything changed since the previous one.
+        """
+        self.interval = self.min_interval if changed else min(self.interval * self.backoff, self.max_interval)
+
+    def throttle(self, response: Response) -> None:
+        """
+        Record that the server throttled a request.
+        """
+        self.retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        self.update(changed=False)
+
+    def get_delay(self) -> float:
+        delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.retry_after is not None:
+            # Never sooner than requested
+            delay = max(delay, self.retry_after * random.uniform(1, 1 + self.jitter))
+        return delay
+
+    def wait(self) -> float:
+        """
+        Wait until it's time for the next poll.
+
+        :return: The time waited, in seconds.
+        """
+        delay = self.get_delay()
+        self.retry_after = None
+        time.sleep(delay)
+        return delay
+
+    def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Call `func`, which makes API requests, retrying it whenever the server throttles them.
+        """
+        retries = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except APIError as ae:
+                if ae.response.status_code not in THROTTLED_STATUS_CODES or retries >= MAX_THROTTLED_RETRIES:
+                    raise
+                self.throttle(ae.response)
+            retries += 1
+            self.wait()
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import tempfile
+import time
+from typing import Any
+
+import click
+
+from valohai_cli.api import request
+from valohai_cli.exceptions import APIConnectionError, APIError, APINotFoundError, CLIException
+from valohai_cli.messages import info, warn
+from valohai_cli.models.project import Project
+from valohai_cli.settings.paths import get_cache_dir_name
+from valohai_cli.transfer import get_transfer_scheduler
+from valohai_cli.utils.file_size_format import filesizeformat
+
+RESUMABLE_UPLOAD_SIZE_THRESHOLD = 32 * 1024 * 1024
+RESUMABLE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_RETRIES = 3
+CHUNK_RETRY_DELAY = 1.0
+
+
+class UploadStalled(CLIException):
+    pass
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """
+    Check whether a failed upload request is worth retrying (a connection or server error).
+    """
+    if isinstance(exc, APIError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, APIConnectionError)
+
+
+class UploadJournal:
+    """
+    Persisted state of resumable upload sessions, so an interrupted upload
+    can be continued by a later invocation.
+
+    Sessions are keyed by the project and the SHA-256 checksum of the uploaded file,
+    and stored as `<project_id>-<sha256>.json` files.
+    """
+
+    def __init__(self, directory: str | None = None) -> None:
+        self.directory = directory or get_cache_dir_name("uploads")
+
+    def _get_path(self, project_id: str, sha256: str) -> str:
+        return os.path.join(self.directory, f"{project_id}-{sha256}.json")
+
+    def get(self, project_id: str, sha256: str) -> dict[str, Any] | None:
+        try:
+            with open(self._get_path(project_id, sha256)) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) and data.get("upload_id") else None
+
+    def put(self, project_id: str, sha256: str, data: dict[str, Any]) -> None:
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as fp:
+            json.dump(data, fp)
+        os.replace(fp.name, self._get_path(project_id, sha256))
+
+    def remove(self, project_id: str, sha256: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._get_path(project_id, sha256))
+
+    def clear(self) -> list[str]:
+        """
+        Forget all upload sessions, so uploads start over.
+
+        :return: Paths of the removed session files.
+        """
+        removed = []
+        with contextlib.suppress(FileNotFoundError):
+            for dir_entry in os.scandir(self.directory):
+                if dir_entry.name.endswith(".json"):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(dir_entry.path)
+                        removed.append(dir_entry.path)
+        return removed
+
+
+class ResumableUpload:
+    """
+    Upload a file to the project's `import-package` endpoint in chunks,
+    resuming an earlier interrupted upload session of the same file if there is one.
+
+    The upload session protocol is
+
+    * `POST import-package/uploads/` (with the file's name, size and checksum) creates a session,
+    * `GET import-package/uploads/<id>/` returns the number of bytes the server has (`offset`),
+    * `PUT import-package/uploads/<id>/` with a `Content-Range` header stores a chunk,
+    * `POST import-package/uploads/<id>/complete/` creates the commit from the uploaded file.
+    """
+
+    def __init__(
+        self,
+        *,
+        project: Project,
+        path: str,
+        sha256: str,
+        filename: str,
+        content_type: str,
+        fields: dict[str, str],
+        journal: UploadJournal | None = None,
+        chunk_size: int | None = None,
+    ) -> None:
+        self.project = project
+        self.path = path
+        self.sha256 = sha256
+        self.size = os.stat(path).st_size
+        self.filename = filename
+        self.content_type = content_type
+        self.fields = fields
+        self.journal = journal or UploadJournal()
+        self.chunk_size = chunk_size or RESUMABLE_UPLOAD_CHUNK_SIZE
+        self.base_url = f"/api/v0/projects/{project.id}/import-package/uploads/"
+
+    def _get_session_url(self, upload_id: str) -> str:
+        return f"{self.base_url}{upload_id}/"
+
+    def _create_session(self) -> tuple[str, int]:
+        session = request(
+            "post",
+            self.base_url,
+            json={
+                **self.fields,
+                "filename": self.filename,
+                "content_type": self.content_type,
+                "size": self.size,
+                "sha256": self.sha256,
+            },
+        ).json()
+        return (str(session["id"]), int(session.get("offset", 0)))
+
+    def _get_server_offset(self, upload_id: str) -> int:
+        return int(request("get", self._get_session_url(upload_id)).json()["offset"])
+
+    def _resume_session(self) -> tuple[str, int] | None:
+        state = self.journal.get(self.project.id, self.sha256)
+        if not state or state.get("size") != self.size:
+            return None
+        upload_id = state["upload_id"]
+        try:
+            offset = self._get_server_offset(upload_id)
+        except APINotFoundError:  # The session has expired on the server
+            return None
+        info(f"Resuming earlier upload at {filesizeformat(offset)} of {filesizeformat(self.size)}")
+        return (upload_id, offset)
+
+    def _save_state(self, upload_id: str, offset: int) -> None:
+        self.journal.put(
+            self.project.id,
+            self.sha256,
+            {"upload_id": upload_id, "size": self.size, "offset": offset},
+        )
+
+    def _send_chunk(self, upload_id: str, offset: int, chunk: bytes) -> int:
+        end = offset + len(chunk) - 1
+        resp = request(
+            "put",
+            self._get_session_url(upload_id),
+            data=chunk,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Content-Range": f"bytes {offset}-{end}/{self.size}",
+            },
+        )
+        return int(resp.json()["offset"])
+
+    def _warn_interrupted(self, offset: int) -> None:
+        warn(
+            f"Upload interrupted at {filesizeformat(offset)} of {filesizeformat(self.size)}; "
+            f"run the command again to resume it.",
+        )
+
+    def upload(self) -> dict[str, Any]:  # noqa: C901
+        """
+        Upload the file and create the commit.
+
+        Chunks that fail with a connection or server error, or that the server does not take,
+        are retried with an exponential backoff, up to `MAX_CHUNK_RETRIES` times in a row.
+        If the upload is interrupted (and retrying does not help), the session is left in the journal,
+        and the next upload of the same file to the same project continues from where this one left off.
+
+        :return: Commit response object from API
+        """
+        upload_id, offset = self._resume_session() or self._create_session()
+        self._save_state(upload_id, offset)
+        retries = 0
+        prog = click.progressbar(length=self.size, width=0)  # type: ignore[var-annotated]
+        transfer_ctx = get_transfer_scheduler().transfer(self.filename, total=self.size - offset)
+        with open(self.path, "rb") as fp, prog, transfer_ctx as transfer:
+            prog.update(offset)
+            while offset < self.size:
+                fp.seek(offset)
+                chunk = fp.read(self.chunk_size)
+                try:
+                    new_offset = self._send_chunk(upload_id, offset, chunk)
+                except (APIConnectionError, APIError) as exc:
+                    if not is_retryable_error(exc):
+                        raise
+                    if retries >= MAX_CHUNK_RETRIES:
+                        self._warn_interrupted(offset)
+                        raise
+                    time.sleep(CHUNK_RETRY_DELAY * 2**retries)
+                    retries += 1
+                    # The chunk may or may not have been stored; ask the server where to continue from.
+                    try:
+                        new_offset = self._get_server_offset(upload_id)
+                    except (APIConnectionError, APIError) as exc:
+                        if not is_retryable_error(exc):
+                            raise
+                        continue
+                    if new_offset <= offset:
+                        continue
+                else:
+                    if new_offset <= offset:  # The server did not take the chunk
+                        if retries >= MAX_CHUNK_RETRIES:
+                            self._warn_interrupted(offset)
+                            raise UploadStalled(f"The upload is not progressing (at offset {offset}).")
+                        time.sleep(CHUNK_RETRY_DELAY * 2**retries)
+                        retries += 1
+                        continue
+                retries = 0
+                # Only the bytes the server has acknowledged count as transferred
+                transfer.update(new_offset - offset)
+                prog.update(new_offset - offset)
+                offset = new_offset
+                self._save_state(upload_id, offset)
+        commit_obj: dict[str, Any] = request("post", f"{self._get_session_url(upload_id)}complete/").json()
+        self.journal.remove(self.project.id, self.sha256)
+        return commit_obj
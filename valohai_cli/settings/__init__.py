@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import os
 import warnings
 from typing import TYPE_CHECKING, Any
 
+from valohai_cli.consts import default_log_archive_max_size, default_package_cache_max_size
 from valohai_cli.exceptions import APINotFoundError
 from valohai_cli.messages import error, info
 from valohai_cli.utils import walk_directory_parents
@@ -37,6 +39,21 @@ class Settings:
             return self.overrides[key]
         return self.persistence.get(key, default)
 
+    def _get_configurable(self, key: str, default: Any = None) -> Any | None:
+        """
+        Get a setting that may also be overridden by a `VALOHAI_<KEY>` environment variable.
+        """
+        env_value = os.environ.get(f"VALOHAI_{key.upper()}")
+        if env_value is not None:
+            return env_value
+        return self._get(key, default)
+
+    def _get_configurable_bool(self, key: str, default: bool = False) -> bool:
+        value = self._get_configurable(key, default)
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+
     @property
     def table_format(self) -> str:
         warnings.warn(
@@ -85,6 +102,85 @@ class Settings:
         """
         return self._get("token")
 
+    @property
+    def package_cache_max_size(self) -> int:
+        """
+        Maximum total size of the local ad-hoc package cache, in bytes. 0 disables the cache.
+        """
+        return int(self._get_configurable("package_cache_max_size", default=default_package_cache_max_size))  # type: ignore[arg-type]
+
+    @property
+    def package_compression(self) -> str:
+        """
+        The preferred compression format for ad-hoc packages ("gzip" or "zstd").
+        Formats other than gzip are only used if the server supports them.
+        """
+        return str(self._get_configurable("package_compression", default="gzip")).lower()
+
+    @property
+    def package_compression_level(self) -> int | None:
+        """
+        The compression level for ad-hoc packages, or None for the format's default.
+        """
+        value = self._get_configurable("package_compression_level")
+        return int(value) if value not in (None, "") else None
+
+    @property
+    def stream_adhoc_upload(self) -> bool:
+        """
+        Whether to stream ad-hoc packages directly into the upload, instead of creating a temporary file first.
+        """
+        return self._get_configurable_bool("stream_adhoc_upload")
+
+    @property
+    def resumable_adhoc_upload(self) -> bool:
+        """
+        Whether to upload large ad-hoc packages in chunks, so interrupted uploads can be resumed.
+        """
+        return self._get_configurable_bool("resumable_adhoc_upload")
+
+    @property
+    def transfer_max_bandwidth(self) -> int | None:
+        """
+        Total bandwidth limit for uploads and downloads in bytes per second (e.g. `500k` or `2M`), or None.
+        """
+        from valohai_cli.transfer import parse_bandwidth
+
+        return parse_bandwidth(self._get_configurable("transfer_max_bandwidth"))
+
+    @property
+    def transfer_max_concurrency(self) -> int | None:
+        """
+        Maximum number of simultaneous uploads and downloads, or None for no limit.
+        """
+        value = self._get_configurable("transfer_max_concurrency")
+        return int(value) or None if value not in (None, "") else None
+
+    @property
+    def output_link_mode(self) -> str:
+        """
+        How to reuse earlier downloaded copies of execution outputs ("reflink" or "copy"; or "hardlink",
+        which makes the copies share their contents, so modifying one modifies all of them),
+        or "off" to always download them. Modes fall back to the next ones if they aren't supported.
+        """
+        return str(self._get_configurable("output_link_mode", default="reflink")).lower()
+
+    @property
+    def log_archive_max_size(self) -> int:
+        """
+        Maximum total size of the local archive of execution logs, in bytes. 0 disables the archive.
+        """
+        return int(self._get_configurable("log_archive_max_size", default=default_log_archive_max_size))  # type: ignore[arg-type]
+
+    def get_poll_intervals(self, command: str, default: tuple[float, float]) -> tuple[float, float]:
+        """
+        The minimum and maximum interval between API polls of `command` (e.g. "logs"), in seconds,
+        configurable as `<command>_poll_min_interval` and `<command>_poll_max_interval`.
+        """
+        min_interval = self._get_configurable(f"{command}_poll_min_interval", default=default[0])
+        max_interval = self._get_configurable(f"{command}_poll_max_interval", default=default[1])
+        return (float(min_interval), float(max_interval))  # type: ignore[arg-type]
+
     @property
     def links(self) -> dict:
         """
@@ -25,3 +25,28 @@ def get_settings_file_name(name: str) -> str:
         if not os.path.isdir(path):
             os.makedirs(path, 0o700)
     return os.path.join(path, name)
+
+
+def get_cache_root_path() -> str:  # pragma: no cover
+    if sys.platform == "win32":
+        return os.path.normpath(os.environ["LOCALAPPDATA"])
+    elif sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/")
+    else:
+        return os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+
+
+def get_cache_dir_name(name: str) -> str:
+    """
+    Get the path to a (created-on-demand) directory in the user's cache directory.
+    """
+    path = os.environ.get("VALOHAI_CACHE_DIR")
+    if path:
+        if not os.path.isdir(path):
+            raise ValueError(f"Directory {path} does not exist")
+    else:
+        path = os.path.join(get_cache_root_path(), "valohai-cli")
+    path = os.path.join(path, name)
+    if not os.path.isdir(path):
+        os.makedirs(path, 0o700)
+    return path
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import contextlib
+import re
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Generator
+
+from valohai_cli.settings import settings
+
+SIZE_SUFFIXES = {"": 1, "k": 1000, "m": 1000**2, "g": 1000**3}
+
+# Number of finished transfers whose statistics are kept around
+MAX_COMPLETED_TRANSFERS = 1000
+
+
+def parse_bandwidth(value: str | int | float | None) -> int | None:
+    """
+    Parse a bandwidth limit (bytes per second) such as `500000`, `500k` or `2M`.
+
+    :return: The limit in bytes per second, or None for no limit.
+    """
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) or None
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*$", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid bandwidth limit {value!r}")
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).lower()]) or None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket limiting throughput to `rate` tokens (bytes) per second,
+    with bursts of up to `capacity` tokens.
+
+    Consumers that go over the limit reserve their tokens anyway and sleep until they would have had them,
+    so large requests are never starved by smaller ones.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float | None = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: float) -> float:
+        """
+        Take `amount` tokens from the bucket, blocking until they're available.
+
+        :return: The time slept, in seconds
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class Transfer:
+    """
+    Statistics of a single transfer; see `TransferScheduler.transfer()`.
+    """
+
+    def __init__(self, scheduler: TransferScheduler, name: str, total: int | None = None) -> None:
+        self.scheduler = scheduler
+        self.name = name
+        self.total = total
+        self.bytes = 0
+        self.throttled_time = 0.0
+        self.start_time = scheduler.clock()
+        self.end_time: float | None = None
+
+    def update(self, n_bytes: int) -> None:
+        """
+        Account for `n_bytes` transferred, blocking if the bandwidth limit has been reached.
+        """
+        if n_bytes <= 0:
+            return
+        self.bytes += n_bytes
+        if self.scheduler.bucket:
+            self.throttled_time += self.scheduler.bucket.consume(n_bytes)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end_time if self.end_time is not None else self.scheduler.clock()) - self.start_time
+
+    @property
+    def throughput(self) -> float:
+        """
+        Average throughput of the transfer so far, in bytes per second.
+        """
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return f"<Transfer {self.name!r}: {self.bytes} bytes in {self.elapsed:.2f}s>"
+
+
+class TransferScheduler:
+    """
+    Coordinates bulk transfers (uploads, downloads and exports) within the process,
+    so they share a bandwidth limit and a cap on the number of simultaneous transfers.
+
+    :param max_bandwidth: Total bandwidth limit in bytes per second, or None for no limit
+    :param max_concurrency: Maximum number of simultaneous transfers, or None for no limit
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bandwidth: int | None = None,
+        max_concurrency: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.max_bandwidth = max_bandwidth or None
+        self.max_concurrency = max_concurrency or None
+        self.clock = clock
+        self.bucket = TokenBucket(max_bandwidth, clock=clock, sleep=sleep) if max_bandwidth else None
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.completed: deque[Transfer] = deque(maxlen=MAX_COMPLETED_TRANSFERS)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def transfer(self, name: str, total: int | None = None) -> Generator[Transfer, None, None]:
+        """
+        Run a transfer, waiting for a free slot first if the concurrency cap has been reached.
+
+        The body should call `update()` on the yielded `Transfer` for every chunk of data it moves.
+        """
+        if self.semaphore:
+            self.semaphore.acquire()
+        try:
+            transfer = Transfer(self, name, total=total)
+            try:
+                yield transfer
+            finally:
+                transfer.end_time = self.clock()
+                with self.lock:
+                    self.completed.append(transfer)
+        finally:
+            if self.semaphore:
+                self.semaphore.release()
+
+
+_scheduler: TransferScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_transfer_scheduler() -> TransferScheduler:
+    """
+    Get the process-wide transfer scheduler, configured by the `transfer_max_bandwidth`
+    and `transfer_max_concurrency` settings (or the equivalent `VALOHAI_` environment variables).
+    """
+    global _scheduler
+    with _scheduler_lock:
+        max_bandwidth = settings.transfer_max_bandwidth
+        max_concurrency = settings.transfer_max_concurrency
+        if (
+            _scheduler is None
+            or _scheduler.max_bandwidth != max_bandwidth
+            or _scheduler.max_concurrency != max_concurrency
+        ):
+            _scheduler = TransferScheduler(max_bandwidth=max_bandwidth, max_concurrency=max_concurrency)
+        return _scheduler
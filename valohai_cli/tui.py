@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import math
 import shutil
+import sys
 import time
 from typing import Any, Callable
 
@@ -14,8 +15,15 @@ class LayoutElement:
     style: dict[str, Any] = {}
     layout: Layout
 
+    def render(self) -> list[str]:
+        """
+        Render the element into (styled) lines.
+        """
+        raise NotImplementedError(f"{self.__class__} must implement render()")
+
     def draw(self) -> None:
-        raise NotImplementedError(f"{self.__class__} must implement draw()")
+        for line in self.render():
+            click.echo(line)
 
 
 class Divider(LayoutElement):
@@ -31,9 +39,9 @@ class Divider(LayoutElement):
         self.ch = force_text(ch)
         self.style = style or {}
 
-    def draw(self) -> None:
+    def render(self) -> list[str]:
         chs = (self.ch * int(math.ceil(self.layout.width / len(self.ch))))[: self.layout.width]
-        click.echo(click.style(chs, **self.style))
+        return [click.style(chs, **self.style)]
 
 
 class Flex(LayoutElement):
@@ -76,9 +84,9 @@ class Flex(LayoutElement):
         })
         return self
 
-    def draw(self) -> None:
+    def render(self) -> list[str]:
         if not self.cells:
-            return
+            return []
         total_flex = sum(cell["flex"] for cell in self.cells)
         static_width = sum(len(cell["content"]) for cell in self.cells if cell["flex"] <= 0)
         available_width = self.layout.width - static_width
@@ -97,7 +105,7 @@ class Flex(LayoutElement):
             style = dict(self.style, **cell["style"])
             row.append(click.style(aligned_content, reset=True, **style))
             used_width += width
-        click.echo("".join(row))
+        return ["".join(row)]
 
 
 class Layout:
@@ -121,6 +129,12 @@ class Layout:
         self.rows.append(element)
         return self
 
+    def render(self) -> list[str]:
+        """
+        Render the Layout into (styled) lines.
+        """
+        return [line for element in self.rows for line in element.render()]
+
     def draw(self) -> None:
         """
         Draw the Layout onto screen.
@@ -130,5 +144,101 @@ class Layout:
             element.draw()
 
 
+class FrameRenderer:
+    """
+    Draws successive frames (Layouts) onto the terminal, writing only what changed since the previous frame.
+
+    The first frame, and the first one after the terminal is resized, clears the screen and is drawn in full.
+    After that, lines that moved up (such as a scrolling log) are scrolled within a scroll region,
+    and only the lines that still differ are rewritten, so the bytes written per frame are proportional
+    to what changed rather than to the size of the screen.
+
+    When the output is not a terminal, frames are simply printed one after another.
+    """
+
+    def __init__(self, *, scroll: bool | None = None) -> None:
+        """
+        :param scroll: Whether to scroll moved lines, instead of rewriting them.
+                       By default, not on Windows, whose legacy console doesn't support scroll regions.
+        """
+        self.scroll = (sys.platform != "win32") if scroll is None else scroll
+        self.lines: list[str] | None = None
+        self.size: tuple[int, int] | None = None
+
+    def reset(self) -> None:
+        """
+        Make the next frame be drawn in full.
+        """
+        self.lines = None
+
+    def draw(self, layout: Layout) -> None:
+        layout.width, layout.height = shutil.get_terminal_size()
+        lines = layout.render()
+        if not sys.stdout.isatty():
+            for line in lines:
+                click.echo(line)
+            return
+        update = self.get_update(lines, (layout.width, layout.height))
+        if update:
+            click.echo(update, nl=False)
+
+    def get_update(self, lines: list[str], size: tuple[int, int]) -> str:
+        """
+        Get the control sequences and text that turn the previous frame into one with `lines`.
+
+        :param size: The size of the terminal (columns, rows); when it changes, the frame is redrawn in full.
+        """
+        screen = self.lines
+        self.lines, size_before, self.size = list(lines), self.size, size
+        if screen is None or size != size_before:
+            return "\x1b[H\x1b[2J" + "\r\n".join(lines) + _move_to(len(lines))
+        parts = []
+        scroll = _find_scroll(screen, lines) if self.scroll else None
+        if scroll:
+            top, bottom, shift = scroll
+            # Line feeds at the bottom margin of the scroll region scroll it up
+            parts.append(f"\x1b[{top + 1};{bottom + 1}r{_move_to(bottom)}" + "\n" * shift + "\x1b[r")
+            screen = screen[:top] + screen[top + shift : bottom + 1] + [""] * shift + screen[bottom + 1 :]
+        for row in range(max(len(screen), len(lines))):
+            line = lines[row] if row < len(lines) else ""
+            if line != (screen[row] if row < len(screen) else ""):
+                parts.append(f"{_move_to(row)}\x1b[2K{line}")
+        if parts:
+            parts.append(_move_to(len(lines)))
+        return "".join(parts)
+
+
+def _move_to(row: int) -> str:
+    return f"\x1b[{row + 1};1H"
+
+
+def _find_scroll(old: list[str], new: list[str]) -> tuple[int, int, int] | None:
+    """
+    Find the scroll (of a region of `old` up by some lines) that leaves the fewest lines to rewrite for `new`.
+
+    :return: The first and last row of the scroll region and the number of lines to scroll it by, if worth it.
+    """
+    best = None
+    best_gain = 0
+    for shift in range(1, len(old)):
+        n_rows = min(len(new), len(old) - shift)
+        start = None
+        for row in range(n_rows + 1):
+            if row < n_rows and new[row] == old[row + shift]:
+                if start is None:
+                    start = row
+                continue
+            if start is not None:
+                end = row - 1
+                # Rows the scroll fixes, minus rows it blanks that were fine already
+                gain = sum(new[i] != old[i] for i in range(start, end + 1)) - sum(
+                    bool(new[i]) and new[i] == old[i] for i in range(end + 1, min(end + shift + 1, len(new)))
+                )
+                if gain > best_gain:
+                    best, best_gain = (start, end + shift, shift), gain
+                start = None
+    return best
+
+
 def get_spinner_character() -> str:
     return "|/-\\"[int(time.time() * 3) % 4]
@@ -1,18 +1,55 @@
+from __future__ import annotations
+
 import hashlib
-from typing import BinaryIO
+from typing import IO, BinaryIO
 
 
 def get_fp_sha256(fp: BinaryIO) -> str:
     """
     Get the SHA-256 checksum of the data in the file `fp`.
 
+    :return: hex string
+    """
+    return get_fp_hexdigest(fp, "sha256")
+
+
+def get_fp_hexdigest(fp: BinaryIO, algorithm: str) -> str:
+    """
+    Get the checksum of the data in the file `fp` using the `hashlib` algorithm `algorithm`.
+
     :return: hex string
     """
     fp.seek(0)
-    hasher = hashlib.sha256()
+    hasher = hashlib.new(algorithm)
     while True:
         chunk = fp.read(524288)
         if not chunk:
             break
         hasher.update(chunk)
     return hasher.hexdigest()
+
+
+class HashingWriter:
+    """
+    Write-only file-like wrapper that computes the SHA-256 checksum
+    of all data written through it into the wrapped file `fp`.
+    """
+
+    def __init__(self, fp: IO[bytes]) -> None:
+        self.fp = fp
+        self.hasher = hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        self.hasher.update(data)
+        self.bytes_written += len(data)
+        return self.fp.write(data)
+
+    def flush(self) -> None:
+        self.fp.flush()
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def hexdigest(self) -> str:
+        return self.hasher.hexdigest()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import os
+import re
+from collections.abc import Iterable
+
+import gitignorant
+from gitignorant import Rule
+
+specials_re = re.compile(r"[*?\[\]]")
+
+# `gitignorant.compile_pattern()` wraps the pattern body in these
+PATTERN_PREFIX = "(?:^|/)"
+PATTERN_SUFFIX = "$"
+
+
+def _get_pattern_body(pat: str) -> str | None:
+    pattern = gitignorant.compile_pattern(pat).pattern
+    if pattern.startswith(PATTERN_PREFIX) and pattern.endswith(PATTERN_SUFFIX):
+        return pattern[len(PATTERN_PREFIX) : -len(PATTERN_SUFFIX)]
+    return None  # pragma: no cover
+
+
+class _RuleRun:
+    """
+    A run of consecutive rules of the same polarity, matched all at once.
+
+    Since within a run it doesn't matter which of the rules matches, literal patterns are looked up
+    from sets and the rest are merged into a single regular expression.
+    """
+
+    def __init__(self, negative: bool) -> None:
+        self.negative = negative
+        self.exact_paths: set[str] = set()
+        self.names: set[str] = set()
+        self.anchored_bodies: list[str] = []
+        self.unanchored_bodies: list[str] = []
+        self.fallback_rules: list[Rule] = []
+        self.regex: re.Pattern[str] | None = None
+
+    def add(self, rule: Rule, pat: str, *, anchor: bool) -> None:
+        if not specials_re.search(pat):
+            if anchor:
+                self.exact_paths.add(pat)
+                return
+            if "/" not in pat:
+                self.names.add(pat)
+                return
+        body = _get_pattern_body(pat)
+        if body is None:  # pragma: no cover
+            self.fallback_rules.append(rule)
+        elif anchor:
+            self.anchored_bodies.append(body)
+        else:
+            self.unanchored_bodies.append(body)
+
+    def compile(self) -> None:
+        parts = []
+        if self.anchored_bodies:
+            parts.append(f"^(?:{'|'.join(self.anchored_bodies)})$")
+        if self.unanchored_bodies:
+            parts.append(f"{PATTERN_PREFIX}(?:{'|'.join(self.unanchored_bodies)})$")
+        self.regex = re.compile("|".join(parts)) if parts else None
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        if path in self.exact_paths:
+            return True
+        if self.names and path.rpartition("/")[2] in self.names:
+            return True
+        if self.regex and self.regex.search(path):
+            return True
+        return any(rule.matches(path, is_dir) for rule in self.fallback_rules)
+
+
+def _compile_runs(rules: Iterable[Rule], *, is_dir: bool) -> list[_RuleRun]:
+    runs: list[_RuleRun] = []
+    for rule in rules:
+        # This mirrors the logic in `gitignorant.Rule.matches()`.
+        pat = rule.content
+        if pat.endswith("/"):
+            if not is_dir:
+                continue
+            pat = pat.rstrip("/")
+        if pat.startswith("/"):
+            anchor = True
+            pat = pat[1:]
+        else:
+            anchor = is_dir and "/" in pat
+        if not runs or runs[-1].negative != rule.negative:
+            runs.append(_RuleRun(negative=rule.negative))
+        runs[-1].add(rule, pat, anchor=anchor)
+    for run in runs:
+        run.compile()
+    # The last matching rule wins, so runs are checked last-to-first.
+    return runs[::-1]
+
+
+class IgnoreMatcher:
+    """
+    A compiled form of a list of gitignore rules, equivalent to (but much faster than)
+    calling `gitignorant.check_path_match()` with the rules for each path.
+    """
+
+    def __init__(self, rules: Iterable[Rule]) -> None:
+        rules = list(rules)
+        self.file_runs = _compile_runs(rules, is_dir=False)
+        self.dir_runs = _compile_runs(rules, is_dir=True)
+        self._dir_cache: dict[str, bool] = {}
+
+    def _find_match(self, path: str, is_dir: bool) -> bool:
+        for run in self.dir_runs if is_dir else self.file_runs:
+            if run.matches(path, is_dir):
+                return not run.negative
+        return False
+
+    def is_ignored_dir(self, path: str) -> bool:
+        """
+        Check whether the directory `path` itself is ignored (not considering its parents).
+        Everything within an ignored directory is ignored, so walkers can skip descending into it.
+        """
+        return self._find_match(path, is_dir=True)
+
+    def is_ignored_file(self, path: str) -> bool:
+        """
+        Check whether the file `path` itself is ignored (not considering its parent directories).
+        """
+        return self._find_match(path, is_dir=False)
+
+    def check_path_match(self, path: str) -> bool:
+        """
+        Check whether the file `path` or any of its parent directories is ignored.
+        Results for directories are cached, so each directory is checked only once.
+        """
+        dirname = os.path.dirname(path)
+        if dirname and self._is_ignored_dir_or_parent(dirname):
+            return True
+        return self.is_ignored_file(path)
+
+    def _is_ignored_dir_or_parent(self, dirname: str) -> bool:
+        cached = self._dir_cache.get(dirname)
+        if cached is None:
+            parent = os.path.dirname(dirname)
+            cached = (bool(parent) and self._is_ignored_dir_or_parent(parent)) or self.is_ignored_dir(dirname)
+            self._dir_cache[dirname] = cached
+        return cached
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Protocol
+
+
+class WritableFileobj(Protocol):
+    def write(self, data: bytes, /) -> object: ...
+
+    def flush(self) -> object: ...
+
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DICTIONARY_SIZE = 32 * 1024  # The maximum DEFLATE window size
+
+
+def _compress_block(block: bytes, dictionary: bytes, compresslevel: int, is_last: bool) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # A sync flush ends the block on a byte boundary, so the raw DEFLATE
+    # outputs of consecutive blocks can just be concatenated.
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if is_last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter:
+    """
+    Write-only file-like object that gzip-compresses the data written into it into `fileobj`,
+    compressing fixed-size blocks concurrently in a thread pool, like pigz does.
+
+    The output is a single valid gzip member. Each block is primed with the last 32 KiB of the
+    preceding block, so the compression ratio stays close to that of a single-threaded compressor.
+    Given the same data, block size and compression level, the output is identical regardless of
+    the number of threads used.
+    """
+
+    def __init__(
+        self,
+        fileobj: WritableFileobj,
+        *,
+        filename: str = "",
+        mtime: int = 0,
+        compresslevel: int = 9,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_workers: int | None = None,
+    ) -> None:
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.pending: deque[Future[bytes]] = deque()
+        self.buffer = bytearray()
+        self.dictionary = b""
+        self.crc = zlib.crc32(b"")
+        self.size = 0
+        self.closed = False
+        self._write_header(filename, mtime)
+
+    def _write_header(self, filename: str, mtime: int) -> None:
+        # See RFC 1952; this is the same header `gzip.GzipFile` writes.
+        fname = os.path.basename(filename).encode("latin-1")
+        if fname.endswith(b".gz"):
+            fname = fname[:-3]
+        flags = 0x08 if fname else 0  # FNAME
+        xfl = b"\002" if self.compresslevel == 9 else (b"\004" if self.compresslevel == 1 else b"\000")
+        header = b"\037\213\010" + bytes((flags,)) + struct.pack("<L", mtime) + xfl + b"\377"
+        if fname:
+            header += fname + b"\000"
+        self.fileobj.write(header)
+
+    def write(self, data: bytes) -> int:
+        if self.closed:
+            raise ValueError("write() on closed ParallelGzipWriter")
+        view = memoryview(data).cast("B")
+        self.crc = zlib.crc32(view, self.crc)
+        self.size += len(view)
+        self.buffer += view
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[: self.block_size])
+            del self.buffer[: self.block_size]
+            self._submit(block, is_last=False)
+        return len(view)
+
+    def _submit(self, block: bytes, *, is_last: bool) -> None:
+        self.pending.append(
+            self.executor.submit(_compress_block, block, self.dictionary, self.compresslevel, is_last),
+        )
+        self.dictionary = block[-DICTIONARY_SIZE:]
+        # Keep a bounded number of blocks in flight to bound memory use.
+        while len(self.pending) > self.max_workers * 2:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def tell(self) -> int:
+        # Like `gzip.GzipFile`, report the position in the uncompressed stream.
+        return self.size
+
+    def flush(self) -> None:
+        self.fileobj.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self.buffer), is_last=True)
+            self.buffer.clear()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+            self.fileobj.write(struct.pack("<LL", self.crc & 0xFFFFFFFF, self.size & 0xFFFFFFFF))
+            self.fileobj.flush()
+        finally:
+            self.closed = True
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> ParallelGzipWriter:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
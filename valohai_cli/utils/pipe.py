@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import queue
+import threading
+from collections.abc import Iterator
+
+_EOF = object()
+
+
+class PipeAborted(Exception):
+    pass
+
+
+class ChunkPipe:
+    """
+    A bounded in-memory pipe between a writer (a file-like object, used in a producer thread)
+    and a reader (an iterator of chunks, used e.g. as a streaming request body).
+
+    At most `max_chunks` chunks of `chunk_size` bytes are buffered;
+    the writer blocks until the reader catches up, so memory use stays bounded.
+    """
+
+    def __init__(self, *, chunk_size: int = 1024 * 1024, max_chunks: int = 8) -> None:
+        self.chunk_size = chunk_size
+        self.queue: queue.Queue[object] = queue.Queue(maxsize=max_chunks)
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self.aborted = threading.Event()
+
+    def _put(self, item: object) -> None:
+        while True:
+            if self.aborted.is_set():
+                raise PipeAborted("The reading end of the pipe has gone away")
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    # Writing end
+
+    def write(self, data: bytes) -> int:
+        self.bytes_written += len(data)
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._put(bytes(self.buffer[: self.chunk_size]))
+            del self.buffer[: self.chunk_size]
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self, error: BaseException | None = None) -> None:
+        """
+        Close the writing end of the pipe. If `error` is set, it is raised on the reading end.
+        """
+        if self.buffer and not error:
+            self._put(bytes(self.buffer))
+        self.buffer.clear()
+        self._put(error or _EOF)
+
+    # Reading end
+
+    def abort(self) -> None:
+        """
+        Stop reading; any further writes will raise `PipeAborted`.
+        """
+        self.aborted.set()
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            item = self.queue.get()
+            if item is _EOF:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            assert isinstance(item, bytes)
+            yield item
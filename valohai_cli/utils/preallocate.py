@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import functools
+import os
+import sys
+from typing import Any
+
+# See linux/falloc.h
+FALLOC_FL_KEEP_SIZE = 1
+
+
+@functools.cache
+def _get_fallocate() -> Any | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fallocate = libc.fallocate
+    except (OSError, AttributeError):
+        return None
+    fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+    fallocate.restype = ctypes.c_int
+    return fallocate
+
+
+def preallocate(fd: int, offset: int, length: int) -> bool:
+    """
+    Reserve disk space for `length` bytes of the file `fd` from `offset` onwards, to reduce fragmentation
+    and to fail early if the disk is full.
+
+    Unlike `os.posix_fallocate`, this does not change the size of the file, so the size of a partially
+    written file still tells how much has been written.
+    This is only supported on Linux; elsewhere (or if the file system doesn't support it), this does nothing.
+
+    :return: Whether the space was reserved.
+    :raises OSError: if there is not enough disk space.
+    """
+    fallocate = _get_fallocate()
+    if not fallocate or length <= 0:
+        return False
+    if fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err == errno.ENOSPC:
+        raise OSError(err, os.strerror(err))
+    return False